@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mi_crm.settings')
 
+# Los eventos en tiempo real del tablero (SSE) mantienen conexiones abiertas,
+# así que solo se activan (EVENTOS_SSE_HABILITADO=True) cuando la aplicación, o
+# al menos la ruta de eventos, se sirve por ASGI, p. ej.:
+#   gunicorn mi_crm.asgi:application -k uvicorn.workers.UvicornWorker
+
 application = get_asgi_application()
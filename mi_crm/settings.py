@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'ventas.apps.VentasConfig',
     'storages',
 ]
@@ -113,6 +114,14 @@ else:
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
     DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 
+# Django 5.1 ya no lee DEFAULT_FILE_STORAGE; se traslada a STORAGES para que
+# FileField.save() (p. ej. las exportaciones) use el backend configurado. Los
+# estáticos conservan el almacenamiento por defecto de Django.
+STORAGES = {
+    'default': {'BACKEND': DEFAULT_FILE_STORAGE},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'
@@ -122,3 +131,108 @@ LOGOUT_REDIRECT_URL = 'login'
 CSRF_TRUSTED_ORIGINS = [
     'https://threer-transporte.onrender.com',
 ]
+
+# Paginación por cursor (ventas/paginacion.py)
+PAGINACION_TAMANO_MAXIMO = int(os.environ.get('PAGINACION_TAMANO_MAXIMO', 100))
+PAGINACION_CONTEO_EXACTO = os.environ.get('PAGINACION_CONTEO_EXACTO', 'True') == 'True'
+
+# Exportación a Excel: bytes que el archivo temporal mantiene en memoria antes de pasar a disco.
+EXPORTACION_MAX_MEMORIA = int(os.environ.get('EXPORTACION_MAX_MEMORIA', 5 * 1024 * 1024))
+# Segundos durante los que una exportación idéntica reutiliza el mismo trabajo.
+EXPORTACION_TTL_DEDUPLICACION = int(os.environ.get('EXPORTACION_TTL_DEDUPLICACION', 600))
+# Segundos tras los que un trabajo EN_PROCESO se da por abandonado y otro worker lo retoma.
+EXPORTACION_TIMEOUT_PROCESO = int(os.environ.get('EXPORTACION_TIMEOUT_PROCESO', 1800))
+# Días que se conservan los trabajos terminados y sus archivos antes de borrarlos.
+EXPORTACION_RETENCION_DIAS = int(os.environ.get('EXPORTACION_RETENCION_DIAS', 7))
+
+# Cliente S3 compartido (ventas/almacenamiento.py). Sin bucket se usa un sustituto
+# en disco bajo S3_LOCAL_RAIZ: con AWS_LOCATION='media' los objetos quedan en MEDIA_ROOT.
+S3_LOCAL = os.environ.get('S3_LOCAL', str(not AWS_STORAGE_BUCKET_NAME)) == 'True'
+S3_LOCAL_RAIZ = os.environ.get('S3_LOCAL_RAIZ', str(BASE_DIR))
+S3_MAX_CONEXIONES = int(os.environ.get('S3_MAX_CONEXIONES', 20))
+S3_REINTENTOS = int(os.environ.get('S3_REINTENTOS', 5))
+S3_TIMEOUT_CONEXION = int(os.environ.get('S3_TIMEOUT_CONEXION', 5))
+S3_TIMEOUT_LECTURA = int(os.environ.get('S3_TIMEOUT_LECTURA', 60))
+
+# Subida directa de adjuntos al almacenamiento (POST prefirmado).
+SUBIDA_DIRECTA_TAMANO_MAXIMO = int(os.environ.get('SUBIDA_DIRECTA_TAMANO_MAXIMO', 500 * 1024 * 1024))
+SUBIDA_DIRECTA_EXPIRACION = int(os.environ.get('SUBIDA_DIRECTA_EXPIRACION', 3600))
+
+# Subidas que pasan por el servidor: a partir del umbral se vuelcan a disco y se
+# suben a S3 con multipart, en partes de S3_MULTIPART_TAMANO_PARTE bytes y en paralelo.
+S3_MULTIPART_UMBRAL = int(os.environ.get('S3_MULTIPART_UMBRAL', 16 * 1024 * 1024))
+S3_MULTIPART_TAMANO_PARTE = int(os.environ.get('S3_MULTIPART_TAMANO_PARTE', 16 * 1024 * 1024))
+S3_MULTIPART_CONCURRENCIA = int(os.environ.get('S3_MULTIPART_CONCURRENCIA', 8))
+# Los manejadores de Django, pero calculando el SHA-256 de cada archivo mientras
+# se recibe: la deduplicación no tiene que volver a leerlo antes de subirlo.
+FILE_UPLOAD_HANDLERS = [
+    'ventas.almacenamiento.MemoriaConHashUploadHandler',
+    'ventas.almacenamiento.TemporalConHashUploadHandler',
+]
+
+# Borrado diferido de objetos (`procesar_borrados`): intentos antes de dejar una clave de lado.
+BORRADO_MAX_INTENTOS = int(os.environ.get('BORRADO_MAX_INTENTOS', 5))
+# Segundos de espera tras el primer fallo de un borrado; se duplica en cada reintento.
+BORRADO_ESPERA_BASE = int(os.environ.get('BORRADO_ESPERA_BASE', 60))
+# Segundos que un worker se reserva un lote mientras llama a delete_objects (sin
+# bloqueos en la BD). Debe superar esa llamada con todos sus reintentos.
+BORRADO_ARRENDAMIENTO = int(os.environ.get('BORRADO_ARRENDAMIENTO', 300))
+
+# URLs prefirmadas de descarga de adjuntos: vigencia y margen con el que se dejan de
+# servir desde la caché antes de expirar (segundos).
+DESCARGA_URL_EXPIRACION = int(os.environ.get('DESCARGA_URL_EXPIRACION', 300))
+DESCARGA_URL_MARGEN = int(os.environ.get('DESCARGA_URL_MARGEN', 30))
+
+# Miniaturas WebP de adjuntos (`generar_miniaturas`): caja máxima en píxeles, calidad,
+# procesos del pool y tamaño máximo del original a previsualizar (bytes).
+MINIATURAS_ANCHO = int(os.environ.get('MINIATURAS_ANCHO', 320))
+MINIATURAS_ALTO = int(os.environ.get('MINIATURAS_ALTO', 320))
+MINIATURAS_CALIDAD = int(os.environ.get('MINIATURAS_CALIDAD', 75))
+MINIATURAS_PROCESOS = int(os.environ.get('MINIATURAS_PROCESOS', os.cpu_count() or 2))
+MINIATURAS_TAMANO_MAXIMO = int(os.environ.get('MINIATURAS_TAMANO_MAXIMO', 50 * 1024 * 1024))
+# Segundos tras los que un adjunto EN_PROCESO se da por abandonado y otro worker lo retoma.
+MINIATURAS_TIMEOUT_PROCESO = int(os.environ.get('MINIATURAS_TIMEOUT_PROCESO', 600))
+
+# Calendario: máximo de días que puede abarcar una petición de eventos.
+CALENDARIO_RANGO_MAXIMO_DIAS = int(os.environ.get('CALENDARIO_RANGO_MAXIMO_DIAS', 366))
+
+# Segundos que se conserva en caché un JSON versionado (ventas/versiones.py). Al cambiar
+# la versión la entrada deja de usarse, así que el TTL solo limita la memoria ocupada.
+CACHE_PAYLOAD_TTL = int(os.environ.get('CACHE_PAYLOAD_TTL', 3600))
+
+# Feed ICS de suscripción: días hacia atrás y hacia adelante que incluye (ventana acotada).
+ICS_DIAS_ATRAS = int(os.environ.get('ICS_DIAS_ATRAS', 90))
+ICS_DIAS_ADELANTE = int(os.environ.get('ICS_DIAS_ADELANTE', 365))
+
+# Kanban: el worker `rebalancear_kanban` reescribe los rangos de una columna (o de las
+# columnas de un proyecto) cuando alguno supera esta longitud (ventas/rangos.py).
+KANBAN_RANGO_LONGITUD_REBALANCEO = int(os.environ.get('KANBAN_RANGO_LONGITUD_REBALANCEO', 12))
+
+# Máximo de operaciones por petición al endpoint de lote del tablero Kanban.
+KANBAN_LOTE_MAXIMO_OPERACIONES = int(os.environ.get('KANBAN_LOTE_MAXIMO_OPERACIONES', 500))
+
+# Eventos en tiempo real del tablero (ventas/eventos.py). BackendMemoria solo entrega los
+# cambios a quienes estén conectados al mismo proceso: con más de un worker, los espectadores de
+# los demás no los reciben, así que en ese caso usar 'ventas.eventos.BackendPostgres' (LISTEN/NOTIFY).
+EVENTOS_BACKEND = os.environ.get('EVENTOS_BACKEND', 'ventas.eventos.BackendMemoria')
+# Mensajes pendientes por cliente antes de pedirle que recargue el tablero.
+EVENTOS_COLA_MAXIMA = int(os.environ.get('EVENTOS_COLA_MAXIMA', 100))
+# Segundos sin eventos tras los que se envía un comentario keep-alive por SSE.
+EVENTOS_KEEPALIVE = float(os.environ.get('EVENTOS_KEEPALIVE', 15))
+# Milisegundos que espera el navegador antes de reconectar el EventSource.
+EVENTOS_REINTENTO_MS = int(os.environ.get('EVENTOS_REINTENTO_MS', 3000))
+# Activar solo si la ruta de eventos del tablero la sirve un proceso ASGI (mi_crm/asgi.py); bajo WSGI
+# cada pestaña abierta retendría un worker. Sin SSE el tablero consulta los cambios
+# cada EVENTOS_SONDEO_MS milisegundos.
+EVENTOS_SSE_HABILITADO = os.environ.get('EVENTOS_SSE_HABILITADO', 'False') == 'True'
+EVENTOS_SONDEO_MS = int(os.environ.get('EVENTOS_SONDEO_MS', 15000))
+
+# Registro de cambios del tablero Kanban (ventas/kanban.py): cada cuántas versiones se guarda
+# una instantánea del tablero, y cuántas versiones de cambios se conservan detrás de ella.
+KANBAN_CAMBIOS_COMPACTAR_CADA = int(os.environ.get('KANBAN_CAMBIOS_COMPACTAR_CADA', 200))
+KANBAN_CAMBIOS_CONSERVAR = int(os.environ.get('KANBAN_CAMBIOS_CONSERVAR', 200))
+
+# Compresión de los diagramas (ventas/compresion.py): 'zlib' o 'zstd' (requiere `zstandard`)
+# y su nivel. Las filas existentes se convierten con `python manage.py recomprimir_diagramas`.
+COMPRESION_ALGORITMO = os.environ.get('COMPRESION_ALGORITMO', 'zlib')
+COMPRESION_NIVEL = int(os.environ.get('COMPRESION_NIVEL', 6))
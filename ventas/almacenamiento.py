@@ -0,0 +1,531 @@
+# ventas/almacenamiento.py
+
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils._os import safe_join
+
+
+# ==============================================================================
+# CLIENTE S3 COMPARTIDO
+# ==============================================================================
+# Crear un cliente de boto3 vuelve a cargar el modelo de servicio de botocore,
+# arma un pool de conexiones nuevo y repite el handshake TLS. Aquí se crea una
+# sola vez por proceso (de forma perezosa) y se reutiliza en todas las
+# peticiones: los clientes de boto3 son seguros entre hilos una vez creados.
+
+_cliente = None
+_candado = threading.Lock()
+
+
+def usa_s3_local():
+    """Sin bucket configurado (desarrollo, pruebas) se usa el sustituto en disco."""
+    return settings.S3_LOCAL
+
+
+def clave_s3(nombre):
+    """Clave completa del objeto: el nombre guardado en el FileField + AWS_LOCATION."""
+    return f"{settings.AWS_LOCATION}/{nombre}" if settings.AWS_LOCATION else nombre
+
+
+def nombre_miniatura(nombre_archivo):
+    """La miniatura WebP se guarda junto al original."""
+    return f"{nombre_archivo}.miniatura.webp"
+
+
+def obtener_cliente_s3():
+    global _cliente
+    if _cliente is None:
+        with _candado:
+            if _cliente is None:
+                _cliente = _crear_cliente_local() if usa_s3_local() else _crear_cliente_boto3()
+    return _cliente
+
+
+def post_prefirmado(clave, tamano_maximo, expira):
+    """
+    Datos para que el navegador suba `clave` directamente al almacenamiento:
+    {'url': ..., 'fields': {...}}. El archivo va en el campo 'file', al final.
+    """
+    return obtener_cliente_s3().generate_presigned_post(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=clave,
+        Conditions=[['content-length-range', 1, tamano_maximo]],
+        ExpiresIn=expira,
+    )
+
+
+def existe_objeto(clave):
+    """Tamaño en bytes del objeto, o None si no existe."""
+    try:
+        respuesta = obtener_cliente_s3().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=clave)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return respuesta['ContentLength']
+
+
+# ==============================================================================
+# URLs DE DESCARGA PREFIRMADAS
+# ==============================================================================
+# Firmar una URL es barato pero no gratis (HMAC por enlace): se cachean por
+# clave durante un poco menos que su vigencia, para que nunca se entregue una
+# URL a punto de expirar.
+
+def url_descarga(nombre, nombre_descarga=None):
+    """URL temporal para descargar el objeto del FileField `nombre`."""
+    if usa_s3_local():
+        return default_storage.url(nombre)
+
+    clave = clave_s3(nombre)
+    clave_cache = 'ventas:url_descarga:' + hashlib.sha256(f"{clave}|{nombre_descarga}".encode()).hexdigest()
+    url = cache.get(clave_cache)
+    if url is None:
+        parametros = {'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': clave}
+        if nombre_descarga:
+            # El objeto puede no tener extensión (contenido deduplicado): el
+            # nombre y el tipo se toman del adjunto.
+            nombre_seguro = nombre_descarga.replace('"', '')
+            parametros['ResponseContentDisposition'] = f'inline; filename="{nombre_seguro}"'
+            tipo, _ = mimetypes.guess_type(nombre_descarga)
+            if tipo:
+                parametros['ResponseContentType'] = tipo
+        expira = settings.DESCARGA_URL_EXPIRACION
+        url = obtener_cliente_s3().generate_presigned_url('get_object', Params=parametros, ExpiresIn=expira)
+        cache.set(clave_cache, url, max(expira - settings.DESCARGA_URL_MARGEN, 1))
+    return url
+
+
+# ==============================================================================
+# TRANSFERENCIA DE ARCHIVOS QUE PASAN POR EL SERVIDOR
+# ==============================================================================
+# La clave de un contenido es su SHA-256 y, si ya está almacenado, no se sube:
+# el hash tiene que estar completo antes de empezar la subida, así que no se
+# puede calcular dentro de ella. Para no leer dos veces cada archivo, los
+# manejadores de subida de abajo lo calculan mientras Django recibe los bytes
+# de la petición; solo los archivos que no llegan por ahí se recorren antes de
+# subirlos. Se suben con multipart en paralelo a partir de S3_MULTIPART_UMBRAL.
+
+TAMANO_BLOQUE_LECTURA = 1024 * 1024
+
+
+class ResultadoTransferencia:
+    def __init__(self, tamano, hash_sha256, segundos, reutilizado=False):
+        self.tamano = tamano
+        self.hash_sha256 = hash_sha256
+        # Duración de la subida al almacenamiento (None si no se subió nada).
+        self.segundos = segundos
+        # True si el contenido ya estaba almacenado y no se subió nada.
+        self.reutilizado = reutilizado
+
+
+def configuracion_transferencia():
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=settings.S3_MULTIPART_UMBRAL,
+        multipart_chunksize=settings.S3_MULTIPART_TAMANO_PARTE,
+        # Cada hilo usa una conexión: no tiene sentido superar el pool del cliente.
+        max_concurrency=min(settings.S3_MULTIPART_CONCURRENCIA, settings.S3_MAX_CONEXIONES),
+        use_threads=True,
+    )
+
+
+class _HashMixin:
+    """
+    Calcula el SHA-256 de los bloques que el manejador se queda y lo deja en
+    `archivo.sha256`. Los bloques que deja pasar (el de memoria con archivos
+    grandes) los cuenta el siguiente manejador.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Antes de super(): el manejador de memoria corta la cadena con una excepción.
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        restante = super().receive_data_chunk(raw_data, start)
+        if restante is None:
+            self.sha256.update(raw_data)
+        return restante
+
+    def file_complete(self, file_size):
+        archivo = super().file_complete(file_size)
+        if archivo is not None:
+            archivo.sha256 = self.sha256.hexdigest()
+        return archivo
+
+
+class MemoriaConHashUploadHandler(_HashMixin, MemoryFileUploadHandler):
+    pass
+
+
+class TemporalConHashUploadHandler(_HashMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def _volcar_con_hash(archivo, destino):
+    """Copia `archivo` a `destino` por bloques calculando el hash; devuelve (tamano, sha256)."""
+    sha256 = hashlib.sha256()
+    tamano = 0
+    if hasattr(archivo, 'chunks'):
+        bloques = archivo.chunks(TAMANO_BLOQUE_LECTURA)
+    else:
+        bloques = iter(lambda: archivo.read(TAMANO_BLOQUE_LECTURA), b'')
+    for bloque in bloques:
+        sha256.update(bloque)
+        tamano += len(bloque)
+        if destino is not None:
+            destino.write(bloque)
+    return tamano, sha256.hexdigest()
+
+
+@contextmanager
+def _archivo_con_hash(archivo):
+    """
+    Entrega (archivo listo para leer desde el inicio, tamaño, sha256). Si el
+    hash llegó con la subida no se vuelve a leer; si Django ya lo dejó en disco
+    se usa tal cual; si no, se vuelca a un temporal que pasa de RAM a disco al
+    superar S3_MULTIPART_UMBRAL.
+    """
+    sha256 = getattr(archivo, 'sha256', None)
+    if sha256:
+        archivo.seek(0)
+        yield archivo, archivo.size, sha256
+    elif hasattr(archivo, 'temporary_file_path'):
+        tamano, sha256 = _volcar_con_hash(archivo, None)
+        archivo.seek(0)
+        yield archivo, tamano, sha256
+    else:
+        with tempfile.SpooledTemporaryFile(max_size=settings.S3_MULTIPART_UMBRAL) as temporal:
+            tamano, sha256 = _volcar_con_hash(archivo, temporal)
+            temporal.seek(0)
+            yield temporal, tamano, sha256
+
+
+def _subir(archivo, clave, content_type=None):
+    obtener_cliente_s3().upload_fileobj(
+        archivo,
+        settings.AWS_STORAGE_BUCKET_NAME,
+        clave,
+        ExtraArgs={'ContentType': content_type} if content_type else None,
+        Config=configuracion_transferencia(),
+    )
+
+
+# ==============================================================================
+# ALMACENAMIENTO POR CONTENIDO (DEDUPLICACIÓN)
+# ==============================================================================
+# Cada contenido distinto se guarda una sola vez bajo su SHA-256 y se cuentan
+# sus referencias; subir un archivo que ya existe (LISTO) solo suma una
+# referencia. Solo aplica a los archivos que pasan por el servidor: la subida
+# directa del navegador (POST prefirmado) no se deduplica.
+
+def ruta_contenido(sha256):
+    return f"contenido/{sha256[:2]}/{sha256}"
+
+
+def almacenar_contenido(archivo, content_type=None):
+    """
+    Guarda `archivo` deduplicado por contenido y devuelve
+    (ContenidoArchivo, ResultadoTransferencia).
+    """
+    from .models import ContenidoArchivo
+
+    with _archivo_con_hash(archivo) as (legible, tamano, sha256):
+        ruta = ruta_contenido(sha256)
+        with transaction.atomic():
+            # Si el objeto (o su miniatura) quedó encolado para borrarse, se rescata.
+            en_curso = rescatar_borrados(ruta)
+            contenido, creado = ContenidoArchivo.objects.select_for_update().get_or_create(
+                hash_sha256=sha256, defaults={'ruta': ruta, 'tamano': tamano, 'referencias': 1}
+            )
+            if not creado:
+                ContenidoArchivo.objects.filter(pk=contenido.pk).update(referencias=F('referencias') + 1)
+        # Subir mientras un worker borra la misma clave podría perder el objeto.
+        esperar_borrados_en_curso(en_curso)
+
+        if contenido.estado == ContenidoArchivo.Estado.LISTO:
+            return contenido, ResultadoTransferencia(tamano, sha256, None, reutilizado=True)
+        # Un contenido PENDIENTE puede estar subiéndolo otra petición (o haber
+        # fallado): se sube igualmente, el objeto es el mismo byte a byte. La
+        # referencia ya sumada impide que un fallo ajeno lo borre mientras tanto.
+        # Se cronometra solo la transferencia, no el hash ni la transacción.
+        inicio = time.monotonic()
+        try:
+            _subir(legible, clave_s3(ruta), content_type)
+        except Exception:
+            liberar_contenido(contenido.pk)
+            raise
+        segundos = time.monotonic() - inicio
+        ContenidoArchivo.objects.filter(pk=contenido.pk).update(estado=ContenidoArchivo.Estado.LISTO)
+        contenido.estado = ContenidoArchivo.Estado.LISTO
+    return contenido, ResultadoTransferencia(tamano, sha256, segundos)
+
+
+def liberar_contenido(contenido_id):
+    """
+    Resta una referencia; con la última se borra el registro, se encola el
+    objeto y se devuelve True.
+    """
+    from .models import ContenidoArchivo
+
+    with transaction.atomic():
+        contenido = ContenidoArchivo.objects.select_for_update().filter(pk=contenido_id).first()
+        if contenido is None:
+            return False
+        if contenido.referencias > 1:
+            ContenidoArchivo.objects.filter(pk=contenido.pk).update(referencias=F('referencias') - 1)
+            return False
+        contenido.delete()
+        encolar_borrado(contenido.ruta)
+        return True
+
+
+# ==============================================================================
+# BORRADO DIFERIDO Y POR LOTES
+# ==============================================================================
+# Las vistas y las cascadas solo encolan claves en BorradoPendiente; el worker
+# las elimina con delete_objects, hasta 1000 claves por llamada (límite de S3).
+# Ninguna transacción queda abierta durante esa llamada: el worker reclama el
+# lote adelantando `reclamado_hasta` (un arrendamiento de
+# BORRADO_ARRENDAMIENTO segundos), llama a S3 sin bloqueos y anota el
+# resultado en una segunda transacción corta.
+
+TAMANO_LOTE_BORRADO = 1000
+# Cada cuánto se comprueba si terminó un borrado en curso (segundos).
+ESPERA_BORRADO_EN_CURSO = 0.2
+
+
+def encolar_borrado(nombre):
+    """Encola el objeto de un FileField (nombre relativo, sin AWS_LOCATION)."""
+    from .models import BorradoPendiente
+
+    if nombre:
+        BorradoPendiente.objects.create(clave=clave_s3(nombre))
+
+
+def rescatar_borrados(nombre):
+    """
+    Quita de la cola el objeto `nombre` y su miniatura, porque se van a volver
+    a usar. Las claves que un worker está borrando en ese momento no se pueden
+    quitar: se marcan como rescatadas (el worker no las reintentará) y se
+    devuelven sus IDs, que hay que pasar a esperar_borrados_en_curso() antes
+    de volver a escribir el objeto.
+    """
+    from .models import BorradoPendiente
+
+    claves = [clave_s3(nombre), clave_s3(nombre_miniatura(nombre))]
+    ahora = timezone.now()
+    en_curso = []
+    rescatados = []
+    for pendiente in BorradoPendiente.objects.select_for_update().filter(clave__in=claves):
+        if pendiente.reclamado_hasta and pendiente.reclamado_hasta > ahora:
+            en_curso.append(pendiente.pk)
+        else:
+            rescatados.append(pendiente.pk)
+    if rescatados:
+        BorradoPendiente.objects.filter(pk__in=rescatados).delete()
+    if en_curso:
+        BorradoPendiente.objects.filter(pk__in=en_curso).update(rescatado=True)
+    return en_curso
+
+
+def esperar_borrados_en_curso(ids):
+    """
+    Espera a que el worker termine los borrados `ids` (ver rescatar_borrados).
+    Si su arrendamiento vence antes, el worker murió: se quitan de la cola.
+    """
+    from .models import BorradoPendiente
+
+    pendientes = BorradoPendiente.objects.filter(pk__in=ids)
+    while ids and pendientes.filter(reclamado_hasta__gt=timezone.now()).exists():
+        time.sleep(ESPERA_BORRADO_EN_CURSO)
+    if ids:
+        pendientes.delete()
+
+
+def _reclamar_borrados(tamano_lote):
+    from .models import BorradoPendiente
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        pendientes = list(
+            BorradoPendiente.objects.select_for_update(skip_locked=True)
+            .filter(intentos__lt=settings.BORRADO_MAX_INTENTOS, proximo_intento__lte=ahora, rescatado=False)
+            .filter(Q(reclamado_hasta__isnull=True) | Q(reclamado_hasta__lte=ahora))
+            .order_by('id')[:tamano_lote]
+        )
+        BorradoPendiente.objects.filter(pk__in=[p.pk for p in pendientes]).update(
+            reclamado_hasta=ahora + timedelta(seconds=settings.BORRADO_ARRENDAMIENTO)
+        )
+    return pendientes
+
+
+def procesar_borrados_pendientes(tamano_lote=TAMANO_LOTE_BORRADO):
+    """
+    Borra un lote de objetos pendientes y devuelve (borrados, fallidos).
+    El arrendamiento (y SKIP LOCKED al reclamar) permite correr varios
+    workers a la vez sin repetir claves. Una clave que falla se reintenta con
+    espera exponencial (BORRADO_ESPERA_BASE, 2x, 4x...), para que un corte
+    breve del almacenamiento no agote BORRADO_MAX_INTENTOS en segundos.
+    """
+    from .models import BorradoPendiente
+
+    pendientes = _reclamar_borrados(min(tamano_lote, TAMANO_LOTE_BORRADO))
+    if not pendientes:
+        return 0, 0
+
+    claves = sorted({p.clave for p in pendientes})
+    try:
+        respuesta = obtener_cliente_s3().delete_objects(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Delete={'Objects': [{'Key': clave} for clave in claves], 'Quiet': True},
+        )
+        errores = {e['Key']: f"{e.get('Code')}: {e.get('Message')}" for e in respuesta.get('Errors', [])}
+    except Exception as e:
+        errores = {clave: str(e) for clave in claves}
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        # Se vuelven a leer: las rescatadas mientras tanto se quitan aunque hayan fallado.
+        actuales = list(BorradoPendiente.objects.select_for_update().filter(pk__in=[p.pk for p in pendientes]))
+        fallidos = [p for p in actuales if p.clave in errores and not p.rescatado]
+        for pendiente in fallidos:
+            pendiente.intentos += 1
+            pendiente.ultimo_error = errores[pendiente.clave]
+            pendiente.proximo_intento = ahora + timedelta(
+                seconds=settings.BORRADO_ESPERA_BASE * 2 ** (pendiente.intentos - 1)
+            )
+            pendiente.reclamado_hasta = None
+        BorradoPendiente.objects.bulk_update(
+            fallidos, ['intentos', 'ultimo_error', 'proximo_intento', 'reclamado_hasta']
+        )
+        BorradoPendiente.objects.filter(pk__in=[p.pk for p in actuales if p not in fallidos]).delete()
+    return len(claves) - len(errores), len(errores)
+
+
+def _crear_cliente_boto3():
+    import boto3
+    from botocore.config import Config
+
+    # Sesión propia: la sesión por defecto de boto3 no es segura entre hilos.
+    sesion = boto3.session.Session(
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+    )
+    config = Config(
+        max_pool_connections=settings.S3_MAX_CONEXIONES,
+        retries={'max_attempts': settings.S3_REINTENTOS, 'mode': 'standard'},
+        connect_timeout=settings.S3_TIMEOUT_CONEXION,
+        read_timeout=settings.S3_TIMEOUT_LECTURA,
+        signature_version=settings.AWS_S3_SIGNATURE_VERSION,
+        s3={'addressing_style': settings.AWS_S3_ADDRESSING_STYLE},
+    )
+    return sesion.client('s3', config=config)
+
+
+def _crear_cliente_local():
+    return ClienteS3Local(settings.S3_LOCAL_RAIZ)
+
+
+SUBIDA_LOCAL_SALT = 'ventas.almacenamiento.subida_local'
+
+
+class ClienteS3Local:
+    """
+    Sustituto en disco del cliente S3 con las operaciones que usa la app.
+    Las claves se guardan bajo `raiz` (el bucket se ignora); con la raíz por
+    defecto y AWS_LOCATION='media' los archivos quedan en MEDIA_ROOT y se
+    sirven como cualquier otro archivo subido.
+    """
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+
+    def _ruta(self, clave):
+        return safe_join(self.raiz, clave)
+
+    @staticmethod
+    def _no_encontrado(operacion, clave):
+        return ClientError(
+            {'Error': {'Code': '404', 'Message': f'Not Found: {clave}'}}, operacion
+        )
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        ruta = self._ruta(Key)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{threading.get_ident()}.parcial"
+        with open(temporal, 'wb') as destino:
+            while True:
+                bloque = Fileobj.read(1024 * 1024)
+                if not bloque:
+                    break
+                destino.write(bloque)
+                if Callback:
+                    Callback(len(bloque))
+        os.replace(temporal, ruta)
+
+    def head_object(self, Bucket, Key):
+        try:
+            stat = os.stat(self._ruta(Key))
+        except FileNotFoundError:
+            raise self._no_encontrado('HeadObject', Key)
+        return {'ContentLength': stat.st_size}
+
+    def delete_object(self, Bucket, Key):
+        # Igual que S3: borrar una clave inexistente no es un error.
+        try:
+            os.remove(self._ruta(Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        for objeto in Delete['Objects']:
+            self.delete_object(Bucket=Bucket, Key=objeto['Key'])
+        return {} if Delete.get('Quiet') else {'Deleted': Delete['Objects']}
+
+    def download_fileobj(self, Bucket, Key, Fileobj, ExtraArgs=None, Callback=None, Config=None):
+        try:
+            with open(self._ruta(Key), 'rb') as origen:
+                shutil.copyfileobj(origen, Fileobj)
+        except FileNotFoundError:
+            raise self._no_encontrado('GetObject', Key)
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        # Equivalente local: la "política" es un token firmado que la vista
+        # `subida_local` verifica antes de escribir el archivo.
+        tamano_maximo = None
+        for condicion in Conditions or []:
+            if isinstance(condicion, (list, tuple)) and condicion[0] == 'content-length-range':
+                tamano_maximo = condicion[2]
+        politica = signing.dumps({'key': Key, 'max': tamano_maximo, 'exp': ExpiresIn}, salt=SUBIDA_LOCAL_SALT)
+        return {'url': reverse('subida-local'), 'fields': {**(Fields or {}), 'key': Key, 'policy': politica}}
+
+    def verificar_politica(self, politica, clave):
+        """Devuelve el tamaño máximo permitido o lanza signing.BadSignature."""
+        datos = signing.loads(politica, salt=SUBIDA_LOCAL_SALT)
+        signing.loads(politica, salt=SUBIDA_LOCAL_SALT, max_age=datos['exp'])
+        if datos['key'] != clave:
+            raise signing.BadSignature('La clave no coincide con la política.')
+        return datos['max']
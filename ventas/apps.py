@@ -5,5 +5,6 @@ class VentasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ventas'
 
-# No es necesario tener el método ready() aquí.
-# También puedes eliminar la clase MyAppConfig si no la estás usando.
\ No newline at end of file
+    def ready(self):
+        # Registra los receptores de señales (contadores desnormalizados, etc.).
+        from . import signals  # noqa: F401
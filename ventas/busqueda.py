@@ -0,0 +1,88 @@
+# ventas/busqueda.py
+
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import F, Func, IntegerField, Q, TextField, Value
+from django.db.models.functions import Cast, Greatest, Round
+
+
+# ==============================================================================
+# BÚSQUEDA DE PROSPECTOS
+# ==============================================================================
+# En PostgreSQL se usa la columna `Prospecto.busqueda` (tsvector mantenido por
+# un trigger, ver migración 0005) más índices GIN de trigramas sobre nombre,
+# email y empresa sin acentos (ventas_sin_acentos(), ver migración 0021). El
+# resultado se anota con `rango` para ordenar por relevancia. En otros motores
+# (SQLite en pruebas) se recurre a `icontains`, que no ignora los acentos.
+
+CAMPOS_BUSQUEDA = ('nombre_completo', 'email', 'empresa')
+
+# El rango se expresa como entero (relevancia x ESCALA_RANGO). Así la
+# paginación por cursor compara valores exactos: un float4 que pasa por JSON
+# y vuelve como float de Python no siempre es igual al de la base de datos, y
+# las filas con ese rango se saltaban o se repetían entre páginas.
+ESCALA_RANGO = 1_000_000
+
+
+def quitar_acentos(texto):
+    """'José Núñez' -> 'Jose Nunez'. El índice aplica unaccent() del lado de la BD."""
+    normalizado = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in normalizado if not unicodedata.combining(c))
+
+
+class SinAcentos(Func):
+    """
+    ventas_sin_acentos(col): envoltorio IMMUTABLE de unaccent() creado en la
+    migración 0021. Debe coincidir con la expresión de los índices de trigramas.
+    """
+    function = 'ventas_sin_acentos'
+    output_field = TextField()
+
+
+def _consulta_prefijos(texto):
+    """Construye un tsquery 'juan:* & perez:*' para que funcione mientras se escribe."""
+    palabras = re.findall(r'\w+', quitar_acentos(texto).lower())
+    return ' & '.join(f"{palabra}:*" for palabra in palabras)
+
+
+def usa_busqueda_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def buscar_prospectos(queryset, texto):
+    """
+    Filtra `queryset` por `texto` y lo anota con `rango`, un entero (mayor =
+    más relevante). Las vistas ordenan por ('-rango', '-id') cuando hay búsqueda.
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return queryset.annotate(rango=Value(0, output_field=IntegerField()))
+
+    if not usa_busqueda_postgres():
+        filtro = Q()
+        for campo in CAMPOS_BUSQUEDA:
+            filtro |= Q(**{f'{campo}__icontains': texto})
+        return queryset.filter(filtro).annotate(rango=Value(0, output_field=IntegerField()))
+
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+
+    sin_acentos = quitar_acentos(texto)
+    queryset = queryset.alias(**{f'{campo}_sin_acentos': SinAcentos(campo) for campo in CAMPOS_BUSQUEDA})
+    filtro = Q()
+    for campo in CAMPOS_BUSQUEDA:
+        filtro |= Q(**{f'{campo}_sin_acentos__trigram_word_similar': sin_acentos})
+
+    prefijos = _consulta_prefijos(texto)
+    rango_trigramas = Greatest(*[
+        TrigramWordSimilarity(sin_acentos, f'{campo}_sin_acentos') for campo in CAMPOS_BUSQUEDA
+    ])
+    if prefijos:
+        consulta = SearchQuery(prefijos, config='simple', search_type='raw')
+        filtro |= Q(busqueda=consulta)
+        rango = SearchRank(F('busqueda'), consulta) + rango_trigramas
+    else:
+        rango = rango_trigramas
+
+    return queryset.filter(filtro).annotate(rango=Cast(Round(rango * ESCALA_RANGO), IntegerField()))
@@ -0,0 +1,113 @@
+# ventas/calendario_ics.py
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import Entregable, Recordatorio
+
+
+# ==============================================================================
+# FEED iCALENDAR (RFC 5545)
+# ==============================================================================
+# El feed se genera línea a línea: los recordatorios y entregables se recorren
+# con iterator(), que en PostgreSQL usa un cursor del lado del servidor, y
+# cada evento se envía en cuanto se arma. La memoria no depende del número de
+# filas dentro de la ventana.
+
+TAMANO_LOTE = 500
+DOMINIO_UID = '3r-transporte'
+DURACION_RECORDATORIO = 'PT30M'
+
+
+def _escapar(texto):
+    return (
+        str(texto or '')
+        .replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+    )
+
+
+def _linea(contenido):
+    """Línea terminada en CRLF y plegada a 75 octetos, sin cortar caracteres UTF-8."""
+    datos = contenido.encode('utf-8')
+    if len(datos) <= 75:
+        return datos + b'\r\n'
+    partes = []
+    actual = b''
+    limite = 75
+    for caracter in contenido:
+        codificado = caracter.encode('utf-8')
+        if len(actual) + len(codificado) > limite:
+            partes.append(actual)
+            actual = b''
+            limite = 74  # Las continuaciones empiezan con un espacio.
+        actual += codificado
+    partes.append(actual)
+    return b'\r\n '.join(partes) + b'\r\n'
+
+
+def _fecha_hora_utc(valor):
+    return valor.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _evento(uid, sello, propiedades):
+    yield _linea('BEGIN:VEVENT')
+    yield _linea(f'UID:{uid}@{DOMINIO_UID}')
+    yield _linea(f'DTSTAMP:{sello}')
+    for propiedad in propiedades:
+        yield _linea(propiedad)
+    yield _linea('END:VEVENT')
+
+
+def generar_ics(usuario, inicio, fin, url_prospecto, url_proyecto):
+    """
+    Genera (como bytes) el calendario de `usuario` entre las fechas `inicio`
+    y `fin`. `url_prospecto(pk)` y `url_proyecto(pk)` construyen los enlaces.
+    """
+    sello = _fecha_hora_utc(timezone.now())
+    yield _linea('BEGIN:VCALENDAR')
+    yield _linea('VERSION:2.0')
+    yield _linea('PRODID:-//3R Transporte//CRM//ES')
+    yield _linea('CALSCALE:GREGORIAN')
+    yield _linea('METHOD:PUBLISH')
+    yield _linea(f'X-WR-CALNAME:{_escapar(f"CRM 3R - {usuario.get_username()}")}')
+
+    zona = timezone.get_current_timezone()
+    desde = timezone.make_aware(datetime.combine(inicio, datetime.min.time()), zona)
+    hasta = timezone.make_aware(datetime.combine(fin, datetime.min.time()), zona)
+
+    recordatorios = Recordatorio.objects.filter(fecha_recordatorio__gte=desde, fecha_recordatorio__lt=hasta)
+    entregables = Entregable.objects.filter(fecha_entrega__gte=inicio, fecha_entrega__lt=fin)
+    if not usuario.is_superuser:
+        recordatorios = recordatorios.filter(prospecto__asignado_a=usuario)
+        entregables = entregables.filter(proyecto__prospecto__asignado_a=usuario)
+
+    filas = recordatorios.order_by().values_list(
+        'pk', 'titulo', 'fecha_recordatorio', 'completado', 'prospecto_id', 'prospecto__nombre_completo'
+    )
+    for pk, titulo, fecha, completado, prospecto_id, nombre_prospecto in filas.iterator(chunk_size=TAMANO_LOTE):
+        resumen = f"{'✔ ' if completado else ''}{titulo} ({nombre_prospecto})"
+        yield from _evento(f'recordatorio-{pk}', sello, [
+            f'DTSTART:{_fecha_hora_utc(fecha)}',
+            f'DURATION:{DURACION_RECORDATORIO}',
+            f'SUMMARY:{_escapar(resumen)}',
+            f'DESCRIPTION:{_escapar(f"Prospecto: {nombre_prospecto}")}',
+            f'URL:{url_prospecto(prospecto_id)}',
+        ])
+
+    filas = entregables.order_by().values_list(
+        'pk', 'nombre', 'descripcion', 'fecha_entrega', 'estado', 'proyecto_id', 'proyecto__nombre_proyecto'
+    )
+    for pk, nombre, descripcion, fecha, estado, proyecto_id, nombre_proyecto in filas.iterator(chunk_size=TAMANO_LOTE):
+        completado = estado == Entregable.Estado.COMPLETADO
+        resumen = f"{'✔ ' if completado else ''}Entrega: {nombre}" + (f" ({nombre_proyecto})" if nombre_proyecto else '')
+        yield from _evento(f'entregable-{pk}', sello, [
+            f'DTSTART;VALUE=DATE:{fecha.strftime("%Y%m%d")}',
+            f'DTEND;VALUE=DATE:{(fecha + timedelta(days=1)).strftime("%Y%m%d")}',
+            f'SUMMARY:{_escapar(resumen)}',
+            f'DESCRIPTION:{_escapar(descripcion)}',
+            f'URL:{url_proyecto(proyecto_id)}',
+        ])
+
+    yield _linea('END:VCALENDAR')
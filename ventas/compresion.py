@@ -0,0 +1,90 @@
+# ventas/compresion.py
+
+import base64
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+
+# ==============================================================================
+# TEXTO COMPRIMIDO EN LA BASE DE DATOS
+# ==============================================================================
+# TextoComprimidoField guarda el texto comprimido dentro de la misma columna
+# de texto, con un marcador de formato delante:
+#
+#     "~zlib:" + base64(zlib(texto))      "~zstd:" + base64(zstd(texto))
+#
+# Al leer, un valor sin marcador se devuelve tal cual, así que las filas
+# guardadas antes de usar el campo siguen funcionando sin migrar los datos
+# (el comando `recomprimir_diagramas` las convierte por lotes). El JSON y el
+# SVG de los diagramas suelen comprimirse 8-15 veces; aun con el 33 % que
+# añade base64, la fila ocupa mucho menos en TOAST y viaja menos por la red.
+#
+# El algoritmo de escritura se elige con COMPRESION_ALGORITMO: 'zlib' no
+# tiene dependencias; 'zstd' requiere el paquete `zstandard` (y también para
+# leer las filas guardadas con él).
+
+PREFIJOS = {'zlib': '~zlib:', 'zstd': '~zstd:'}
+
+# Por debajo de este tamaño la compresión no compensa: el texto se guarda tal cual.
+TAMANO_MINIMO = 256
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("La compresión 'zstd' requiere el paquete zstandard (pip install zstandard).")
+    return zstandard
+
+
+def comprimir(texto, algoritmo=None):
+    """Texto con marcador listo para guardar en la columna."""
+    algoritmo = algoritmo or settings.COMPRESION_ALGORITMO
+    datos = texto.encode('utf-8')
+    if len(datos) < TAMANO_MINIMO and not es_comprimido(texto):
+        return texto
+    if algoritmo == 'zstd':
+        comprimidos = _zstandard().ZstdCompressor(level=settings.COMPRESION_NIVEL).compress(datos)
+    elif algoritmo == 'zlib':
+        comprimidos = zlib.compress(datos, settings.COMPRESION_NIVEL)
+    else:
+        raise ValueError(f"Algoritmo de compresión desconocido: '{algoritmo}'.")
+    return PREFIJOS[algoritmo] + base64.b64encode(comprimidos).decode('ascii')
+
+
+def descomprimir(valor):
+    """Texto original de un valor leído de la columna (comprimido o no)."""
+    if valor.startswith(PREFIJOS['zlib']):
+        datos = zlib.decompress(base64.b64decode(valor[len(PREFIJOS['zlib']):]))
+    elif valor.startswith(PREFIJOS['zstd']):
+        datos = _zstandard().ZstdDecompressor().decompress(base64.b64decode(valor[len(PREFIJOS['zstd']):]))
+    else:
+        return valor
+    return datos.decode('utf-8')
+
+
+def es_comprimido(valor, algoritmo=None):
+    """True si `valor` lleva el marcador de `algoritmo` (de cualquiera si es None)."""
+    prefijos = [PREFIJOS[algoritmo]] if algoritmo else PREFIJOS.values()
+    return any(valor.startswith(prefijo) for prefijo in prefijos)
+
+
+class TextoComprimidoField(models.TextField):
+    """
+    TextField que se comprime al guardar y se descomprime al leer. Los
+    filtros por contenido (contains, startswith...) no tienen sentido sobre
+    la columna comprimida.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return descomprimir(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        return comprimir(value)
@@ -0,0 +1,191 @@
+# ventas/eventos.py
+
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+# EVENTOS EN TIEMPO REAL (PUB/SUB)
+# ==============================================================================
+# Las APIs del tablero publican deltas por proyecto; la vista SSE
+# `eventos_tablero` los reenvía a los navegadores conectados. El mensaje se
+# serializa una sola vez y cada suscriptor es solo una asyncio.Queue en el
+# event loop del servidor ASGI, así que cientos de espectadores por worker
+# no cuestan más que memoria.
+#
+# El backend se elige con EVENTOS_BACKEND:
+# - BackendMemoria: dentro del proceso, sin dependencias. Sirve en desarrollo
+#   o con un único worker: un cambio hecho en otro worker no llega a los
+#   espectadores de este.
+# - BackendPostgres: reparte los mensajes entre procesos con LISTEN/NOTIFY
+#   usando la misma base de datos; no requiere otro broker.
+
+RECARGAR = json.dumps({'origen': '', 'deltas': [{'accion': 'recargar'}]})
+
+
+class Suscripcion:
+    """Cola de mensajes de un cliente conectado. Se crea dentro del event loop."""
+
+    def __init__(self, backend, canal):
+        self.backend = backend
+        self.canal = canal
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue(maxsize=settings.EVENTOS_COLA_MAXIMA)
+
+    def entregar(self, mensaje):
+        try:
+            self.cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            # Cliente demasiado lento: se descarta lo pendiente y se le pide
+            # que recargue el tablero completo.
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(RECARGAR)
+
+    async def siguiente(self, espera):
+        """Próximo mensaje, o None si no llega ninguno en `espera` segundos."""
+        try:
+            return await asyncio.wait_for(self.cola.get(), espera)
+        except asyncio.TimeoutError:
+            return None
+
+    def cerrar(self):
+        self.backend.desuscribir(self)
+
+
+class BackendMemoria:
+    """
+    Pub/sub dentro del proceso. `publicar` se puede llamar desde cualquier
+    hilo, pero solo llega a los suscriptores de este mismo proceso: con varios
+    workers (gunicorn/uvicorn con --workers > 1) quien mira el tablero desde
+    otro worker no recibe el cambio. En ese caso usar BackendPostgres.
+    """
+
+    def __init__(self):
+        self._suscripciones = {}  # canal -> set(Suscripcion)
+        self._lock = threading.Lock()
+
+    def suscribir(self, canal):
+        suscripcion = Suscripcion(self, canal)
+        with self._lock:
+            self._suscripciones.setdefault(canal, set()).add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.canal)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._suscripciones[suscripcion.canal]
+
+    def entregar_local(self, canal, mensaje):
+        with self._lock:
+            suscripciones = list(self._suscripciones.get(canal, ()))
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion.entregar, mensaje)
+            except RuntimeError:  # El event loop ya se cerró.
+                self.desuscribir(suscripcion)
+
+    def publicar(self, canal, mensaje):
+        self.entregar_local(canal, mensaje)
+
+
+class BackendPostgres(BackendMemoria):
+    """
+    Publica con pg_notify() y un hilo por proceso escucha el canal con LISTEN
+    para entregar los mensajes a sus propios suscriptores. NOTIFY admite
+    cargas de hasta 8000 bytes; los mensajes más grandes se reemplazan por una
+    orden de recargar.
+    """
+
+    CANAL_PG = 'ventas_eventos'
+    TAMANO_MAXIMO = 7900
+
+    def __init__(self):
+        super().__init__()
+        self._escuchando = False
+
+    def publicar(self, canal, mensaje):
+        carga = json.dumps({'canal': canal, 'mensaje': mensaje})
+        if len(carga.encode()) > self.TAMANO_MAXIMO:
+            carga = json.dumps({'canal': canal, 'mensaje': RECARGAR})
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.CANAL_PG, carga])
+
+    def suscribir(self, canal):
+        with self._lock:
+            if not self._escuchando:
+                self._escuchando = True
+                threading.Thread(target=self._escuchar, name='ventas-eventos', daemon=True).start()
+        return super().suscribir(canal)
+
+    def _escuchar(self):
+        import psycopg2
+
+        while True:
+            conexion = None
+            try:
+                conexion = psycopg2.connect(**connection.get_connection_params())
+                conexion.autocommit = True
+                with conexion.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.CANAL_PG}")
+                while True:
+                    if select.select([conexion], [], [], 30) == ([], [], []):
+                        continue
+                    conexion.poll()
+                    while conexion.notifies:
+                        datos = json.loads(conexion.notifies.pop(0).payload)
+                        self.entregar_local(datos['canal'], datos['mensaje'])
+            except Exception:
+                logger.exception("Se perdió la conexión LISTEN de eventos; reintentando.")
+                time.sleep(5)
+            finally:
+                if conexion is not None:
+                    conexion.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.EVENTOS_BACKEND)()
+    return _backend
+
+
+# ==============================================================================
+# EVENTOS DEL TABLERO KANBAN
+# ==============================================================================
+
+def canal_tablero(proyecto_id):
+    return f"tablero:{proyecto_id}"
+
+
+def publicar_tablero(proyecto_id, deltas, origen='', version=None):
+    """
+    Publica `deltas` (ver LoteTablero) a quienes miran el tablero. Se envía al
+    confirmar la transacción, para no anunciar cambios que luego se deshacen.
+    `origen` identifica la pestaña que hizo el cambio, que así lo ignora;
+    `version` es la del registro de cambios (ver registrar_cambio).
+    """
+    if not deltas:
+        return
+    mensaje = json.dumps({'origen': origen, 'version': version, 'deltas': deltas}, cls=DjangoJSONEncoder)
+    transaction.on_commit(lambda: obtener_backend().publicar(canal_tablero(proyecto_id), mensaje))
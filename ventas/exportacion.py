@@ -0,0 +1,169 @@
+# ventas/exportacion.py
+
+import tempfile
+from datetime import timedelta
+from itertools import chain, islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Avg, Q
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from .models import Prospecto, TrabajoExportacion
+
+
+# ==============================================================================
+# EXPORTACIÓN DE PROSPECTOS A EXCEL
+# ==============================================================================
+# Se usa el modo write-only de openpyxl: las filas se escriben a disco a medida
+# que llegan del cursor, así que la memoria no crece con el número de filas.
+
+ENCABEZADOS = [
+    'Nombre Completo', 'Email', 'Teléfono', 'Empresa', 'Puesto', 'Estado',
+    'Interés', 'Calificación Prom.', 'Referido Por', 'Contacto Ref.',
+    'Detalle Interés', 'Trabajadores', 'Etiquetas', 'Asignado a', 'Fecha Creación'
+]
+
+# En modo write-only los anchos de columna deben fijarse antes de la primera
+# fila, así que se calculan sobre una muestra inicial acotada.
+FILAS_MUESTRA_ANCHOS = 500
+ANCHO_MAXIMO_COLUMNA = 60
+TAMANO_LOTE = 2000
+
+
+def prospectos_para_exportar(user):
+    prospectos_qs = Prospecto.objects.annotate(
+        promedio_calificacion=Avg('prospectotrabajador__calificacion')
+    )
+    if not user.is_superuser:
+        prospectos_qs = prospectos_qs.filter(asignado_a=user)
+    return (
+        prospectos_qs.defer('busqueda')
+        .select_related('asignado_a')
+        .prefetch_related('etiquetas', 'trabajadores')
+    )
+
+
+def fila_prospecto(prospecto):
+    calificacion_str = f"{prospecto.promedio_calificacion:.2f}" if prospecto.promedio_calificacion else "N/A"
+    return [
+        prospecto.nombre_completo, prospecto.email, prospecto.telefono, prospecto.empresa, prospecto.puesto,
+        prospecto.get_estado_display(), prospecto.get_interes_principal_display(), calificacion_str,
+        prospecto.referencio, prospecto.contacto_referencio, prospecto.interes_cliente,
+        ", ".join([t.nombre for t in prospecto.trabajadores.all()]),
+        ", ".join([e.nombre for e in prospecto.etiquetas.all()]),
+        prospecto.asignado_a.username if prospecto.asignado_a else '',
+        prospecto.fecha_creacion.strftime('%Y-%m-%d %H:%M') if prospecto.fecha_creacion else ''
+    ]
+
+
+def escribir_libro_prospectos(prospectos, destino, tamano_lote=TAMANO_LOTE, al_avanzar=None):
+    """
+    Escribe el libro de prospectos en `destino` (ruta o archivo binario).
+    Recorre `prospectos` una sola vez con iterator(); devuelve las filas escritas.
+    Si se indica, `al_avanzar(filas)` se llama cada `tamano_lote` filas.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Prospectos')
+
+    filas = (fila_prospecto(p) for p in prospectos.iterator(chunk_size=tamano_lote))
+    muestra = list(islice(filas, FILAS_MUESTRA_ANCHOS))
+
+    anchos = [len(encabezado) for encabezado in ENCABEZADOS]
+    for fila in muestra:
+        for i, valor in enumerate(fila):
+            if valor:
+                anchos[i] = max(anchos[i], len(str(valor)))
+    for i, ancho in enumerate(anchos, 1):
+        worksheet.column_dimensions[get_column_letter(i)].width = min(ancho + 2, ANCHO_MAXIMO_COLUMNA)
+
+    encabezados = []
+    for titulo in ENCABEZADOS:
+        cell = WriteOnlyCell(worksheet, value=titulo)
+        cell.font = Font(bold=True)
+        encabezados.append(cell)
+    worksheet.append(encabezados)
+
+    total = 0
+    for fila in chain(muestra, filas):
+        worksheet.append(fila)
+        total += 1
+        if al_avanzar and total % tamano_lote == 0:
+            al_avanzar(total)
+
+    workbook.save(destino)
+    return total
+
+
+# ==============================================================================
+# EXPORTACIÓN EN SEGUNDO PLANO
+# ==============================================================================
+
+def tomar_siguiente_trabajo():
+    """
+    Reclama el trabajo pendiente más antiguo. SKIP LOCKED permite que varios
+    workers consuman la cola sin bloquearse ni tomar el mismo trabajo.
+    También se reclaman los EN_PROCESO abandonados por un worker que murió
+    (ver TrabajoExportacion.en_proceso_abandonados), así que el timeout debe
+    superar la duración de la exportación más larga.
+    """
+    with transaction.atomic():
+        trabajo = (
+            TrabajoExportacion.objects.select_for_update(skip_locked=True)
+            .filter(Q(estado=TrabajoExportacion.Estado.PENDIENTE) | TrabajoExportacion.en_proceso_abandonados())
+            .order_by('fecha_creacion')
+            .first()
+        )
+        if trabajo is None:
+            return None
+        trabajo.estado = TrabajoExportacion.Estado.EN_PROCESO
+        trabajo.fecha_inicio = timezone.now()
+        trabajo.filas_procesadas = 0
+        trabajo.save(update_fields=['estado', 'fecha_inicio', 'filas_procesadas'])
+    return trabajo
+
+
+def procesar_trabajo_exportacion(trabajo):
+    """Genera el libro del trabajo y lo guarda en el almacenamiento por defecto."""
+    def al_avanzar(filas):
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(filas_procesadas=filas)
+
+    try:
+        usuario = User.objects.get(pk=trabajo.usuario_id)
+        prospectos = prospectos_para_exportar(usuario)
+        trabajo.total_filas = prospectos.count()
+        trabajo.save(update_fields=['total_filas'])
+
+        with tempfile.SpooledTemporaryFile(max_size=settings.EXPORTACION_MAX_MEMORIA) as archivo:
+            trabajo.filas_procesadas = escribir_libro_prospectos(prospectos, archivo, al_avanzar=al_avanzar)
+            archivo.seek(0)
+            nombre = f"prospectos_{timezone.now().strftime('%Y-%m-%d_%H-%M')}_{trabajo.pk}.xlsx"
+            trabajo.archivo.save(nombre, File(archivo), save=False)
+
+        trabajo.estado = TrabajoExportacion.Estado.COMPLETADO
+    except Exception as e:
+        trabajo.estado = TrabajoExportacion.Estado.ERROR
+        trabajo.mensaje_error = str(e)
+    trabajo.fecha_fin = timezone.now()
+    trabajo.save()
+    return trabajo
+
+
+def limpiar_exportaciones_vencidas():
+    """
+    Borra los trabajos terminados hace más de EXPORTACION_RETENCION_DIAS y
+    devuelve cuántos eran. Sus archivos se encolan para borrado desde la
+    señal post_delete de TrabajoExportacion.
+    """
+    limite = timezone.now() - timedelta(days=settings.EXPORTACION_RETENCION_DIAS)
+    borrados, _ = TrabajoExportacion.objects.filter(
+        estado__in=[TrabajoExportacion.Estado.COMPLETADO, TrabajoExportacion.Estado.ERROR],
+        fecha_fin__lt=limite,
+    ).delete()
+    return borrados
@@ -27,6 +27,28 @@ class ProspectoForm(forms.ModelForm):
             'interes_cliente': forms.Textarea(attrs={'class': 'form-control', 'rows': 4, 'placeholder': 'Describe los productos o servicios de interés...'}),
         }
 
+class ProspectoImportForm(ProspectoForm):
+    """
+    Valida una fila importada con las mismas reglas que ProspectoForm. La
+    unicidad del email se resuelve por lotes en ventas/importacion.py, así
+    que aquí se omite la consulta por fila.
+    """
+    def validate_unique(self):
+        pass
+
+class ImportarProspectosForm(forms.Form):
+    """Formulario de subida para la importación masiva de prospectos."""
+    archivo = forms.FileField(
+        label="Archivo CSV o Excel",
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Solo se admiten archivos .csv o .xlsx.")
+        return archivo
+
 # --- NUEVO FORMULARIO PARA ASIGNAR TRABAJADOR Y CALIFICACIÓN ---
 class ProspectoTrabajadorForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,270 @@
+# ventas/importacion.py
+
+import csv
+import io
+import time
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .busqueda import quitar_acentos
+from .forms import ProspectoImportForm
+from .models import Prospecto, Etiqueta, ContadorEstadoProspecto, VersionDatos
+
+
+# ==============================================================================
+# IMPORTACIÓN MASIVA DE PROSPECTOS (CSV / XLSX)
+# ==============================================================================
+# Las filas se leen en streaming, se validan con ProspectoForm y se escriben
+# por lotes con un único INSERT ... ON CONFLICT (email) DO UPDATE por lote.
+# Como bulk_create() no dispara señales, aquí mismo se ajustan los contadores
+# de estado, las versiones del calendario y la fecha de última actividad de
+# los prospectos nuevos.
+
+TAMANO_LOTE = 1000
+
+CAMPOS_FORMULARIO = ProspectoImportForm._meta.fields
+
+# Encabezados aceptados (sin acentos y en minúsculas) -> campo. Incluye los
+# del archivo que genera la exportación, para poder reimportarlo tal cual.
+ALIAS_ENCABEZADOS = {
+    'nombre completo': 'nombre_completo',
+    'nombre': 'nombre_completo',
+    'email': 'email',
+    'correo': 'email',
+    'telefono': 'telefono',
+    'empresa': 'empresa',
+    'puesto': 'puesto',
+    'estado': 'estado',
+    'interes': 'interes_principal',
+    'interes principal': 'interes_principal',
+    'referido por': 'referencio',
+    'contacto ref.': 'contacto_referencio',
+    'contacto de referencia': 'contacto_referencio',
+    'detalle interes': 'interes_cliente',
+    'etiquetas': 'etiquetas',
+    'asignado a': 'asignado_a',
+}
+
+# Se aceptan tanto los valores ('GANADO') como las etiquetas ('Cliente Cerrado').
+VALORES_ELECCION = {
+    'estado': {quitar_acentos(label).lower(): value for value, label in Prospecto.Estado.choices},
+    'interes_principal': {quitar_acentos(label).lower(): value for value, label in Prospecto.Interes.choices},
+}
+
+
+class ErrorImportacion(Exception):
+    """
+    La importación no pudo completarse. Si ya se habían guardado lotes,
+    `resultado` trae lo importado hasta el error.
+    """
+
+    def __init__(self, mensaje, resultado=None):
+        super().__init__(mensaje)
+        self.resultado = resultado
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.filas = 0
+        self.creados = 0
+        self.actualizados = 0
+        self.errores = []  # [(número de fila, mensaje)]
+        self.segundos = 0.0
+
+    @property
+    def filas_por_segundo(self):
+        return round(self.filas / self.segundos, 1) if self.segundos else 0
+
+
+def _normalizar_encabezado(encabezado):
+    texto = quitar_acentos(str(encabezado or '')).strip().lower()
+    return ALIAS_ENCABEZADOS.get(texto, texto.replace(' ', '_'))
+
+
+def leer_filas(archivo, nombre):
+    """Genera (número de fila, {campo: valor}) sin cargar el archivo completo."""
+    if nombre.lower().endswith('.xlsx'):
+        workbook = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            filas = workbook.worksheets[0].iter_rows(values_only=True)
+            encabezados = [_normalizar_encabezado(h) for h in next(filas, [])]
+            for numero, valores in enumerate(filas, 2):
+                if any(v not in (None, '') for v in valores):
+                    yield numero, dict(zip(encabezados, valores))
+        finally:
+            workbook.close()
+    elif nombre.lower().endswith('.csv'):
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+        lector = csv.reader(texto)
+        encabezados = [_normalizar_encabezado(h) for h in next(lector, [])]
+        for numero, valores in enumerate(lector, 2):
+            if any(valores):
+                yield numero, dict(zip(encabezados, valores))
+        texto.detach()
+    else:
+        raise ErrorImportacion("Formato no soportado: use .csv o .xlsx.")
+
+
+def _limpiar_fila(fila):
+    datos = {}
+    for campo in CAMPOS_FORMULARIO:
+        valor = fila.get(campo)
+        valor = '' if valor is None else str(valor).strip()
+        if campo in VALORES_ELECCION and valor:
+            valor = VALORES_ELECCION[campo].get(quitar_acentos(valor).lower(), valor.upper())
+        datos[campo] = valor
+    if not datos['estado']:
+        datos['estado'] = Prospecto.Estado.NUEVO
+    if not datos['interes_principal']:
+        datos['interes_principal'] = Prospecto.Interes.IMPORTACION
+    return datos
+
+
+def _lista_etiquetas(valor):
+    max_length = Etiqueta._meta.get_field('nombre').max_length
+    return [e.strip()[:max_length] for e in str(valor or '').split(',') if e.strip()][:20]
+
+
+class ImportadorProspectos:
+    """
+    Importa prospectos para `usuario`. Un superusuario puede indicar el
+    responsable en la columna 'Asignado a'; los demás importan a su nombre y
+    no pueden sobrescribir prospectos asignados a otra persona.
+    """
+
+    def __init__(self, usuario, tamano_lote=TAMANO_LOTE):
+        self.usuario = usuario
+        self.tamano_lote = tamano_lote
+        self._usuarios = {}  # username -> id, cacheado entre lotes
+
+    def importar(self, archivo, nombre):
+        resultado = ResultadoImportacion()
+        inicio = time.monotonic()
+        filas = leer_filas(archivo, nombre)
+        ultima_fila = 1
+        try:
+            while True:
+                lote = list(islice(filas, self.tamano_lote))
+                if not lote:
+                    break
+                resultado.filas += len(lote)
+                self._procesar_lote(lote, resultado)
+                ultima_fila = lote[-1][0]
+        except ErrorImportacion:
+            raise
+        except Exception as e:
+            # Los lotes anteriores ya están guardados: se informa hasta dónde se llegó.
+            if isinstance(e, UnicodeDecodeError):
+                mensaje = f"El archivo no está codificado en UTF-8 (error después de la fila {ultima_fila})."
+            else:
+                mensaje = f"No se pudo leer el archivo después de la fila {ultima_fila}: {e}"
+            if resultado.creados or resultado.actualizados:
+                mensaje += (
+                    f" Se importaron {resultado.creados} creados y {resultado.actualizados} actualizados"
+                    f" antes del error; corrija el archivo y vuelva a importarlo completo."
+                )
+                resultado.segundos = time.monotonic() - inicio
+                raise ErrorImportacion(mensaje, resultado) from e
+            raise ErrorImportacion(mensaje) from e
+        resultado.segundos = time.monotonic() - inicio
+        return resultado
+
+    def _resolver_usuarios(self, nombres):
+        faltantes = {n for n in nombres if n and n not in self._usuarios}
+        if faltantes:
+            self._usuarios.update(
+                User.objects.filter(username__in=faltantes).values_list('username', 'id')
+            )
+            for nombre in faltantes - set(self._usuarios):
+                self._usuarios[nombre] = None
+
+    def _procesar_lote(self, lote, resultado):
+        validos = {}  # email -> (número de fila, datos, etiquetas, asignado_id)
+        if self.usuario.is_superuser:
+            self._resolver_usuarios({str(f.get('asignado_a') or '').strip() for _, f in lote})
+
+        for numero, fila in lote:
+            form = ProspectoImportForm(_limpiar_fila(fila))
+            if not form.is_valid():
+                errores = "; ".join(f"{campo}: {', '.join(msgs)}" for campo, msgs in form.errors.items())
+                resultado.errores.append((numero, errores))
+                continue
+            asignado_id = self.usuario.pk
+            nombre_asignado = str(fila.get('asignado_a') or '').strip()
+            if self.usuario.is_superuser and nombre_asignado:
+                asignado_id = self._usuarios.get(nombre_asignado)
+                if asignado_id is None:
+                    resultado.errores.append((numero, f"asignado_a: no existe el usuario '{nombre_asignado}'."))
+                    continue
+            # Si el email se repite dentro del lote, prevalece la última fila.
+            validos[form.cleaned_data['email']] = (
+                numero, form.cleaned_data, _lista_etiquetas(fila.get('etiquetas')), asignado_id
+            )
+
+        if not validos:
+            return
+
+        existentes = {
+            p['email']: p
+            for p in Prospecto.objects.filter(email__in=validos.keys()).values('email', 'estado', 'asignado_a_id')
+        }
+        if not self.usuario.is_superuser:
+            for email, previo in existentes.items():
+                if previo['asignado_a_id'] not in (None, self.usuario.pk):
+                    numero = validos.pop(email)[0]
+                    resultado.errores.append((numero, f"email: '{email}' pertenece a un prospecto de otro usuario."))
+            if not validos:
+                return
+
+        ahora = timezone.now()
+        prospectos = []
+        deltas = Counter()
+        for email, (numero, datos, etiquetas, asignado_id) in validos.items():
+            prospectos.append(Prospecto(
+                **datos, asignado_a_id=asignado_id, fecha_creacion=ahora, ultima_actividad=ahora
+            ))
+            previo = existentes.get(email)
+            if previo:
+                deltas[(previo['asignado_a_id'], previo['estado'])] -= 1
+            deltas[(asignado_id, datos['estado'])] += 1
+
+        campos_actualizables = [c for c in CAMPOS_FORMULARIO if c != 'email'] + ['asignado_a', 'fecha_actualizacion']
+        with transaction.atomic():
+            Prospecto.objects.bulk_create(
+                prospectos,
+                update_conflicts=True,
+                unique_fields=['email'],
+                update_fields=campos_actualizables,
+            )
+            ids = dict(Prospecto.objects.filter(email__in=validos.keys()).values_list('email', 'id'))
+            self._asignar_etiquetas(validos, ids)
+            for (asignado_id, estado), delta in deltas.items():
+                ContadorEstadoProspecto.ajustar(asignado_id, estado, delta)
+            # Los nombres de los prospectos aparecen en los eventos del calendario.
+            for usuario_id in {asignado_id for asignado_id, _ in deltas} | {0}:
+                VersionDatos.incrementar(VersionDatos.Ambito.CALENDARIO, usuario_id)
+
+        resultado.actualizados += len(existentes.keys() & validos.keys())
+        resultado.creados += len(validos) - len(existentes.keys() & validos.keys())
+
+    def _asignar_etiquetas(self, validos, ids):
+        nombres = {nombre for _, _, etiquetas, _ in validos.values() for nombre in etiquetas}
+        if not nombres:
+            return
+        Etiqueta.objects.bulk_create([Etiqueta(nombre=n) for n in nombres], ignore_conflicts=True)
+        etiquetas = dict(Etiqueta.objects.filter(nombre__in=nombres).values_list('nombre', 'id'))
+        Through = Prospecto.etiquetas.through
+        Through.objects.bulk_create(
+            [
+                Through(prospecto_id=ids[email], etiqueta_id=etiquetas[nombre])
+                for email, (_, _, nombres_fila, _) in validos.items()
+                for nombre in nombres_fila
+                if email in ids and nombre in etiquetas
+            ],
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,689 @@
+# ventas/kanban.py
+
+import json
+from bisect import bisect_left, bisect_right
+from itertools import count
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.functions import Length
+
+from .eventos import publicar_tablero
+from .models import CambioTablero, InstantaneaTablero, KanbanColumna, KanbanTarea, Proyecto, VersionDatos
+from .rangos import ErrorRango, rango_entre, rangos_distribuidos
+
+
+# ==============================================================================
+# POSICIONES EN EL TABLERO KANBAN
+# ==============================================================================
+# Columnas y tareas se ordenan por `rango` (ventas/rangos.py). Para calcular
+# un rango nuevo se bloquea la fila del contenedor (el proyecto para las
+# columnas, la columna para las tareas): así dos altas simultáneas al final
+# no obtienen el mismo rango y el rebalanceo no se cruza con un movimiento.
+
+LONGITUD_MAXIMA_RANGO = KanbanTarea._meta.get_field('rango').max_length
+
+
+def _bloquear(modelo, pk):
+    return modelo.objects.select_for_update().filter(pk=pk).values_list('pk', flat=True).first()
+
+
+def _rango_en(hermanos, anterior_id=None, siguiente_id=None):
+    """
+    Rango para colocar un elemento detrás de `anterior_id` o delante de
+    `siguiente_id` (se prefiere el primero). Si ninguno existe entre
+    `hermanos`, el elemento va al final.
+    """
+    hermanos = hermanos.order_by()
+    anterior = siguiente = None
+    if anterior_id is not None:
+        anterior = hermanos.filter(pk=anterior_id).values_list('rango', flat=True).first()
+    if anterior is None and siguiente_id is not None:
+        siguiente = hermanos.filter(pk=siguiente_id).values_list('rango', flat=True).first()
+
+    # El otro vecino se lee de la base de datos: la vista del cliente puede
+    # estar desactualizada.
+    if anterior is not None:
+        siguiente = hermanos.filter(rango__gt=anterior).order_by('rango').values_list('rango', flat=True).first()
+    elif siguiente is not None:
+        anterior = hermanos.filter(rango__lt=siguiente).order_by('-rango').values_list('rango', flat=True).first()
+    else:
+        anterior = hermanos.order_by('-rango').values_list('rango', flat=True).first()
+    return rango_entre(anterior, siguiente)
+
+
+def _rebalancear(hermanos):
+    es_tarea = hermanos.model is KanbanTarea
+    grupo = 'columna_id' if es_tarea else 'proyecto_id'
+    elementos = list(hermanos.order_by('rango', 'id').only('id', 'rango', grupo))
+    if not elementos:
+        return 0
+    for elemento, rango in zip(elementos, rangos_distribuidos(len(elementos))):
+        elemento.rango = rango
+    hermanos.model.objects.bulk_update(elementos, ['rango'], batch_size=500)
+
+    # El orden visible no cambia, pero los rangos sí: bulk_update() no dispara
+    # señales, así que se invalida a mano el tablero cacheado y se envían los
+    # rangos nuevos a los clientes, que los usan para colocar los elementos.
+    if es_tarea:
+        proyecto_id = KanbanColumna.objects.filter(pk=elementos[0].columna_id).values_list('proyecto_id', flat=True).get()
+        delta = {
+            'accion': 'tareas_reordenadas',
+            'tareas': [{'id': str(t.pk), 'columna_id': str(t.columna_id), 'rango': t.rango} for t in elementos],
+        }
+    else:
+        proyecto_id = elementos[0].proyecto_id
+        delta = {'accion': 'columnas_reordenadas', 'columnas': [{'id': str(c.pk), 'rango': c.rango} for c in elementos]}
+    VersionDatos.incrementar(VersionDatos.Ambito.TABLERO, proyecto_id)
+    registrar_cambio(proyecto_id, [delta])
+    return len(elementos)
+
+
+def _rango_con_rebalanceo(hermanos, anterior_id, siguiente_id):
+    try:
+        rango = _rango_en(hermanos, anterior_id, siguiente_id)
+    except ErrorRango:
+        rango = None  # Rangos repetidos o vacíos (filas creadas sin rango).
+    if rango is None or len(rango) > LONGITUD_MAXIMA_RANGO:
+        # Caso raro (cientos de inserciones en el mismo hueco antes de que
+        # pase el rebalanceo en segundo plano): se rebalancea aquí mismo.
+        _rebalancear(hermanos)
+        rango = _rango_en(hermanos, anterior_id, siguiente_id)
+    return rango
+
+
+def rango_tarea(columna_id, anterior_id=None, siguiente_id=None, excluir_id=None):
+    """
+    Rango para una tarea en `columna_id`. Debe llamarse dentro del mismo
+    transaction.atomic() que guarda la tarea, para mantener el bloqueo.
+    """
+    with transaction.atomic():
+        _bloquear(KanbanColumna, columna_id)
+        hermanos = KanbanTarea.objects.filter(columna_id=columna_id)
+        if excluir_id is not None:
+            hermanos = hermanos.exclude(pk=excluir_id)
+        return _rango_con_rebalanceo(hermanos, anterior_id, siguiente_id)
+
+
+def rango_columna(proyecto_id, anterior_id=None, siguiente_id=None, excluir_id=None):
+    """Rango para una columna de `proyecto_id`. Igual que rango_tarea()."""
+    with transaction.atomic():
+        _bloquear(Proyecto, proyecto_id)
+        hermanos = KanbanColumna.objects.filter(proyecto_id=proyecto_id)
+        if excluir_id is not None:
+            hermanos = hermanos.exclude(pk=excluir_id)
+        return _rango_con_rebalanceo(hermanos, anterior_id, siguiente_id)
+
+
+# ==============================================================================
+# REORDENAMIENTO EN BLOQUE
+# ==============================================================================
+# El cliente envía el orden completo y se valida contra la base de datos antes
+# de escribir nada. Todos los rangos se escriben con un solo bulk_update()
+# (un UPDATE ... SET rango = CASE id WHEN ... END WHERE id IN (...)).
+
+class ErrorReordenamiento(ValueError):
+    pass
+
+
+def _ids(valores, descripcion):
+    try:
+        ids = [int(valor) for valor in valores]
+    except (TypeError, ValueError):
+        raise ErrorReordenamiento(f"Lista de {descripcion} inválida.")
+    if len(ids) != len(set(ids)):
+        raise ErrorReordenamiento(f"La lista de {descripcion} tiene IDs repetidos.")
+    return ids
+
+
+def reordenar_columnas(proyecto_id, columnas_ids):
+    """
+    Reordena las columnas de un proyecto. `columnas_ids` debe contener
+    exactamente las columnas del proyecto, en el orden nuevo. Devuelve las
+    columnas con su rango nuevo.
+    """
+    ids = _ids(columnas_ids, 'columnas')
+    with transaction.atomic():
+        _bloquear(Proyecto, proyecto_id)
+        actuales = set(KanbanColumna.objects.filter(proyecto_id=proyecto_id).values_list('pk', flat=True))
+        if set(ids) != actuales:
+            raise ErrorReordenamiento("La lista no coincide con las columnas del proyecto.")
+        columnas = [KanbanColumna(pk=pk, rango=rango) for pk, rango in zip(ids, rangos_distribuidos(len(ids)))]
+        KanbanColumna.objects.bulk_update(columnas, ['rango'])
+        # bulk_update() no dispara señales: la versión del tablero se sube aquí.
+        VersionDatos.incrementar(VersionDatos.Ambito.TABLERO, proyecto_id)
+    return columnas
+
+
+def reordenar_tareas(proyecto_id, tareas_por_columna):
+    """
+    Reordena tareas dentro de una o varias columnas y entre ellas.
+    `tareas_por_columna` es {columna_id: [tarea_id, ...]} con el contenido
+    completo y ordenado de cada columna indicada: las tareas listadas deben
+    ser exactamente las que hoy están en esas columnas (una tarea movida
+    aparece en su columna nueva y no en la de origen). Devuelve las tareas
+    con su columna y rango nuevos.
+    """
+    if not isinstance(tareas_por_columna, dict) or not tareas_por_columna:
+        raise ErrorReordenamiento("Se esperaba un objeto {columna: [tareas]}.")
+    columnas_ids = _ids(tareas_por_columna.keys(), 'columnas')
+    listas = [
+        _ids(tareas_ids if isinstance(tareas_ids, list) else None, 'tareas')
+        for tareas_ids in tareas_por_columna.values()
+    ]
+    todas = [pk for lista in listas for pk in lista]
+    if len(todas) != len(set(todas)):
+        raise ErrorReordenamiento("Una tarea aparece en más de una columna.")
+
+    with transaction.atomic():
+        # Se bloquean las columnas en orden de pk para no provocar deadlocks.
+        bloqueadas = list(
+            KanbanColumna.objects.select_for_update()
+            .filter(pk__in=columnas_ids, proyecto_id=proyecto_id)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        if len(bloqueadas) != len(columnas_ids):
+            raise ErrorReordenamiento("Alguna columna no pertenece al proyecto.")
+        actuales = set(KanbanTarea.objects.filter(columna_id__in=columnas_ids).values_list('pk', flat=True))
+        if set(todas) != actuales:
+            raise ErrorReordenamiento("Las tareas no coinciden con el contenido de las columnas indicadas.")
+
+        tareas = [
+            KanbanTarea(pk=pk, columna_id=columna_id, rango=rango)
+            for columna_id, lista in zip(columnas_ids, listas)
+            for pk, rango in zip(lista, rangos_distribuidos(len(lista)))
+        ]
+        KanbanTarea.objects.bulk_update(tareas, ['columna', 'rango'])
+        VersionDatos.incrementar(VersionDatos.Ambito.TABLERO, proyecto_id)
+    return tareas
+
+
+# ==============================================================================
+# OPERACIONES EN LOTE
+# ==============================================================================
+# Aplica una lista ordenada de operaciones sobre el tablero de un proyecto en
+# una sola transacción. El tablero se carga una vez (columnas y los campos
+# mínimos de las tareas), las operaciones se aplican en memoria y al final se
+# escribe todo con bulk_create/bulk_update y un DELETE por modelo. Los
+# elementos creados en el mismo lote se pueden referenciar con su `ref`
+# (un ID temporal del cliente), lo que permite reproducir cambios offline.
+#
+# Operaciones: crear_columna, actualizar_columna, mover_columna,
+# eliminar_columna, crear_tarea, actualizar_tarea, mover_tarea, eliminar_tarea.
+# La posición se indica con `anterior_id` / `siguiente_id`, como en
+# mover_tarea_api.
+
+class ErrorLote(ValueError):
+    def __init__(self, mensaje, indice=None):
+        super().__init__(mensaje)
+        self.indice = indice
+
+
+def _rango_en_memoria(hermanos, anterior, siguiente):
+    """Igual que _rango_en(), sobre objetos ya cargados."""
+    rangos = sorted(h.rango for h in hermanos)
+    if anterior is not None:
+        i = bisect_right(rangos, anterior.rango)
+        return rango_entre(anterior.rango, rangos[i] if i < len(rangos) else None)
+    if siguiente is not None:
+        i = bisect_left(rangos, siguiente.rango)
+        return rango_entre(rangos[i - 1] if i else None, siguiente.rango)
+    return rango_entre(rangos[-1] if rangos else None, None)
+
+
+def _id(elemento):
+    return str(elemento.pk) if elemento.pk else None
+
+
+def _ref(clave):
+    return clave[4:] if isinstance(clave, str) and clave.startswith('ref:') else None
+
+
+class LoteTablero:
+
+    def __init__(self, proyecto_id):
+        self.proyecto_id = proyecto_id
+        self._nuevas_claves = count(1)
+
+    # --- Carga y resolución de IDs ---
+
+    def _cargar(self):
+        self.columnas = {
+            c.pk: c for c in KanbanColumna.objects.filter(proyecto_id=self.proyecto_id).only('id', 'titulo', 'icono', 'rango')
+        }
+        self.tareas = {}
+        self.columna_de = {}  # clave de tarea -> clave de columna
+        for tarea in KanbanTarea.objects.filter(columna__proyecto_id=self.proyecto_id).only('id', 'columna_id', 'rango'):
+            self.tareas[tarea.pk] = tarea
+            self.columna_de[tarea.pk] = tarea.columna_id
+        self.creadas = {'columnas': {}, 'tareas': {}}  # clave -> objeto
+        self.modificadas = {'columnas': {}, 'tareas': {}}  # clave -> campos
+        self.eliminadas = {'columnas': set(), 'tareas': set()}  # pks existentes
+
+    def _clave(self, valor, elementos, descripcion, obligatorio=True):
+        if valor is None or valor == '':
+            if obligatorio:
+                raise ErrorLote(f"Falta el ID de la {descripcion}.")
+            return None
+        if f"ref:{valor}" in elementos:
+            return f"ref:{valor}"
+        try:
+            clave = int(valor)
+        except (TypeError, ValueError):
+            clave = None
+        if clave not in elementos:
+            raise ErrorLote(f"La {descripcion} '{valor}' no existe en este tablero.")
+        return clave
+
+    def _nueva_clave(self, operacion, elementos):
+        ref = operacion.get('ref')
+        if ref in (None, ''):
+            return f"nuevo:{next(self._nuevas_claves)}"
+        if f"ref:{ref}" in elementos:
+            raise ErrorLote(f"La referencia '{ref}' ya se usó en este lote.")
+        return f"ref:{ref}"
+
+    def _texto(self, operacion, modelo, campo, obligatorio):
+        valor = operacion.get(campo)
+        if valor is None:
+            if obligatorio:
+                raise ErrorLote(f"El campo '{campo}' es obligatorio.")
+            return None
+        valor = str(valor).strip() if campo == 'titulo' else str(valor)
+        if obligatorio and not valor:
+            raise ErrorLote(f"El campo '{campo}' es obligatorio.")
+        max_length = modelo._meta.get_field(campo).max_length
+        if max_length and len(valor) > max_length:
+            raise ErrorLote(f"El campo '{campo}' admite como máximo {max_length} caracteres.")
+        return valor
+
+    def _marcar(self, tipo, clave, *campos):
+        if clave in self.creadas[tipo]:
+            return  # Se insertará con todos sus valores.
+        self.modificadas[tipo].setdefault(clave, set()).update(campos)
+
+    # --- Posiciones ---
+
+    def _posicion(self, tipo, hermanos, claves_hermanos, operacion, elementos, descripcion):
+        anterior = self._clave(operacion.get('anterior_id'), elementos, descripcion, obligatorio=False)
+        siguiente = self._clave(operacion.get('siguiente_id'), elementos, descripcion, obligatorio=False)
+        # Un vecino que no está en el grupo de destino se ignora, como en _rango_en().
+        anterior = elementos[anterior] if anterior in claves_hermanos else None
+        siguiente = elementos[siguiente] if siguiente in claves_hermanos else None
+        try:
+            rango = _rango_en_memoria(hermanos, anterior, siguiente)
+        except ErrorRango:
+            rango = None
+        if rango is None or len(rango) > LONGITUD_MAXIMA_RANGO:
+            claves = sorted(claves_hermanos, key=lambda c: (elementos[c].rango, str(c)))
+            for clave, nuevo in zip(claves, rangos_distribuidos(len(claves))):
+                elementos[clave].rango = nuevo
+                self._marcar(tipo, clave, 'rango')
+            rango = _rango_en_memoria(hermanos, anterior, siguiente)
+        return rango
+
+    def _posicion_columna(self, operacion, excluir=None):
+        claves = [c for c in self.columnas if c != excluir]
+        return self._posicion(
+            'columnas', [self.columnas[c] for c in claves], set(claves), operacion, self.columnas, 'columna'
+        )
+
+    def _posicion_tarea(self, columna_clave, operacion, excluir=None):
+        claves = {c for c, col in self.columna_de.items() if col == columna_clave and c != excluir}
+        return self._posicion(
+            'tareas', [self.tareas[c] for c in claves], claves, operacion, self.tareas, 'tarea'
+        )
+
+    # --- Operaciones ---
+
+    def crear_columna(self, operacion):
+        clave = self._nueva_clave(operacion, self.columnas)
+        columna = KanbanColumna(
+            proyecto_id=self.proyecto_id,
+            titulo=self._texto(operacion, KanbanColumna, 'titulo', True),
+            icono=self._texto(operacion, KanbanColumna, 'icono', False) or '',
+            rango=self._posicion_columna(operacion),
+        )
+        self.columnas[clave] = columna
+        self.creadas['columnas'][clave] = columna
+        datos = {'titulo': columna.titulo, 'icono': columna.icono, 'rango': columna.rango}
+        return lambda: {'accion': 'columna_creada', 'ref': _ref(clave), 'columna': {'id': _id(columna), **datos}}
+
+    def actualizar_columna(self, operacion):
+        clave = self._clave(operacion.get('id'), self.columnas, 'columna')
+        columna = self.columnas[clave]
+        titulo = self._texto(operacion, KanbanColumna, 'titulo', False)
+        icono = self._texto(operacion, KanbanColumna, 'icono', False)
+        if titulo:
+            columna.titulo = titulo
+            self._marcar('columnas', clave, 'titulo')
+        if icono is not None:
+            columna.icono = icono
+            self._marcar('columnas', clave, 'icono')
+        datos = {'titulo': columna.titulo, 'icono': columna.icono}
+        return lambda: {'accion': 'columna_actualizada', 'ref': _ref(clave), 'columna': {'id': _id(columna), **datos}}
+
+    def mover_columna(self, operacion):
+        clave = self._clave(operacion.get('id'), self.columnas, 'columna')
+        columna = self.columnas[clave]
+        columna.rango = rango = self._posicion_columna(operacion, excluir=clave)
+        self._marcar('columnas', clave, 'rango')
+        return lambda: {'accion': 'columna_movida', 'ref': _ref(clave), 'columna': {'id': _id(columna), 'rango': rango}}
+
+    def eliminar_columna(self, operacion):
+        clave = self._clave(operacion.get('id'), self.columnas, 'columna')
+        columna = self.columnas.pop(clave)
+        for tarea_clave in [c for c, col in self.columna_de.items() if col == clave]:
+            self._quitar_tarea(tarea_clave)
+        if self.creadas['columnas'].pop(clave, None) is None:
+            self.modificadas['columnas'].pop(clave, None)
+            self.eliminadas['columnas'].add(clave)
+        return lambda: {'accion': 'columna_eliminada', 'ref': _ref(clave), 'id': _id(columna)}
+
+    def crear_tarea(self, operacion):
+        columna_clave = self._clave(operacion.get('columna_id'), self.columnas, 'columna')
+        clave = self._nueva_clave(operacion, self.tareas)
+        tarea = KanbanTarea(
+            titulo=self._texto(operacion, KanbanTarea, 'titulo', True),
+            descripcion=self._texto(operacion, KanbanTarea, 'descripcion', False) or '',
+            rango=self._posicion_tarea(columna_clave, operacion),
+        )
+        self.tareas[clave] = tarea
+        self.columna_de[clave] = columna_clave
+        self.creadas['tareas'][clave] = tarea
+        columna = self.columnas[columna_clave]
+        datos = {'titulo': tarea.titulo, 'descripcion': tarea.descripcion, 'rango': tarea.rango}
+        return lambda: {
+            'accion': 'tarea_creada', 'ref': _ref(clave),
+            'tarea': {'id': _id(tarea), 'columna_id': _id(columna), **datos},
+        }
+
+    def actualizar_tarea(self, operacion):
+        clave = self._clave(operacion.get('id'), self.tareas, 'tarea')
+        tarea = self.tareas[clave]
+        cambios = {}
+        titulo = self._texto(operacion, KanbanTarea, 'titulo', False)
+        descripcion = self._texto(operacion, KanbanTarea, 'descripcion', False)
+        if titulo:
+            tarea.titulo = cambios['titulo'] = titulo
+        if descripcion is not None:
+            tarea.descripcion = cambios['descripcion'] = descripcion
+        if cambios:
+            self._marcar('tareas', clave, *cambios)
+        return lambda: {'accion': 'tarea_actualizada', 'ref': _ref(clave), 'tarea': {'id': _id(tarea), **cambios}}
+
+    def mover_tarea(self, operacion):
+        clave = self._clave(operacion.get('id'), self.tareas, 'tarea')
+        columna_clave = self._clave(operacion.get('columna_id'), self.columnas, 'columna')
+        tarea = self.tareas[clave]
+        tarea.rango = rango = self._posicion_tarea(columna_clave, operacion, excluir=clave)
+        self.columna_de[clave] = columna_clave
+        self._marcar('tareas', clave, 'columna', 'rango')
+        columna = self.columnas[columna_clave]
+        return lambda: {
+            'accion': 'tarea_movida', 'ref': _ref(clave),
+            'tarea': {'id': _id(tarea), 'columna_id': _id(columna), 'rango': rango},
+        }
+
+    def _quitar_tarea(self, clave):
+        tarea = self.tareas.pop(clave)
+        del self.columna_de[clave]
+        if self.creadas['tareas'].pop(clave, None) is None:
+            # También las de una columna eliminada: en la base de datos pueden
+            # seguir en otra columna si se movieron dentro de este lote.
+            self.modificadas['tareas'].pop(clave, None)
+            self.eliminadas['tareas'].add(clave)
+        return tarea
+
+    def eliminar_tarea(self, operacion):
+        clave = self._clave(operacion.get('id'), self.tareas, 'tarea')
+        tarea = self._quitar_tarea(clave)
+        return lambda: {'accion': 'tarea_eliminada', 'ref': _ref(clave), 'id': _id(tarea)}
+
+    OPERACIONES = {
+        'crear_columna': crear_columna,
+        'actualizar_columna': actualizar_columna,
+        'mover_columna': mover_columna,
+        'eliminar_columna': eliminar_columna,
+        'crear_tarea': crear_tarea,
+        'actualizar_tarea': actualizar_tarea,
+        'mover_tarea': mover_tarea,
+        'eliminar_tarea': eliminar_tarea,
+    }
+
+    # --- Escritura ---
+
+    def _guardar(self):
+        columnas_nuevas = list(self.creadas['columnas'].values())
+        KanbanColumna.objects.bulk_create(columnas_nuevas)
+
+        tareas_nuevas = []
+        for clave, tarea in self.creadas['tareas'].items():
+            tarea.columna_id = self.columnas[self.columna_de[clave]].pk
+            tareas_nuevas.append(tarea)
+        KanbanTarea.objects.bulk_create(tareas_nuevas)
+
+        for tipo, modelo in (('columnas', KanbanColumna), ('tareas', KanbanTarea)):
+            modificadas = self.modificadas[tipo]
+            if not modificadas:
+                continue
+            elementos = self.columnas if tipo == 'columnas' else self.tareas
+            if tipo == 'tareas':
+                for clave in modificadas:
+                    elementos[clave].columna_id = self.columnas[self.columna_de[clave]].pk
+            campos = sorted(set().union(*modificadas.values()))
+            modelo.objects.bulk_update([elementos[clave] for clave in modificadas], campos, batch_size=500)
+
+        if self.eliminadas['tareas']:
+            KanbanTarea.objects.filter(pk__in=self.eliminadas['tareas']).delete()
+        if self.eliminadas['columnas']:
+            KanbanColumna.objects.filter(pk__in=self.eliminadas['columnas']).delete()
+
+    def aplicar(self, operaciones):
+        """
+        Aplica `operaciones` (lista de dicts con la clave 'op') y devuelve un
+        delta por operación. Si alguna falla no se guarda nada y se lanza
+        ErrorLote con el índice de la operación.
+        """
+        if not isinstance(operaciones, list) or not operaciones:
+            raise ErrorLote("Se esperaba una lista de operaciones.")
+        if len(operaciones) > settings.KANBAN_LOTE_MAXIMO_OPERACIONES:
+            raise ErrorLote(f"Un lote admite como máximo {settings.KANBAN_LOTE_MAXIMO_OPERACIONES} operaciones.")
+
+        with transaction.atomic():
+            _bloquear(Proyecto, self.proyecto_id)
+            self._cargar()
+            deltas = []
+            for indice, operacion in enumerate(operaciones):
+                try:
+                    if not isinstance(operacion, dict):
+                        raise ErrorLote("Cada operación debe ser un objeto.")
+                    metodo = self.OPERACIONES.get(operacion.get('op'))
+                    if metodo is None:
+                        raise ErrorLote(f"Operación desconocida: '{operacion.get('op')}'.")
+                    deltas.append(metodo(self, operacion))
+                except ErrorLote as error:
+                    error.indice = indice
+                    raise
+            self._guardar()
+            # bulk_create/bulk_update no disparan señales: una sola versión por lote.
+            VersionDatos.incrementar(VersionDatos.Ambito.TABLERO, self.proyecto_id)
+        return [delta() for delta in deltas]
+
+
+# ==============================================================================
+# REGISTRO DE CAMBIOS DEL TABLERO
+# ==============================================================================
+# Cada escritura del tablero añade un renglón a CambioTablero con sus deltas y
+# la nueva versión del tablero (contador CAMBIOS_TABLERO, sin huecos). Un
+# cliente que conoce su versión pide solo lo posterior (`cambios_desde`) en
+# lugar de recargar el tablero completo, por ejemplo al reconectar el flujo
+# de eventos. Cada KANBAN_CAMBIOS_COMPACTAR_CADA versiones se guarda una
+# instantánea y se borran los renglones más viejos que
+# KANBAN_CAMBIOS_CONSERVAR versiones; quien se quedó más atrás recibe la
+# instantánea y los cambios posteriores a ella.
+
+def datos_tablero(proyecto_id):
+    """El tablero completo en el formato de jKanban (columnas con sus tareas)."""
+    boards = {}
+    columnas = KanbanColumna.objects.filter(proyecto_id=proyecto_id).values_list('id', 'titulo', 'icono', 'rango')
+    for columna_id, titulo, icono, rango in columnas:
+        boards[columna_id] = {'id': str(columna_id), 'title': titulo, 'icon': icono, 'rango': rango, 'item': []}
+
+    # Solo las columnas que usa el cliente, sin construir instancias de modelo.
+    tareas = KanbanTarea.objects.filter(columna_id__in=boards).values_list(
+        'columna_id', 'id', 'titulo', 'descripcion', 'rango'
+    )
+    for columna_id, tarea_id, titulo, descripcion, rango in tareas:
+        boards[columna_id]['item'].append({
+            'id': str(tarea_id), 'title': titulo, 'description': descripcion, 'rango': rango,
+        })
+    return list(boards.values())
+
+
+def tablero_serializado(proyecto_id):
+    """
+    (versión del registro, JSON del tablero) cacheados por versión TABLERO,
+    que sube con cualquier escritura del tablero (señales, lotes, rebalanceos):
+    abrir un tablero sin cambios es una lectura de caché.
+    """
+    version_cache, _ = VersionDatos.obtener(VersionDatos.Ambito.TABLERO, proyecto_id)
+    clave_cache = f"ventas:tablero:{proyecto_id}:{version_cache}"
+    entrada = cache.get(clave_cache)
+    if entrada is None:
+        version, datos = instantanea_tablero(proyecto_id)
+        entrada = (version, json.dumps(datos, cls=DjangoJSONEncoder))
+        cache.set(clave_cache, entrada, settings.CACHE_PAYLOAD_TTL)
+    return entrada
+
+
+def version_tablero(proyecto_id):
+    return VersionDatos.obtener(VersionDatos.Ambito.CAMBIOS_TABLERO, proyecto_id)[0]
+
+
+def registrar_cambio(proyecto_id, deltas, origen=''):
+    """
+    Registra `deltas` como la siguiente versión del tablero, los publica y
+    devuelve esa versión. Debe ser el último paso de la transacción que hace
+    el cambio: el contador queda bloqueado hasta el commit, así que las
+    versiones se confirman en orden y no quedan huecos visibles.
+    """
+    if not deltas:
+        return version_tablero(proyecto_id)
+    with transaction.atomic():
+        VersionDatos.incrementar(VersionDatos.Ambito.CAMBIOS_TABLERO, proyecto_id)
+        version = version_tablero(proyecto_id)
+        CambioTablero.objects.create(proyecto_id=proyecto_id, version=version, deltas=deltas)
+        if version % settings.KANBAN_CAMBIOS_COMPACTAR_CADA == 0:
+            compactar_cambios(proyecto_id, version)
+    publicar_tablero(proyecto_id, deltas, origen, version)
+    return version
+
+
+def compactar_cambios(proyecto_id, version):
+    """Guarda la instantánea del tablero en `version` y recorta el registro."""
+    InstantaneaTablero.objects.update_or_create(
+        proyecto_id=proyecto_id, defaults={'version': version, 'datos': datos_tablero(proyecto_id)}
+    )
+    CambioTablero.objects.filter(
+        proyecto_id=proyecto_id, version__lte=version - settings.KANBAN_CAMBIOS_CONSERVAR
+    ).delete()
+
+
+def instantanea_tablero(proyecto_id):
+    """
+    (versión, tablero) leídos de forma consistente: si entre las dos lecturas
+    de la versión se confirmó un cambio, se repite bloqueando el contador.
+    """
+    for _ in range(2):
+        version = version_tablero(proyecto_id)
+        datos = datos_tablero(proyecto_id)
+        if version_tablero(proyecto_id) == version:
+            return version, datos
+    with transaction.atomic():
+        VersionDatos.objects.select_for_update().filter(
+            ambito=VersionDatos.Ambito.CAMBIOS_TABLERO, clave=proyecto_id
+        ).exists()
+        return version_tablero(proyecto_id), datos_tablero(proyecto_id)
+
+
+def _cambios_posteriores(proyecto_id, version):
+    """Renglones posteriores a `version`, o None si el registro ya no los tiene todos."""
+    cambios = list(
+        CambioTablero.objects.filter(proyecto_id=proyecto_id, version__gt=version)
+        .order_by('version').values('version', 'deltas')
+    )
+    if cambios and cambios[0]['version'] != version + 1:
+        return None
+    return cambios
+
+
+def cambios_desde(proyecto_id, desde):
+    """
+    Lo necesario para llevar un tablero de la versión `desde` a la actual:
+    {'version', 'cambios'} si el registro lo cubre, o además 'instantanea'
+    (el tablero completo en una versión anterior a los cambios) si no.
+    """
+    actual = version_tablero(proyecto_id)
+    if 0 <= desde <= actual:
+        cambios = _cambios_posteriores(proyecto_id, desde)
+        if cambios is not None and (cambios or desde == actual):
+            return {'version': cambios[-1]['version'] if cambios else desde, 'cambios': cambios}
+
+    # El cliente se quedó más atrás de lo que conserva el registro (o trae
+    # una versión que no existe): instantánea más los cambios posteriores.
+    guardada = InstantaneaTablero.objects.filter(proyecto_id=proyecto_id).values_list('version', 'datos').first()
+    if guardada is not None:
+        cambios = _cambios_posteriores(proyecto_id, guardada[0])
+        if cambios is not None:
+            return {
+                'version': cambios[-1]['version'] if cambios else guardada[0],
+                'instantanea': guardada[1],
+                'cambios': cambios,
+            }
+    version, datos = instantanea_tablero(proyecto_id)
+    return {'version': version, 'instantanea': datos, 'cambios': []}
+
+
+# ==============================================================================
+# REBALANCEO EN SEGUNDO PLANO
+# ==============================================================================
+
+def rebalancear_columna(columna_id):
+    """Reescribe los rangos de las tareas de una columna; devuelve cuántas."""
+    with transaction.atomic():
+        if _bloquear(KanbanColumna, columna_id) is None:
+            return 0
+        return _rebalancear(KanbanTarea.objects.filter(columna_id=columna_id))
+
+
+def rebalancear_proyecto(proyecto_id):
+    """Reescribe los rangos de las columnas de un proyecto; devuelve cuántas."""
+    with transaction.atomic():
+        if _bloquear(Proyecto, proyecto_id) is None:
+            return 0
+        return _rebalancear(KanbanColumna.objects.filter(proyecto_id=proyecto_id))
+
+
+def rebalancear_pendientes(longitud=None):
+    """
+    Rebalancea los grupos que tienen algún rango más largo que `longitud`
+    (por defecto KANBAN_RANGO_LONGITUD_REBALANCEO). Devuelve
+    (columnas rebalanceadas, proyectos rebalanceados).
+    """
+    longitud = longitud or settings.KANBAN_RANGO_LONGITUD_REBALANCEO
+    columnas = set(
+        KanbanTarea.objects.annotate(longitud_rango=Length('rango'))
+        .filter(longitud_rango__gt=longitud).values_list('columna_id', flat=True)
+    )
+    proyectos = set(
+        KanbanColumna.objects.annotate(longitud_rango=Length('rango'))
+        .filter(longitud_rango__gt=longitud).values_list('proyecto_id', flat=True)
+    )
+    for columna_id in columnas:
+        rebalancear_columna(columna_id)
+    for proyecto_id in proyectos:
+        rebalancear_proyecto(proyecto_id)
+    return len(columnas), len(proyectos)
@@ -0,0 +1,38 @@
+# ventas/management/commands/generar_miniaturas.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.miniaturas import crear_pool, procesar_lote, tomar_pendientes, TAMANO_LOTE
+from ventas.models import ArchivoAdjunto
+
+class Command(BaseCommand):
+    help = 'Worker que genera las miniaturas WebP de los archivos adjuntos en un pool de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Procesa los pendientes y termina.')
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Adjuntos reclamados por vuelta.')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos del pool (por defecto MINIATURAS_PROCESOS).')
+        parser.add_argument('--reintentar-errores', action='store_true', help='Vuelve a encolar los adjuntos con error.')
+
+    def handle(self, *args, **options):
+        Estado = ArchivoAdjunto.EstadoMiniatura
+        if options['reintentar_errores']:
+            total = ArchivoAdjunto.objects.filter(estado_miniatura=Estado.ERROR).update(estado_miniatura=Estado.PENDIENTE)
+            self.stdout.write(f'{total} adjuntos con error vueltos a encolar.')
+
+        self.stdout.write('Esperando archivos para generar miniaturas...')
+        with crear_pool(options['procesos']) as pool:
+            while True:
+                archivos = tomar_pendientes(options['lote'])
+                if not archivos:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                resumen = procesar_lote(pool, archivos)
+                detalle = ', '.join(f'{Estado(estado).label}: {cantidad}' for estado, cantidad in resumen.items())
+                self.stdout.write(self.style.SUCCESS(f'{len(archivos)} adjuntos procesados ({detalle}).'))
@@ -0,0 +1,35 @@
+# ventas/management/commands/importar_prospectos.py
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ventas.importacion import ImportadorProspectos, ErrorImportacion, TAMANO_LOTE
+
+class Command(BaseCommand):
+    help = 'Importa prospectos desde un archivo CSV o XLSX, por lotes, usando el email como clave'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ruta', help='Ruta al archivo .csv o .xlsx.')
+        parser.add_argument('--usuario', required=True, help='Usuario al que se asignan los prospectos.')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Filas por lote de escritura.')
+        parser.add_argument('--max-errores', type=int, default=50, help='Errores por fila a mostrar.')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario '{options['usuario']}'.")
+
+        importador = ImportadorProspectos(usuario, tamano_lote=options['lote'])
+        try:
+            with open(options['ruta'], 'rb') as archivo:
+                resultado = importador.importar(archivo, options['ruta'])
+        except (OSError, ErrorImportacion) as e:
+            raise CommandError(str(e))
+
+        for numero, mensaje in resultado.errores[:options['max_errores']]:
+            self.stdout.write(self.style.WARNING(f'Fila {numero}: {mensaje}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.filas} filas en {resultado.segundos:.2f} s ({resultado.filas_por_segundo} filas/s): '
+            f'{resultado.creados} creados, {resultado.actualizados} actualizados, {len(resultado.errores)} con errores.'
+        ))
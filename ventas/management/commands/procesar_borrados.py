@@ -0,0 +1,27 @@
+# ventas/management/commands/procesar_borrados.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.almacenamiento import procesar_borrados_pendientes, TAMANO_LOTE_BORRADO
+
+class Command(BaseCommand):
+    help = 'Worker que borra del almacenamiento los objetos encolados en BorradoPendiente, por lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Vacía la cola y termina.')
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE_BORRADO, help='Claves por llamada a delete_objects (máx. 1000).')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Esperando objetos por borrar...')
+        while True:
+            borrados, fallidos = procesar_borrados_pendientes(options['lote'])
+            if borrados or fallidos:
+                estilo = self.style.WARNING if fallidos else self.style.SUCCESS
+                self.stdout.write(estilo(f'{borrados} objetos borrados, {fallidos} con error.'))
+                continue
+            if options['una_vez']:
+                break
+            time.sleep(options['intervalo'])
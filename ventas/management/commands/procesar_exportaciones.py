@@ -0,0 +1,39 @@
+# ventas/management/commands/procesar_exportaciones.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.exportacion import limpiar_exportaciones_vencidas, tomar_siguiente_trabajo, procesar_trabajo_exportacion
+from ventas.models import TrabajoExportacion
+
+class Command(BaseCommand):
+    help = 'Worker que consume la cola de exportaciones de prospectos (TrabajoExportacion)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Procesa los pendientes y termina.')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--intervalo-limpieza', type=float, default=3600.0, help='Segundos entre limpiezas de exportaciones vencidas.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Esperando trabajos de exportación...')
+        ultima_limpieza = None
+        while True:
+            if ultima_limpieza is None or time.monotonic() - ultima_limpieza >= options['intervalo_limpieza']:
+                borrados = limpiar_exportaciones_vencidas()
+                if borrados:
+                    self.stdout.write(f'{borrados} exportaciones vencidas borradas.')
+                ultima_limpieza = time.monotonic()
+
+            trabajo = tomar_siguiente_trabajo()
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            trabajo = procesar_trabajo_exportacion(trabajo)
+            if trabajo.estado == TrabajoExportacion.Estado.COMPLETADO:
+                self.stdout.write(self.style.SUCCESS(f'Exportación #{trabajo.pk}: {trabajo.filas_procesadas} filas.'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Exportación #{trabajo.pk} falló: {trabajo.mensaje_error}'))
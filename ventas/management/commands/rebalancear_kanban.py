@@ -0,0 +1,26 @@
+# ventas/management/commands/rebalancear_kanban.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.kanban import rebalancear_pendientes
+
+class Command(BaseCommand):
+    help = 'Worker que reescribe los rangos de las tareas y columnas Kanban cuando se alargan demasiado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Hace una pasada y termina.')
+        parser.add_argument('--intervalo', type=float, default=300.0, help='Segundos entre pasadas.')
+        parser.add_argument('--longitud', type=int, default=None, help='Longitud de rango a partir de la cual se rebalancea.')
+
+    def handle(self, *args, **options):
+        while True:
+            columnas, proyectos = rebalancear_pendientes(options['longitud'])
+            if columnas or proyectos:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{columnas} columnas y {proyectos} tableros rebalanceados.'
+                ))
+            if options['una_vez']:
+                break
+            time.sleep(options['intervalo'])
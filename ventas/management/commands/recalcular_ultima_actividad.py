@@ -0,0 +1,27 @@
+# ventas/management/commands/recalcular_ultima_actividad.py
+
+from django.core.management.base import BaseCommand
+
+from ventas.models import Prospecto
+
+class Command(BaseCommand):
+    help = 'Recalcula Prospecto.ultima_actividad a partir de sus interacciones, por lotes de IDs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Cantidad de prospectos por UPDATE.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        ids = Prospecto.objects.order_by('pk').values_list('pk', flat=True)
+        ultimo_id, total = 0, 0
+        while True:
+            limite = list(ids.filter(pk__gt=ultimo_id)[lote - 1:lote])
+            hasta = limite[0] if limite else None
+            rango = Prospecto.objects.filter(pk__gt=ultimo_id)
+            if hasta is not None:
+                rango = rango.filter(pk__lte=hasta)
+            total += Prospecto.recalcular_ultima_actividad(rango)
+            if hasta is None:
+                break
+            ultimo_id = hasta
+        self.stdout.write(self.style.SUCCESS(f'Última actividad recalculada para {total} prospectos.'))
@@ -0,0 +1,56 @@
+# ventas/management/commands/recomprimir_diagramas.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from ventas.compresion import PREFIJOS, TAMANO_MINIMO
+from ventas.models import DiagramaProyecto
+
+CAMPOS = ['codigo', 'svg_representation']
+
+
+def _pendiente(campo, prefijo):
+    """El campo no está guardado con `prefijo` y la compresión le aplica."""
+    otros = Q()
+    for otro in PREFIJOS.values():
+        if otro != prefijo:
+            otros |= Q(**{f'{campo}__startswith': otro})
+    return ~Q(**{f'{campo}__startswith': prefijo}) & (Q(**{f'longitud_{campo}__gte': TAMANO_MINIMO}) | otros)
+
+
+class Command(BaseCommand):
+    help = 'Comprime por lotes el código y el SVG de los diagramas guardados sin comprimir o con otro algoritmo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Cantidad de diagramas por transacción.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        prefijo = PREFIJOS[settings.COMPRESION_ALGORITMO]
+        condicion = Q()
+        for campo in CAMPOS:
+            condicion |= _pendiente(campo, prefijo)
+        # Los filtros ven el valor guardado en la columna (comprimido o no).
+        pendientes = DiagramaProyecto.objects.annotate(
+            **{f'longitud_{campo}': Length(campo) for campo in CAMPOS}
+        ).filter(condicion).order_by('pk').values_list('pk', flat=True)
+
+        ultimo_id, total = 0, 0
+        while True:
+            ids = list(pendientes.filter(pk__gt=ultimo_id)[:lote])
+            if not ids:
+                break
+            # Se bloquean las filas para no pisar un guardado simultáneo;
+            # bulk_update() las vuelve a escribir comprimidas sin tocar
+            # fecha_actualizacion ni la versión del diagrama (el contenido es el mismo).
+            with transaction.atomic():
+                diagramas = list(
+                    DiagramaProyecto.objects.select_for_update().filter(pk__in=ids).only('pk', *CAMPOS)
+                )
+                DiagramaProyecto.objects.bulk_update(diagramas, CAMPOS)
+            total += len(diagramas)
+            ultimo_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'{total} diagramas recomprimidos con {settings.COMPRESION_ALGORITMO}.'))
@@ -0,0 +1,24 @@
+# ventas/management/commands/reconstruir_contadores_estado.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from ventas.models import Prospecto, ContadorEstadoProspecto
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero la tabla de contadores de prospectos por usuario y estado'
+
+    def handle(self, *args, **options):
+        conteos = (
+            Prospecto.objects.order_by()
+            .values('asignado_a', 'estado')
+            .annotate(total=Count('id'))
+        )
+        with transaction.atomic():
+            ContadorEstadoProspecto.objects.all().delete()
+            ContadorEstadoProspecto.objects.bulk_create([
+                ContadorEstadoProspecto(asignado_a_id=item['asignado_a'], estado=item['estado'], total=item['total'])
+                for item in conteos
+            ])
+        self.stdout.write(self.style.SUCCESS(f'Contadores reconstruidos: {len(conteos)} filas.'))
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_contadores(apps, schema_editor):
+    Prospecto = apps.get_model('ventas', 'Prospecto')
+    ContadorEstadoProspecto = apps.get_model('ventas', 'ContadorEstadoProspecto')
+    conteos = Prospecto.objects.order_by().values('asignado_a', 'estado').annotate(total=Count('id'))
+    ContadorEstadoProspecto.objects.bulk_create([
+        ContadorEstadoProspecto(asignado_a_id=item['asignado_a'], estado=item['estado'], total=item['total'])
+        for item in conteos
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0002_kanbancolumna_icono'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorEstadoProspecto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('NUEVO', 'Prospecto Inicial'), ('CONTACTADO', 'Primer Contacto'), ('CALIFICANDO', 'En Negociación'), ('GANADO', 'Cliente Cerrado'), ('PERDIDO', 'Rechazado')], max_length=20)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador de Estado',
+                'verbose_name_plural': 'Contadores de Estado',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='prospecto',
+            index=models.Index(fields=['asignado_a', 'estado', 'fecha_creacion'], name='prospecto_asig_estado_fecha'),
+        ),
+        migrations.AddField(
+            model_name='contadorestadoprospecto',
+            name='asignado_a',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contadores_estado', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='contadorestadoprospecto',
+            unique_together={('asignado_a', 'estado')},
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
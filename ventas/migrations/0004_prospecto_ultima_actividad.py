@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:43
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def poblar_ultima_actividad(apps, schema_editor):
+    Prospecto = apps.get_model('ventas', 'Prospecto')
+    Interaccion = apps.get_model('ventas', 'Interaccion')
+    ultima_interaccion = Interaccion.objects.filter(
+        prospecto=OuterRef('pk')
+    ).order_by('-fecha').values('fecha')[:1]
+    Prospecto.objects.update(
+        ultima_actividad=Coalesce(Subquery(ultima_interaccion), F('fecha_creacion'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0003_contadorestadoprospecto_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prospecto',
+            name='ultima_actividad',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Última Actividad'),
+        ),
+        migrations.RunPython(poblar_ultima_actividad, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='prospecto',
+            index=models.Index(condition=models.Q(('estado__in', ['GANADO', 'PERDIDO']), _negated=True), fields=['asignado_a', 'ultima_actividad'], name='prospecto_asig_inactivo'),
+        ),
+        migrations.AddIndex(
+            model_name='prospecto',
+            index=models.Index(condition=models.Q(('estado__in', ['GANADO', 'PERDIDO']), _negated=True), fields=['ultima_actividad'], name='prospecto_inactivo'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:52
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+
+# El vector se calcula en la BD para cubrir también QuerySet.update() y
+# bulk_create(). 'simple' evita que se apliquen raíces a nombres propios.
+SQL_CREAR = """
+CREATE OR REPLACE FUNCTION ventas_prospecto_busqueda_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda :=
+        setweight(to_tsvector('simple', unaccent(coalesce(NEW.nombre_completo, ''))), 'A') ||
+        setweight(to_tsvector('simple', unaccent(coalesce(NEW.empresa, ''))), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.email, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ventas_prospecto_busqueda
+    BEFORE INSERT OR UPDATE OF nombre_completo, empresa, email ON ventas_prospecto
+    FOR EACH ROW EXECUTE FUNCTION ventas_prospecto_busqueda_trigger();
+
+UPDATE ventas_prospecto SET busqueda =
+    setweight(to_tsvector('simple', unaccent(coalesce(nombre_completo, ''))), 'A') ||
+    setweight(to_tsvector('simple', unaccent(coalesce(empresa, ''))), 'B') ||
+    setweight(to_tsvector('simple', coalesce(email, '')), 'C');
+
+CREATE INDEX IF NOT EXISTS prospecto_busqueda_gin ON ventas_prospecto USING gin (busqueda);
+CREATE INDEX IF NOT EXISTS prospecto_nombre_trgm ON ventas_prospecto USING gin (nombre_completo gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS prospecto_email_trgm ON ventas_prospecto USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS prospecto_empresa_trgm ON ventas_prospecto USING gin (empresa gin_trgm_ops);
+"""
+
+SQL_BORRAR = """
+DROP INDEX IF EXISTS prospecto_empresa_trgm;
+DROP INDEX IF EXISTS prospecto_email_trgm;
+DROP INDEX IF EXISTS prospecto_nombre_trgm;
+DROP INDEX IF EXISTS prospecto_busqueda_gin;
+DROP TRIGGER IF EXISTS ventas_prospecto_busqueda ON ventas_prospecto;
+DROP FUNCTION IF EXISTS ventas_prospecto_busqueda_trigger();
+"""
+
+
+def crear_busqueda(apps, schema_editor):
+    # Los índices GIN y el trigger solo existen en PostgreSQL; en SQLite la
+    # búsqueda usa icontains (ver ventas/busqueda.py).
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SQL_CREAR)
+
+
+def borrar_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SQL_BORRAR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0004_prospecto_ultima_actividad'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.AddField(
+            model_name='prospecto',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(crear_busqueda, borrar_busqueda),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0006_trabajoexportacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='duracion_transferencia',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Duración de la Transferencia (s)'),
+        ),
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='hash_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='tamano',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Tamaño (bytes)'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0007_archivoadjunto_metricas_transferencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorradoPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=1024)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Borrado Pendiente',
+                'verbose_name_plural': 'Borrados Pendientes',
+                'ordering': ['id'],
+            },
+        ),
+    ]
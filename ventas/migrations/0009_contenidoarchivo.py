@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0008_borradopendiente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContenidoArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash_sha256', models.CharField(max_length=64, unique=True)),
+                ('ruta', models.CharField(max_length=100)),
+                ('tamano', models.BigIntegerField()),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Contenido de Archivo',
+                'verbose_name_plural': 'Contenidos de Archivos',
+            },
+        ),
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='contenido',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='adjuntos', to='ventas.contenidoarchivo'),
+        ),
+    ]
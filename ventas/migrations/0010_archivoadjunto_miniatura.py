@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0009_contenidoarchivo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='estado_miniatura',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En Proceso'), ('LISTA', 'Lista'), ('NO_APLICA', 'No Aplica'), ('ERROR', 'Error')], default='PENDIENTE', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='miniatura',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.AddIndex(
+            model_name='archivoadjunto',
+            index=models.Index(fields=['estado_miniatura', 'id'], name='adjunto_miniatura_cola'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0010_archivoadjunto_miniatura'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recordatorio',
+            index=models.Index(fields=['fecha_recordatorio', 'completado'], name='recordatorio_fecha_estado'),
+        ),
+    ]
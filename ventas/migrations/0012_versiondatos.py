@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0011_recordatorio_fecha_estado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionDatos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambito', models.CharField(choices=[('CALENDARIO', 'Calendario'), ('TABLERO', 'Tablero Kanban'), ('DIAGRAMA', 'Diagrama')], max_length=20)),
+                ('clave', models.PositiveBigIntegerField()),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('fecha_modificacion', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Versión de Datos',
+                'verbose_name_plural': 'Versiones de Datos',
+                'unique_together': {('ambito', 'clave')},
+            },
+        ),
+    ]
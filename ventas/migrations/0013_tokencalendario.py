@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0012_versiondatos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenCalendario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now=True)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='token_calendario', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Token de Calendario',
+                'verbose_name_plural': 'Tokens de Calendario',
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:04
+
+from itertools import groupby
+
+from django.db import migrations, models
+
+from ventas.rangos import rangos_distribuidos
+
+
+def _asignar_rangos(modelo, campo_grupo):
+    filas = modelo.objects.order_by(campo_grupo, 'orden', 'id').only('id', campo_grupo, 'orden')
+    cambios = []
+    for _, grupo in groupby(filas.iterator(chunk_size=2000), key=lambda fila: getattr(fila, campo_grupo)):
+        grupo = list(grupo)
+        for fila, rango in zip(grupo, rangos_distribuidos(len(grupo))):
+            fila.rango = rango
+            cambios.append(fila)
+        if len(cambios) >= 2000:
+            modelo.objects.bulk_update(cambios, ['rango'])
+            cambios = []
+    modelo.objects.bulk_update(cambios, ['rango'])
+
+
+def poblar_rangos(apps, schema_editor):
+    """Convierte el `orden` entero actual en rangos, respetando el orden existente."""
+    _asignar_rangos(apps.get_model('ventas', 'KanbanColumna'), 'proyecto_id')
+    _asignar_rangos(apps.get_model('ventas', 'KanbanTarea'), 'columna_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0013_tokencalendario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kanbancolumna',
+            name='rango',
+            field=models.CharField(default='', help_text='Posición fraccionaria de la columna en el tablero (ver ventas/rangos.py).', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='kanbantarea',
+            name='rango',
+            field=models.CharField(default='', help_text='Posición fraccionaria de la tarea dentro de la columna (ver ventas/rangos.py).', max_length=64),
+        ),
+        migrations.RunPython(poblar_rangos, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='kanbancolumna',
+            options={'ordering': ['rango', 'id'], 'verbose_name': 'Columna Kanban', 'verbose_name_plural': 'Columnas Kanban'},
+        ),
+        migrations.AlterModelOptions(
+            name='kanbantarea',
+            options={'ordering': ['rango', 'id'], 'verbose_name': 'Tarea Kanban', 'verbose_name_plural': 'Tareas Kanban'},
+        ),
+        migrations.RemoveField(
+            model_name='kanbancolumna',
+            name='orden',
+        ),
+        migrations.RemoveField(
+            model_name='kanbantarea',
+            name='orden',
+        ),
+        migrations.AddIndex(
+            model_name='kanbancolumna',
+            index=models.Index(fields=['proyecto', 'rango'], name='kanbancolumna_proyecto_rango'),
+        ),
+        migrations.AddIndex(
+            model_name='kanbantarea',
+            index=models.Index(fields=['columna', 'rango'], name='kanbantarea_columna_rango'),
+        ),
+    ]
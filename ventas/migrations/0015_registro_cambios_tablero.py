@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0014_kanban_rango'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='versiondatos',
+            name='ambito',
+            field=models.CharField(choices=[('CALENDARIO', 'Calendario'), ('TABLERO', 'Tablero Kanban'), ('DIAGRAMA', 'Diagrama'), ('CAMBIOS_TABLERO', 'Registro de Cambios del Tablero')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='InstantaneaTablero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('datos', models.JSONField()),
+                ('fecha', models.DateTimeField(auto_now=True)),
+                ('proyecto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='instantanea_tablero', to='ventas.proyecto')),
+            ],
+            options={
+                'verbose_name': 'Instantánea del Tablero',
+                'verbose_name_plural': 'Instantáneas del Tablero',
+            },
+        ),
+        migrations.CreateModel(
+            name='CambioTablero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('deltas', models.JSONField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('proyecto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios_tablero', to='ventas.proyecto')),
+            ],
+            options={
+                'verbose_name': 'Cambio del Tablero',
+                'verbose_name_plural': 'Cambios del Tablero',
+                'ordering': ['version'],
+                'unique_together': {('proyecto', 'version')},
+            },
+        ),
+    ]
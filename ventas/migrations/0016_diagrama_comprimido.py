@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:17
+
+import ventas.compresion
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0015_registro_cambios_tablero'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='diagramaproyecto',
+            name='codigo',
+            field=ventas.compresion.TextoComprimidoField(help_text='Código del diagrama en formato JSON (JointJS)'),
+        ),
+        migrations.AlterField(
+            model_name='diagramaproyecto',
+            name='svg_representation',
+            field=ventas.compresion.TextoComprimidoField(blank=True, help_text='El código SVG del diagrama para la exportación a PDF.', verbose_name='Representación SVG'),
+        ),
+    ]
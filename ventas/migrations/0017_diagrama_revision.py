@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0016_diagrama_comprimido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagramaproyecto',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='diagramaproyecto',
+            name='svg_revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0017_diagrama_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivoadjunto',
+            name='inicio_miniatura',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
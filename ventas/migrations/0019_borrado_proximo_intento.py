@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0018_adjunto_inicio_miniatura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borradopendiente',
+            name='proximo_intento',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='borradopendiente',
+            index=models.Index(fields=['proximo_intento'], name='borrado_proximo_intento'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0019_borrado_proximo_intento'),
+    ]
+
+    operations = [
+        # Los contenidos existentes ya se subieron: entran como LISTO.
+        migrations.AddField(
+            model_name='contenidoarchivo',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Subida en curso'), ('LISTO', 'Almacenado')], default='LISTO', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='contenidoarchivo',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Subida en curso'), ('LISTO', 'Almacenado')], default='PENDIENTE', max_length=20),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:44
+
+from django.db import migrations
+
+
+# unaccent() es STABLE (depende del search_path), así que no puede usarse en un
+# índice. El envoltorio fija el diccionario con su esquema y se declara
+# IMMUTABLE; la búsqueda compara el texto sin acentos con
+# ventas_sin_acentos(columna), que es exactamente la expresión indexada.
+SQL_CREAR = """
+CREATE OR REPLACE FUNCTION ventas_sin_acentos(text) RETURNS text AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+DROP INDEX IF EXISTS prospecto_nombre_trgm;
+DROP INDEX IF EXISTS prospecto_email_trgm;
+DROP INDEX IF EXISTS prospecto_empresa_trgm;
+CREATE INDEX IF NOT EXISTS prospecto_nombre_trgm ON ventas_prospecto USING gin (ventas_sin_acentos(nombre_completo) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS prospecto_email_trgm ON ventas_prospecto USING gin (ventas_sin_acentos(email) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS prospecto_empresa_trgm ON ventas_prospecto USING gin (ventas_sin_acentos(empresa) gin_trgm_ops);
+"""
+
+SQL_BORRAR = """
+DROP INDEX IF EXISTS prospecto_nombre_trgm;
+DROP INDEX IF EXISTS prospecto_email_trgm;
+DROP INDEX IF EXISTS prospecto_empresa_trgm;
+CREATE INDEX IF NOT EXISTS prospecto_nombre_trgm ON ventas_prospecto USING gin (nombre_completo gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS prospecto_email_trgm ON ventas_prospecto USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS prospecto_empresa_trgm ON ventas_prospecto USING gin (empresa gin_trgm_ops);
+DROP FUNCTION IF EXISTS ventas_sin_acentos(text);
+"""
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SQL_CREAR)
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SQL_BORRAR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0020_contenido_estado'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
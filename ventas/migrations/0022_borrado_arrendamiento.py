@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0021_trigramas_sin_acentos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borradopendiente',
+            name='reclamado_hasta',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='borradopendiente',
+            name='rescatado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='borradopendiente',
+            name='clave',
+            field=models.CharField(db_index=True, max_length=1024),
+        ),
+    ]
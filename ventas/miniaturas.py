@@ -0,0 +1,166 @@
+# ventas/miniaturas.py
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .almacenamiento import clave_s3, encolar_borrado, nombre_miniatura, obtener_cliente_s3
+from .models import ArchivoAdjunto
+
+
+# ==============================================================================
+# MINIATURAS DE ARCHIVOS ADJUNTOS
+# ==============================================================================
+# Rasterizar imágenes y PDFs es trabajo de CPU, así que se reparte en un pool
+# de procesos. El proceso principal solo descarga los originales, sube las
+# miniaturas WebP y actualiza la base de datos.
+
+EXTENSIONES_IMAGEN = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+EXTENSIONES_PDF = {'.pdf'}
+TAMANO_LOTE = 20
+
+Estado = ArchivoAdjunto.EstadoMiniatura
+
+
+def admite_miniatura(nombre):
+    extension = os.path.splitext(nombre)[1].lower()
+    return extension in EXTENSIONES_IMAGEN or extension in EXTENSIONES_PDF
+
+
+def generar_miniatura(datos, nombre, ancho, alto, calidad):
+    """
+    Devuelve los bytes WebP de la miniatura, o None si el formato no se
+    puede previsualizar. Se ejecuta en un proceso del pool.
+    """
+    from PIL import Image, ImageOps
+
+    extension = os.path.splitext(nombre)[1].lower()
+    if extension in EXTENSIONES_PDF:
+        try:
+            import pypdfium2
+        except ImportError:
+            return None
+        documento = pypdfium2.PdfDocument(datos)
+        try:
+            pagina = documento[0]
+            # Se renderiza a la escala justa para el ancho de la miniatura.
+            escala = ancho / pagina.get_width()
+            imagen = pagina.render(scale=escala).to_pil()
+        finally:
+            documento.close()
+    elif extension in EXTENSIONES_IMAGEN:
+        imagen = Image.open(io.BytesIO(datos))
+        imagen.draft('RGB', (ancho, alto))  # Decodifica los JPEG ya reducidos.
+        imagen = ImageOps.exif_transpose(imagen)
+    else:
+        return None
+
+    if imagen.mode not in ('RGB', 'RGBA'):
+        imagen = imagen.convert('RGBA' if 'A' in imagen.getbands() else 'RGB')
+    imagen.thumbnail((ancho, alto))
+    salida = io.BytesIO()
+    imagen.save(salida, 'WEBP', quality=calidad, method=4)
+    return salida.getvalue()
+
+
+def tomar_pendientes(tamano_lote=TAMANO_LOTE):
+    """
+    Reclama un lote de adjuntos pendientes marcándolos EN_PROCESO. También
+    retoma los EN_PROCESO de un worker que murió: los reclamados hace más de
+    MINIATURAS_TIMEOUT_PROCESO (o antes de que existiera inicio_miniatura).
+    """
+    ahora = timezone.now()
+    limite = ahora - timedelta(seconds=settings.MINIATURAS_TIMEOUT_PROCESO)
+    abandonados = Q(estado_miniatura=Estado.EN_PROCESO) & (
+        Q(inicio_miniatura__lt=limite) | Q(inicio_miniatura__isnull=True)
+    )
+    with transaction.atomic():
+        archivos = list(
+            ArchivoAdjunto.objects.select_for_update(skip_locked=True)
+            .filter(Q(estado_miniatura=Estado.PENDIENTE) | abandonados)
+            .order_by('id')[:tamano_lote]
+        )
+        ArchivoAdjunto.objects.filter(pk__in=[a.pk for a in archivos]).update(
+            estado_miniatura=Estado.EN_PROCESO, inicio_miniatura=ahora
+        )
+    return archivos
+
+
+def _descargar(nombre):
+    buffer = io.BytesIO()
+    obtener_cliente_s3().download_fileobj(settings.AWS_STORAGE_BUCKET_NAME, clave_s3(nombre), buffer)
+    return buffer.getvalue()
+
+
+def _miniatura_existente(archivo):
+    """Si el contenido está deduplicado, otro adjunto puede tener ya su miniatura."""
+    if not archivo.contenido_id:
+        return None
+    return (
+        ArchivoAdjunto.objects.filter(contenido_id=archivo.contenido_id, estado_miniatura=Estado.LISTA)
+        .exclude(miniatura='')
+        .values_list('miniatura', flat=True)
+        .first()
+    )
+
+
+def _marcar(archivo, estado, miniatura=''):
+    actualizados = ArchivoAdjunto.objects.filter(pk=archivo.pk).update(estado_miniatura=estado, miniatura=miniatura)
+    # El adjunto se borró mientras se generaba: la miniatura recién subida sobra.
+    if not actualizados and miniatura and not ArchivoAdjunto.objects.filter(miniatura=miniatura).exists():
+        encolar_borrado(miniatura)
+
+
+def procesar_lote(pool, archivos):
+    """Genera las miniaturas de `archivos` en `pool`; devuelve {estado: cantidad}."""
+    resumen = {}
+    tareas = []
+    for archivo in archivos:
+        existente = _miniatura_existente(archivo)
+        if existente:
+            _marcar(archivo, Estado.LISTA, existente)
+            resumen[Estado.LISTA] = resumen.get(Estado.LISTA, 0) + 1
+            continue
+        if not admite_miniatura(archivo.nombre) or (archivo.tamano or 0) > settings.MINIATURAS_TAMANO_MAXIMO:
+            _marcar(archivo, Estado.NO_APLICA)
+            resumen[Estado.NO_APLICA] = resumen.get(Estado.NO_APLICA, 0) + 1
+            continue
+        try:
+            datos = _descargar(archivo.archivo.name)
+        except Exception:
+            _marcar(archivo, Estado.ERROR)
+            resumen[Estado.ERROR] = resumen.get(Estado.ERROR, 0) + 1
+            continue
+        futuro = pool.submit(
+            generar_miniatura, datos, archivo.nombre,
+            settings.MINIATURAS_ANCHO, settings.MINIATURAS_ALTO, settings.MINIATURAS_CALIDAD
+        )
+        tareas.append((archivo, futuro))
+
+    for archivo, futuro in tareas:
+        try:
+            webp = futuro.result()
+            if webp is None:
+                estado, miniatura = Estado.NO_APLICA, ''
+            else:
+                miniatura = nombre_miniatura(archivo.archivo.name)
+                obtener_cliente_s3().upload_fileobj(
+                    io.BytesIO(webp), settings.AWS_STORAGE_BUCKET_NAME, clave_s3(miniatura),
+                    ExtraArgs={'ContentType': 'image/webp'}
+                )
+                estado = Estado.LISTA
+        except Exception:
+            estado, miniatura = Estado.ERROR, ''
+        _marcar(archivo, estado, miniatura)
+        resumen[estado] = resumen.get(estado, 0) + 1
+    return resumen
+
+
+def crear_pool(procesos=None):
+    return ProcessPoolExecutor(max_workers=procesos or settings.MINIATURAS_PROCESOS)
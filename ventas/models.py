@@ -1,9 +1,19 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Sum, Q, Subquery, OuterRef
+from django.db.models.functions import Coalesce
+import hashlib
+import json
+import secrets
+from datetime import timedelta
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from django.urls import reverse
 from django.core.validators import RegexValidator
 
+from .compresion import TextoComprimidoField
+
 
 # --- Validadores ---
 # Validador para asegurar un formato de teléfono básico.
@@ -123,13 +133,57 @@ class Prospecto(models.Model):
     
     fecha_creacion = models.DateTimeField(default=timezone.now)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    # Fecha de la última interacción o, si nunca se contactó, la de creación.
+    # Se mantiene desde las señales de Interaccion (ver ventas/signals.py).
+    ultima_actividad = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Última Actividad")
+
+    # Vector de búsqueda (nombre, empresa, email sin acentos). En PostgreSQL lo
+    # mantiene un trigger de la BD; ver ventas/busqueda.py y la migración 0005.
+    busqueda = SearchVectorField(null=True, editable=False)
     
     class Meta:
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Soporta el KPI de "prospectos nuevos" del dashboard (estado + ventana de fechas).
+            models.Index(fields=['asignado_a', 'estado', 'fecha_creacion'], name='prospecto_asig_estado_fecha'),
+            # Panel de "prospectos inactivos": solo prospectos abiertos, por antigüedad de actividad.
+            models.Index(
+                fields=['asignado_a', 'ultima_actividad'], name='prospecto_asig_inactivo',
+                condition=~Q(estado__in=['GANADO', 'PERDIDO']),
+            ),
+            models.Index(
+                fields=['ultima_actividad'], name='prospecto_inactivo',
+                condition=~Q(estado__in=['GANADO', 'PERDIDO']),
+            ),
+        ]
 
     def __str__(self):
         return self.nombre_completo
 
+    @property
+    def ultima_interaccion(self):
+        """Fecha de la última interacción, o None si el prospecto nunca fue contactado."""
+        if self.ultima_actividad and self.ultima_actividad != self.fecha_creacion:
+            return self.ultima_actividad
+        return None
+
+    @property
+    def dias_inactivo(self):
+        return (timezone.now() - self.ultima_actividad).days
+
+    @classmethod
+    def recalcular_ultima_actividad(cls, queryset=None):
+        """Recalcula `ultima_actividad` con un solo UPDATE sobre `queryset`."""
+        if queryset is None:
+            queryset = cls.objects.all()
+        ultima_interaccion = Interaccion.objects.filter(
+            prospecto=OuterRef('pk')
+        ).order_by('-fecha').values('fecha')[:1]
+        return queryset.order_by().update(
+            ultima_actividad=Coalesce(Subquery(ultima_interaccion), F('fecha_creacion'))
+        )
+
     def get_absolute_url(self):
         return reverse('prospecto-detail', kwargs={'pk': self.pk})
 
@@ -143,6 +197,58 @@ class Prospecto(models.Model):
         }
         return colores.get(self.estado, 'light')
 
+class ContadorEstadoProspecto(models.Model):
+    """
+    Conteo desnormalizado de prospectos por usuario asignado y estado.
+    Lo mantienen las señales de ventas/signals.py y se reconstruye con
+    `python manage.py reconstruir_contadores_estado`.
+    """
+    asignado_a = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='contadores_estado'
+    )
+    estado = models.CharField(max_length=20, choices=Prospecto.Estado.choices)
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('asignado_a', 'estado')
+        verbose_name = "Contador de Estado"
+        verbose_name_plural = "Contadores de Estado"
+
+    def __str__(self):
+        return f"{self.asignado_a or 'Sin asignar'} - {self.estado}: {self.total}"
+
+    @classmethod
+    def ajustar(cls, usuario_id, estado, delta):
+        """Suma `delta` al contador (usuario, estado), creándolo si no existe."""
+        if not delta:
+            return
+        # Se actualiza por pk para no sumar dos veces si existieran filas duplicadas
+        # con asignado_a NULL (la restricción única no aplica a NULL).
+        pk = cls.objects.filter(asignado_a_id=usuario_id, estado=estado).values_list('pk', flat=True).first()
+        if pk is None:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(asignado_a_id=usuario_id, estado=estado, total=delta)
+                return
+            except IntegrityError:
+                pk = cls.objects.filter(asignado_a_id=usuario_id, estado=estado).values_list('pk', flat=True).first()
+        cls.objects.filter(pk=pk).update(total=F('total') + delta)
+
+    @classmethod
+    def conteos_por_estado(cls, user):
+        """
+        Devuelve {estado: total} para los prospectos visibles por `user`
+        (el superusuario ve todos). Lee como máximo usuarios x estados filas.
+        """
+        contadores = cls.objects.all()
+        if not user.is_superuser:
+            contadores = contadores.filter(asignado_a=user)
+        return {
+            item['estado']: item['suma']
+            for item in contadores.values('estado').annotate(suma=Sum('total')).order_by('estado')
+            if item['suma']
+        }
+
 # ==============================================================================
 # 2. MODELOS DE RELACIÓN (TABLAS INTERMEDIAS)
 # ==============================================================================
@@ -210,12 +316,23 @@ class Recordatorio(models.Model):
 
     class Meta:
         ordering = ['-fecha_recordatorio']
+        indexes = [
+            # El calendario pide rangos de fechas (start/end de FullCalendar).
+            models.Index(fields=['fecha_recordatorio', 'completado'], name='recordatorio_fecha_estado'),
+        ]
 
     def __str__(self):
         return self.titulo
     
 class ArchivoAdjunto(models.Model):
     """Permite adjuntar archivos a un prospecto."""
+    class EstadoMiniatura(models.TextChoices):
+        PENDIENTE = 'PENDIENTE', 'Pendiente'
+        EN_PROCESO = 'EN_PROCESO', 'En Proceso'
+        LISTA = 'LISTA', 'Lista'
+        NO_APLICA = 'NO_APLICA', 'No Aplica'
+        ERROR = 'ERROR', 'Error'
+
     prospecto = models.ForeignKey(
         'Prospecto', 
         on_delete=models.CASCADE, 
@@ -233,13 +350,76 @@ class ArchivoAdjunto(models.Model):
     
     fecha_subida = models.DateTimeField(auto_now_add=True)
 
+    # Contenido deduplicado al que apunta `archivo` (vacío en adjuntos antiguos
+    # o subidos directamente al almacenamiento).
+    contenido = models.ForeignKey(
+        'ContenidoArchivo',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='adjuntos'
+    )
+
+    # Métricas de la transferencia (ver ventas/almacenamiento.py).
+    tamano = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name="Tamaño (bytes)")
+    hash_sha256 = models.CharField(max_length=64, blank=True, editable=False, verbose_name="SHA-256")
+    duracion_transferencia = models.FloatField(null=True, blank=True, editable=False, verbose_name="Duración de la Transferencia (s)")
+
+    # Vista previa WebP generada por `python manage.py generar_miniaturas`, guardada
+    # junto al original ('<archivo>.miniatura.webp').
+    miniatura = models.CharField(max_length=150, blank=True, editable=False)
+    estado_miniatura = models.CharField(
+        max_length=20,
+        choices=EstadoMiniatura.choices,
+        default=EstadoMiniatura.PENDIENTE,
+        editable=False
+    )
+    # Cuándo lo reclamó el worker: un EN_PROCESO demasiado antiguo se retoma.
+    inicio_miniatura = models.DateTimeField(null=True, blank=True, editable=False)
+
     class Meta:
         ordering = ['-fecha_subida']
+        indexes = [
+            # El worker de miniaturas toma los pendientes.
+            models.Index(fields=['estado_miniatura', 'id'], name='adjunto_miniatura_cola'),
+        ]
         verbose_name = "Archivo Adjunto"
         verbose_name_plural = "Archivos Adjuntos"
 
     def __str__(self):
         return self.nombre
+
+    @property
+    def mb_por_segundo(self):
+        if not self.tamano or not self.duracion_transferencia:
+            return None
+        return round(self.tamano / self.duracion_transferencia / (1024 * 1024), 2)
+
+
+class ContenidoArchivo(models.Model):
+    """
+    Objeto del almacenamiento identificado por su SHA-256. Varios adjuntos con
+    el mismo contenido comparten un único objeto; `referencias` cuenta cuántos.
+    """
+    class Estado(models.TextChoices):
+        PENDIENTE = 'PENDIENTE', 'Subida en curso'
+        LISTO = 'LISTO', 'Almacenado'
+
+    hash_sha256 = models.CharField(max_length=64, unique=True)
+    ruta = models.CharField(max_length=100)  # Nombre relativo, sin AWS_LOCATION.
+    tamano = models.BigIntegerField()
+    referencias = models.PositiveIntegerField(default=0)
+    # Solo un contenido LISTO está de verdad en el almacenamiento y puede reutilizarse sin subirlo.
+    estado = models.CharField(max_length=20, choices=Estado.choices, default=Estado.PENDIENTE)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Contenido de Archivo"
+        verbose_name_plural = "Contenidos de Archivos"
+
+    def __str__(self):
+        return f"{self.hash_sha256[:12]} ({self.referencias} ref.)"
     
 class Proyecto(models.Model):
     """
@@ -336,10 +516,16 @@ class KanbanColumna(models.Model):
         help_text="Clase de Font Awesome (ej: 'fas fa-check-circle')."
     )
     
-    orden = models.PositiveIntegerField(default=0, help_text="Orden de la columna en el tablero.")
+    rango = models.CharField(
+        max_length=64, default='',
+        help_text="Posición fraccionaria de la columna en el tablero (ver ventas/rangos.py)."
+    )
 
     class Meta:
-        ordering = ['orden']
+        ordering = ['rango', 'id']
+        indexes = [
+            models.Index(fields=['proyecto', 'rango'], name='kanbancolumna_proyecto_rango'),
+        ]
         verbose_name = "Columna Kanban"
         verbose_name_plural = "Columnas Kanban"
 
@@ -350,10 +536,16 @@ class KanbanTarea(models.Model):
     columna = models.ForeignKey(KanbanColumna, on_delete=models.CASCADE, related_name='tareas')
     titulo = models.CharField(max_length=255)
     descripcion = models.TextField(blank=True)
-    orden = models.PositiveIntegerField(default=0, help_text="Orden de la tarea dentro de la columna.")
+    rango = models.CharField(
+        max_length=64, default='',
+        help_text="Posición fraccionaria de la tarea dentro de la columna (ver ventas/rangos.py)."
+    )
 
     class Meta:
-        ordering = ['orden']
+        ordering = ['rango', 'id']
+        indexes = [
+            models.Index(fields=['columna', 'rango'], name='kanbantarea_columna_rango'),
+        ]
         verbose_name = "Tarea Kanban"
         verbose_name_plural = "Tareas Kanban"
 
@@ -365,11 +557,12 @@ class DiagramaProyecto(models.Model):
     proyecto = models.ForeignKey(Proyecto, on_delete=models.CASCADE, related_name='diagramas')
     titulo = models.CharField(max_length=200)
     
-    # El campo 'codigo' ahora almacenará el JSON de JointJS
-    codigo = models.TextField(help_text="Código del diagrama en formato JSON (JointJS)")
+    # El campo 'codigo' ahora almacenará el JSON de JointJS.
+    # Ambos campos se guardan comprimidos (ver ventas/compresion.py).
+    codigo = TextoComprimidoField(help_text="Código del diagrama en formato JSON (JointJS)")
     
     # ✅ NUEVO CAMPO: Para almacenar el SVG del diagrama para exportación
-    svg_representation = models.TextField(
+    svg_representation = TextoComprimidoField(
         blank=True, 
         verbose_name="Representación SVG",
         help_text="El código SVG del diagrama para la exportación a PDF."
@@ -377,8 +570,238 @@ class DiagramaProyecto(models.Model):
     
     fecha_actualizacion = models.DateTimeField(auto_now=True)
 
+    # Sube con cada cambio de `codigo`; los guardados por parche la usan para
+    # detectar que otro guardado se adelantó (ver parche_diagrama_api).
+    revision = models.PositiveIntegerField(default=0, editable=False)
+    # Revisión a la que corresponde `svg_representation`: el editor sube el
+    # SVG con menos frecuencia que el código, así que puede quedar atrás.
+    svg_revision = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ['-fecha_actualizacion']
 
     def __str__(self):
-        return f"Diagrama '{self.titulo}' para {self.proyecto.nombre_proyecto}"
\ No newline at end of file
+        return f"Diagrama '{self.titulo}' para {self.proyecto.nombre_proyecto}"
+
+    @property
+    def svg_desactualizado(self):
+        return self.svg_revision < self.revision
+
+# ==============================================================================
+# 4. TRABAJOS EN SEGUNDO PLANO
+# ==============================================================================
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación de prospectos a Excel procesada fuera de la petición web por
+    `python manage.py procesar_exportaciones`. Cada fila es a la vez el
+    registro del trabajo y su entrada en la cola.
+    """
+    class Estado(models.TextChoices):
+        PENDIENTE = 'PENDIENTE', 'Pendiente'
+        EN_PROCESO = 'EN_PROCESO', 'En Proceso'
+        COMPLETADO = 'COMPLETADO', 'Completado'
+        ERROR = 'ERROR', 'Error'
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exportaciones')
+    estado = models.CharField(max_length=20, choices=Estado.choices, default=Estado.PENDIENTE)
+    # Huella de (usuario, tipo, parámetros) para no repetir exportaciones idénticas.
+    clave = models.CharField(max_length=64, db_index=True)
+    parametros = models.JSONField(default=dict, blank=True)
+    archivo = models.FileField(upload_to='exportaciones/%Y/%m/', blank=True)
+    total_filas = models.PositiveIntegerField(default=0)
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    mensaje_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+        indexes = [
+            # El worker toma el pendiente más antiguo.
+            models.Index(fields=['estado', 'fecha_creacion'], name='exportacion_cola'),
+        ]
+        verbose_name = "Trabajo de Exportación"
+        verbose_name_plural = "Trabajos de Exportación"
+
+    def __str__(self):
+        return f"Exportación #{self.pk} de {self.usuario} ({self.get_estado_display()})"
+
+    @staticmethod
+    def calcular_clave(usuario, parametros):
+        contenido = json.dumps({'usuario': usuario.pk, 'parametros': parametros}, sort_keys=True)
+        return hashlib.sha256(contenido.encode()).hexdigest()
+
+    @classmethod
+    def en_proceso_abandonados(cls):
+        """
+        Trabajos EN_PROCESO que superaron EXPORTACION_TIMEOUT_PROCESO: su
+        worker murió sin terminarlos y la cola los vuelve a entregar.
+        """
+        limite = timezone.now() - timedelta(seconds=settings.EXPORTACION_TIMEOUT_PROCESO)
+        return Q(estado=cls.Estado.EN_PROCESO, fecha_inicio__lt=limite)
+
+    @classmethod
+    def solicitar(cls, usuario, parametros=None, ttl=timedelta(minutes=10)):
+        """
+        Encola una exportación o reutiliza una idéntica que siga en curso o
+        que haya terminado hace menos de `ttl`. Devuelve (trabajo, creado).
+        """
+        parametros = parametros or {}
+        clave = cls.calcular_clave(usuario, parametros)
+        existente = cls.objects.filter(clave=clave).filter(
+            Q(estado__in=[cls.Estado.PENDIENTE, cls.Estado.EN_PROCESO]) |
+            Q(estado=cls.Estado.COMPLETADO, fecha_fin__gte=timezone.now() - ttl)
+        ).exclude(cls.en_proceso_abandonados()).first()
+        if existente:
+            return existente, False
+        return cls.objects.create(usuario=usuario, clave=clave, parametros=parametros), True
+
+    @property
+    def progreso(self):
+        if self.estado == self.Estado.COMPLETADO:
+            return 100
+        if not self.total_filas:
+            return 0
+        return min(99, int(self.filas_procesadas * 100 / self.total_filas))
+
+
+class BorradoPendiente(models.Model):
+    """
+    Bandeja de salida de objetos del almacenamiento por borrar. Al eliminar un
+    ArchivoAdjunto (directamente o en cascada) se encola su clave en la misma
+    transacción, y `python manage.py procesar_borrados` los elimina por lotes.
+    """
+    # Indexada: rescatar_borrados() busca claves exactas.
+    clave = models.CharField(max_length=1024, db_index=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    # Tras un fallo se espera cada vez más antes de reintentar (ver procesar_borrados_pendientes).
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    # Mientras no venza, un worker está borrando el objeto.
+    reclamado_hasta = models.DateTimeField(null=True, blank=True)
+    # La clave se volvió a usar mientras se borraba: el worker no debe reintentarla.
+    rescatado = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['proximo_intento'], name='borrado_proximo_intento'),
+        ]
+        verbose_name = "Borrado Pendiente"
+        verbose_name_plural = "Borrados Pendientes"
+
+    def __str__(self):
+        return self.clave
+
+# ==============================================================================
+# 5. VERSIONES DE DATOS (CACHÉ Y PETICIONES CONDICIONALES)
+# ==============================================================================
+
+class VersionDatos(models.Model):
+    """
+    Contador de cambios por ámbito, incrementado por señales en cada escritura.
+    Las respuestas JSON lo usan como ETag y como clave de caché (ver
+    ventas/versiones.py): si no cambió, no hace falta regenerar ni reenviar nada.
+    """
+    class Ambito(models.TextChoices):
+        CALENDARIO = 'CALENDARIO', 'Calendario'  # clave = usuario (0 = vista de superusuario)
+        TABLERO = 'TABLERO', 'Tablero Kanban'    # clave = proyecto
+        DIAGRAMA = 'DIAGRAMA', 'Diagrama'        # clave = diagrama
+        # Versión del registro de cambios del tablero (clave = proyecto): sube
+        # exactamente una vez por cambio registrado (ver CambioTablero).
+        CAMBIOS_TABLERO = 'CAMBIOS_TABLERO', 'Registro de Cambios del Tablero'
+
+    ambito = models.CharField(max_length=20, choices=Ambito.choices)
+    clave = models.PositiveBigIntegerField()
+    version = models.PositiveBigIntegerField(default=0)
+    fecha_modificacion = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('ambito', 'clave')
+        verbose_name = "Versión de Datos"
+        verbose_name_plural = "Versiones de Datos"
+
+    def __str__(self):
+        return f"{self.ambito} #{self.clave}: v{self.version}"
+
+    @classmethod
+    def incrementar(cls, ambito, clave):
+        if clave is None:
+            return
+        ahora = timezone.now()
+        if cls.objects.filter(ambito=ambito, clave=clave).update(version=F('version') + 1, fecha_modificacion=ahora):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(ambito=ambito, clave=clave, version=1, fecha_modificacion=ahora)
+        except IntegrityError:
+            cls.objects.filter(ambito=ambito, clave=clave).update(version=F('version') + 1, fecha_modificacion=ahora)
+
+    @classmethod
+    def obtener(cls, ambito, clave):
+        """Devuelve (version, fecha_modificacion); (0, None) si nunca cambió."""
+        fila = cls.objects.filter(ambito=ambito, clave=clave).values_list('version', 'fecha_modificacion').first()
+        return fila or (0, None)
+
+
+class TokenCalendario(models.Model):
+    """
+    Token secreto de la suscripción ICS de un usuario. El feed no usa la sesión
+    (los clientes de calendario no la tienen): quien conoce la URL ve el
+    calendario, así que el token se puede regenerar para revocarla.
+    """
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='token_calendario')
+    token = models.CharField(max_length=64, unique=True)
+    fecha_creacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Token de Calendario"
+        verbose_name_plural = "Tokens de Calendario"
+
+    def __str__(self):
+        return f"Calendario de {self.usuario}"
+
+    @classmethod
+    def regenerar(cls, usuario):
+        token, _ = cls.objects.update_or_create(usuario=usuario, defaults={'token': secrets.token_urlsafe(32)})
+        return token
+
+
+class CambioTablero(models.Model):
+    """
+    Registro append-only de los cambios de un tablero Kanban: un renglón por
+    cambio, con la versión del tablero que produjo y sus deltas. Permite a un
+    cliente ponerse al día pidiendo solo lo posterior a su versión (ver
+    ventas/kanban.py). Se compacta periódicamente en InstantaneaTablero.
+    """
+    proyecto = models.ForeignKey(Proyecto, on_delete=models.CASCADE, related_name='cambios_tablero')
+    version = models.PositiveBigIntegerField()
+    deltas = models.JSONField()
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['version']
+        unique_together = ('proyecto', 'version')
+        verbose_name = "Cambio del Tablero"
+        verbose_name_plural = "Cambios del Tablero"
+
+    def __str__(self):
+        return f"Tablero {self.proyecto_id} v{self.version}"
+
+
+class InstantaneaTablero(models.Model):
+    """Estado completo del tablero en la versión de la última compactación del registro."""
+    proyecto = models.OneToOneField(Proyecto, on_delete=models.CASCADE, related_name='instantanea_tablero')
+    version = models.PositiveBigIntegerField()
+    datos = models.JSONField()
+    fecha = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Instantánea del Tablero"
+        verbose_name_plural = "Instantáneas del Tablero"
+
+    def __str__(self):
+        return f"Tablero {self.proyecto_id} v{self.version}"
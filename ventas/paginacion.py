@@ -0,0 +1,187 @@
+# ventas/paginacion.py
+
+import datetime
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+
+# ==============================================================================
+# PAGINACIÓN POR CURSOR (KEYSET)
+# ==============================================================================
+# En lugar de OFFSET + COUNT(*), cada página se pide con un cursor opaco que
+# codifica los valores de ordenamiento de la última (o primera) fila vista, de
+# modo que la página N cuesta lo mismo que la página 1.
+
+CURSOR_SALT = 'ventas.paginacion.cursor'
+
+
+def tamano_pagina(request, por_defecto=10, parametro='page_size'):
+    """Lee el tamaño de página del query string, acotado a PAGINACION_TAMANO_MAXIMO."""
+    maximo = getattr(settings, 'PAGINACION_TAMANO_MAXIMO', 100)
+    try:
+        valor = int(request.GET.get(parametro, por_defecto))
+    except (TypeError, ValueError):
+        valor = por_defecto
+    return max(1, min(valor, maximo))
+
+
+class CursorInvalido(Exception):
+    pass
+
+
+class CursorPage:
+    """Página de resultados con los cursores para avanzar o retroceder."""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def count(self):
+        return self.paginator.count
+
+
+class CursorPaginator:
+    """
+    Pagina un queryset por sus columnas de ordenamiento, p. ej.
+    ('-fecha_creacion', '-id'). La última columna debe ser única.
+    """
+
+    def __init__(self, queryset, ordering, per_page, contar=None):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+        if contar is None:
+            contar = getattr(settings, 'PAGINACION_CONTEO_EXACTO', True)
+        self.contar = contar
+        self._count = None
+
+    @property
+    def count(self):
+        """Total de filas, o None si el conteo exacto está desactivado."""
+        if not self.contar:
+            return None
+        if self._count is None:
+            self._count = self.queryset.count()
+        return self._count
+
+    def _campos(self):
+        return [(campo.lstrip('-'), campo.startswith('-')) for campo in self.ordering]
+
+    def _codificar(self, obj, direccion):
+        valores = [getattr(obj, nombre) for nombre, _ in self._campos()]
+        return signing.dumps(
+            {'v': valores, 'd': direccion}, salt=CURSOR_SALT, serializer=_CursorSerializer, compress=True
+        )
+
+    def _decodificar(self, cursor):
+        try:
+            datos = signing.loads(cursor, salt=CURSOR_SALT, serializer=_CursorSerializer)
+            valores = [self._a_python(nombre, valor) for (nombre, _), valor in zip(self._campos(), datos['v'])]
+            return valores, datos['d']
+        except (signing.BadSignature, KeyError, TypeError, ValueError) as e:
+            raise CursorInvalido(str(e))
+
+    def _a_python(self, nombre, valor):
+        try:
+            return self.queryset.model._meta.get_field(nombre).to_python(valor)
+        except FieldDoesNotExist:
+            # Anotaciones (p. ej. el 'rango' de búsqueda) viajan tal cual en el JSON.
+            return valor
+
+    def _filtro_despues_de(self, valores, invertir):
+        """Q para las filas que van después de `valores` en el orden dado."""
+        filtro = Q()
+        iguales = {}
+        for (nombre, descendente), valor in zip(self._campos(), valores):
+            operador = 'lt' if descendente != invertir else 'gt'
+            filtro |= Q(**iguales, **{f'{nombre}__{operador}': valor})
+            iguales[nombre] = valor
+        return filtro
+
+    def get_page(self, cursor=None):
+        direccion = 'n'
+        queryset = self.queryset
+        if cursor:
+            try:
+                valores, direccion = self._decodificar(cursor)
+            except CursorInvalido:
+                cursor = None
+            else:
+                hacia_atras = direccion == 'p'
+                queryset = queryset.filter(self._filtro_despues_de(valores, invertir=hacia_atras))
+                if hacia_atras:
+                    queryset = queryset.reverse()
+
+        filas = list(queryset[:self.per_page + 1])
+        hay_mas = len(filas) > self.per_page
+        filas = filas[:self.per_page]
+
+        if direccion == 'p':
+            filas.reverse()
+            hay_siguiente, hay_anterior = True, hay_mas
+        else:
+            hay_siguiente, hay_anterior = hay_mas, bool(cursor)
+
+        next_cursor = self._codificar(filas[-1], 'n') if filas and hay_siguiente else None
+        previous_cursor = self._codificar(filas[0], 'p') if filas and hay_anterior else None
+        return CursorPage(filas, self, next_cursor, previous_cursor)
+
+
+class _CursorEncoder(json.JSONEncoder):
+    # A diferencia de DjangoJSONEncoder, conserva los microsegundos: truncarlos
+    # haría que el cursor saltara o repitiera filas con la misma marca de tiempo.
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.date)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class _CursorSerializer:
+    def dumps(self, obj):
+        return json.dumps(obj, cls=_CursorEncoder, separators=(',', ':')).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class CursorPaginationMixin:
+    """
+    Mixin para ListView que sustituye la paginación por OFFSET por cursores.
+    Define `cursor_ordering` en la vista; la plantilla recibe `page_obj`
+    con `next_cursor`/`previous_cursor` y `paginator.count` (o None).
+    """
+    cursor_ordering = ('-fecha_creacion', '-id')
+    cursor_param = 'cursor'
+
+    def get_paginate_by(self, queryset):
+        return tamano_pagina(self.request, por_defecto=self.paginate_by)
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, self.get_cursor_ordering(), page_size)
+        page = paginator.get_page(self.request.GET.get(self.cursor_param))
+        return (paginator, page, page.object_list, page.has_other_pages())
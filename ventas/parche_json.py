@@ -0,0 +1,143 @@
+# ventas/parche_json.py
+
+import copy
+
+
+# ==============================================================================
+# JSON PATCH (RFC 6902)
+# ==============================================================================
+# Aplica una lista de operaciones JSON Patch sobre un documento ya
+# decodificado. Las rutas son JSON Pointer (RFC 6901): "/cells/3/position/x",
+# con "~1" para "/" y "~0" para "~" dentro de una clave, y "-" como posición
+# detrás del último elemento de una lista. El editor de diagramas lo usa para
+# enviar solo lo que cambió del grafo (ver parche_diagrama_api).
+
+
+class ErrorParche(ValueError):
+    """Parche mal formado o que no aplica al documento. `indice` es la operación que falló."""
+
+    def __init__(self, mensaje, indice=None):
+        super().__init__(mensaje)
+        self.indice = indice
+
+
+def _tokens(ruta):
+    if not isinstance(ruta, str):
+        raise ErrorParche("La ruta debe ser una cadena.")
+    if ruta == '':
+        return []
+    if not ruta.startswith('/'):
+        raise ErrorParche(f"Ruta inválida: '{ruta}'.")
+    return [token.replace('~1', '/').replace('~0', '~') for token in ruta[1:].split('/')]
+
+
+def _indice(lista, token, para_insertar=False):
+    if para_insertar and token == '-':
+        return len(lista)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise ErrorParche(f"Índice de lista inválido: '{token}'.")
+    indice = int(token)
+    if indice > len(lista) or (indice == len(lista) and not para_insertar):
+        raise ErrorParche(f"Índice fuera de rango: {indice}.")
+    return indice
+
+
+def _hijo(contenedor, token):
+    if isinstance(contenedor, dict):
+        if token not in contenedor:
+            raise ErrorParche(f"No existe la clave '{token}'.")
+        return contenedor[token]
+    if isinstance(contenedor, list):
+        return contenedor[_indice(contenedor, token)]
+    raise ErrorParche(f"No se puede entrar en un valor escalar con '{token}'.")
+
+
+def _obtener(documento, tokens):
+    for token in tokens:
+        documento = _hijo(documento, token)
+    return documento
+
+
+def _padre(documento, tokens):
+    padre = _obtener(documento, tokens[:-1])
+    if not isinstance(padre, (dict, list)):
+        raise ErrorParche(f"El destino de '{tokens[-1]}' no es un objeto ni una lista.")
+    return padre, tokens[-1]
+
+
+def _agregar(documento, tokens, valor):
+    if not tokens:
+        return valor
+    padre, token = _padre(documento, tokens)
+    if isinstance(padre, dict):
+        padre[token] = valor
+    else:
+        padre.insert(_indice(padre, token, para_insertar=True), valor)
+    return documento
+
+
+def _quitar(documento, tokens):
+    if not tokens:
+        raise ErrorParche("No se puede quitar la raíz del documento.")
+    padre, token = _padre(documento, tokens)
+    if isinstance(padre, dict):
+        if token not in padre:
+            raise ErrorParche(f"No existe la clave '{token}'.")
+        return padre.pop(token)
+    return padre.pop(_indice(padre, token))
+
+
+def _reemplazar(documento, tokens, valor):
+    if not tokens:
+        return valor
+    padre, token = _padre(documento, tokens)
+    if isinstance(padre, dict):
+        if token not in padre:
+            raise ErrorParche(f"No existe la clave '{token}'.")
+        padre[token] = valor
+    else:
+        padre[_indice(padre, token)] = valor
+    return documento
+
+
+def aplicar_parche(documento, operaciones):
+    """
+    Devuelve `documento` con `operaciones` aplicadas. Modifica el documento
+    recibido; si una operación falla se lanza ErrorParche y el documento
+    queda a medias, así que el llamador debe descartarlo.
+    """
+    if not isinstance(operaciones, list):
+        raise ErrorParche("El parche debe ser una lista de operaciones.")
+    for indice, operacion in enumerate(operaciones):
+        try:
+            if not isinstance(operacion, dict):
+                raise ErrorParche("Cada operación debe ser un objeto.")
+            nombre = operacion.get('op')
+            ruta = _tokens(operacion['path'])
+            if nombre == 'add':
+                documento = _agregar(documento, ruta, copy.deepcopy(operacion['value']))
+            elif nombre == 'remove':
+                _quitar(documento, ruta)
+            elif nombre == 'replace':
+                documento = _reemplazar(documento, ruta, copy.deepcopy(operacion['value']))
+            elif nombre == 'move':
+                origen = _tokens(operacion['from'])
+                if ruta == origen:
+                    _obtener(documento, origen)  # Solo se comprueba que exista.
+                elif ruta[:len(origen)] == origen:
+                    raise ErrorParche("No se puede mover un valor dentro de sí mismo.")
+                else:
+                    documento = _agregar(documento, ruta, _quitar(documento, origen))
+            elif nombre == 'copy':
+                valor = _obtener(documento, _tokens(operacion['from']))
+                documento = _agregar(documento, ruta, copy.deepcopy(valor))
+            elif nombre == 'test':
+                if _obtener(documento, ruta) != operacion['value']:
+                    raise ErrorParche(f"La prueba de '{operacion['path']}' no se cumple.")
+            else:
+                raise ErrorParche(f"Operación desconocida: '{nombre}'.")
+        except KeyError as error:
+            raise ErrorParche(f"Operación {indice}: falta el campo {error}.", indice) from None
+        except ErrorParche as error:
+            raise ErrorParche(f"Operación {indice}: {error}", indice) from None
+    return documento
@@ -0,0 +1,73 @@
+# ventas/rangos.py
+
+# ==============================================================================
+# RANGOS FRACCIONARIOS (ESTILO LEXORANK)
+# ==============================================================================
+# Un rango es una cadena que representa una fracción en base 36 (0.xyz...):
+# el orden lexicográfico de las cadenas coincide con el orden numérico. Entre
+# dos rangos siempre hay otro, así que insertar o mover un elemento solo
+# escribe su propia fila. Cada inserción en el mismo hueco alarga el rango en
+# promedio un carácter cada ~5 veces; el rebalanceo (ventas/kanban.py)
+# reescribe los rangos de un grupo con separaciones uniformes cuando crecen.
+#
+# Reglas: alfabeto 0-9a-z (mismo orden en ASCII y en las intercalaciones
+# habituales de PostgreSQL), sin cadena vacía y sin '0' al final (no habría
+# ningún rango entre 'a' y 'a0').
+
+DIGITOS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITOS)
+
+
+class ErrorRango(ValueError):
+    pass
+
+
+def _medio(a, b):
+    """Cadena estrictamente entre `a` ('' = 0) y `b` (None = 1)."""
+    if b is not None:
+        # Prefijo común: el rango nuevo lo comparte.
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _medio(a[n:], b[n:])
+    digito_a = DIGITOS.index(a[0]) if a else 0
+    digito_b = DIGITOS.index(b[0]) if b is not None else BASE
+    if digito_b - digito_a > 1:
+        return DIGITOS[(digito_a + digito_b + 1) // 2]
+    # Dígitos consecutivos: se toma el primero de `b` si eso ya queda en
+    # medio, o se desciende un nivel detrás del de `a`.
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return DIGITOS[digito_a] + _medio(a[1:], None)
+
+
+def rango_entre(anterior=None, siguiente=None):
+    """
+    Devuelve un rango estrictamente entre `anterior` y `siguiente`. Cualquiera
+    de los dos puede ser None (principio o final de la lista).
+    """
+    anterior = anterior or ''
+    if siguiente is not None and anterior >= siguiente:
+        raise ErrorRango(f"Rangos fuera de orden: {anterior!r} >= {siguiente!r}")
+    return _medio(anterior, siguiente)
+
+
+def rangos_distribuidos(cantidad):
+    """`cantidad` rangos ordenados, cortos y con huecos uniformes entre ellos."""
+    if cantidad <= 0:
+        return []
+    # Se deja al menos un dígito libre entre vecinos para inserciones futuras.
+    ancho = 1
+    while BASE ** ancho < (cantidad + 1) * BASE:
+        ancho += 1
+    paso = BASE ** ancho // (cantidad + 1)
+    rangos = []
+    for i in range(1, cantidad + 1):
+        valor = i * paso
+        digitos = []
+        for _ in range(ancho):
+            valor, resto = divmod(valor, BASE)
+            digitos.append(DIGITOS[resto])
+        rangos.append(''.join(reversed(digitos)).rstrip('0'))
+    return rangos
@@ -0,0 +1,221 @@
+# ventas/signals.py
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_init, pre_save, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .almacenamiento import encolar_borrado, liberar_contenido
+from .models import (
+    Prospecto, ContadorEstadoProspecto, Interaccion, ArchivoAdjunto, Recordatorio,
+    Entregable, Proyecto, KanbanColumna, KanbanTarea, DiagramaProyecto, VersionDatos,
+    TrabajoExportacion
+)
+
+
+# ==============================================================================
+# CONTADORES DE ESTADO DE PROSPECTOS
+# ==============================================================================
+# Nota: estas rutas no disparan las señales y dejan los contadores como estaban:
+#   - QuerySet.update() sobre `estado` o `asignado_a`;
+#   - bulk_create() y bulk_update() (el importador de ventas/importacion.py
+#     ajusta los contadores por su cuenta);
+#   - el SET_NULL de `asignado_a` al borrar un usuario (lo cubre usuario_pre_delete).
+# QuerySet.delete() sí pasa por post_delete: al haber receptores, Django carga
+# cada objeto antes de borrarlo. Después de cualquier otra carga masiva hay que
+# ejecutar `python manage.py reconstruir_contadores_estado`.
+
+def _recordar_valores_originales(instance):
+    # Se lee __dict__ directamente para no forzar la carga de campos diferidos.
+    instance._estado_original = instance.__dict__.get('estado')
+    instance._asignado_original = instance.__dict__.get('asignado_a_id')
+    instance._nombre_original = instance.__dict__.get('nombre_completo')
+
+
+@receiver(post_init, sender=Prospecto)
+def prospecto_post_init(sender, instance, **kwargs):
+    _recordar_valores_originales(instance)
+
+
+@receiver(pre_save, sender=Prospecto)
+def prospecto_pre_save(sender, instance, **kwargs):
+    if instance._state.adding or instance.pk is None:
+        # Un prospecto nuevo no tiene interacciones: su actividad es su creación.
+        instance.ultima_actividad = instance.fecha_creacion
+        return
+    if instance._estado_original is None or instance._nombre_original is None:
+        # El objeto se cargó con campos diferidos: consultamos los valores guardados.
+        original = sender.objects.filter(pk=instance.pk).values('estado', 'asignado_a_id', 'nombre_completo').first()
+        if original:
+            instance._estado_original = original['estado']
+            instance._asignado_original = original['asignado_a_id']
+            instance._nombre_original = original['nombre_completo']
+
+
+@receiver(post_save, sender=Prospecto)
+def prospecto_post_save(sender, instance, created, **kwargs):
+    estado, asignado = instance.estado, instance.asignado_a_id
+    if created:
+        ContadorEstadoProspecto.ajustar(asignado, estado, 1)
+    elif (instance._estado_original, instance._asignado_original) != (estado, asignado):
+        if instance._estado_original is not None:
+            ContadorEstadoProspecto.ajustar(instance._asignado_original, instance._estado_original, -1)
+        ContadorEstadoProspecto.ajustar(asignado, estado, 1)
+    # Los eventos del calendario llevan el nombre del prospecto y se filtran por
+    # su asignado (antes de olvidar al original, cuyo calendario también cambia).
+    # Un prospecto nuevo todavía no tiene eventos.
+    if not created and (
+        instance._nombre_original != instance.nombre_completo or instance._asignado_original != asignado
+    ) and _tiene_eventos_calendario(instance.pk):
+        _incrementar_calendario(asignado, instance._asignado_original)
+    _recordar_valores_originales(instance)
+
+
+@receiver(post_delete, sender=Prospecto)
+def prospecto_post_delete(sender, instance, **kwargs):
+    estado = instance._estado_original or instance.estado
+    asignado = instance._asignado_original if instance._estado_original else instance.asignado_a_id
+    ContadorEstadoProspecto.ajustar(asignado, estado, -1)
+    _incrementar_calendario(asignado)
+
+
+@receiver(pre_delete, sender=User)
+def usuario_pre_delete(sender, instance, **kwargs):
+    """
+    Prospecto.asignado_a usa SET_NULL (sin señales), así que antes de borrar
+    al usuario pasamos sus conteos al contador de prospectos sin asignar.
+    """
+    for contador in ContadorEstadoProspecto.objects.filter(asignado_a=instance):
+        ContadorEstadoProspecto.ajustar(None, contador.estado, contador.total)
+
+
+# ==============================================================================
+# ÚLTIMA ACTIVIDAD DE PROSPECTOS
+# ==============================================================================
+
+@receiver(post_save, sender=Interaccion)
+def interaccion_post_save(sender, instance, created, **kwargs):
+    if created:
+        # Caso común: la nueva interacción es la más reciente.
+        Prospecto.objects.filter(
+            pk=instance.prospecto_id, ultima_actividad__lt=instance.fecha
+        ).update(ultima_actividad=instance.fecha)
+    else:
+        Prospecto.recalcular_ultima_actividad(Prospecto.objects.filter(pk=instance.prospecto_id))
+
+
+@receiver(post_delete, sender=Interaccion)
+def interaccion_post_delete(sender, instance, origin=None, **kwargs):
+    # Si el borrado viene en cascada desde el propio prospecto no hay nada que actualizar.
+    if isinstance(origin, Prospecto) or getattr(origin, 'model', None) is Prospecto:
+        return
+    Prospecto.recalcular_ultima_actividad(Prospecto.objects.filter(pk=instance.prospecto_id))
+
+
+# ==============================================================================
+# BORRADO DE ARCHIVOS EN EL ALMACENAMIENTO
+# ==============================================================================
+
+@receiver(post_delete, sender=ArchivoAdjunto)
+def archivo_adjunto_post_delete(sender, instance, **kwargs):
+    # También se dispara en las cascadas desde Prospecto. El objeto se borra
+    # después, por lotes (ver `procesar_borrados`); si el contenido está
+    # deduplicado, solo cuando se suelta su última referencia.
+    if instance.contenido_id:
+        objeto_borrado = liberar_contenido(instance.contenido_id)
+    else:
+        encolar_borrado(instance.archivo.name)
+        objeto_borrado = True
+    # La miniatura de un contenido compartido vive mientras viva el contenido.
+    if objeto_borrado and instance.miniatura:
+        encolar_borrado(instance.miniatura)
+
+
+@receiver(post_delete, sender=TrabajoExportacion)
+def trabajo_exportacion_post_delete(sender, instance, **kwargs):
+    encolar_borrado(instance.archivo.name)
+
+
+# ==============================================================================
+# VERSIONES DE DATOS (ETag / CACHÉ DE FEEDS JSON)
+# ==============================================================================
+# Nota: como con los contadores de estado, QuerySet.update() no pasa por aquí;
+# quien lo use sobre estos modelos debe llamar a VersionDatos.incrementar().
+
+Ambito = VersionDatos.Ambito
+
+
+def _viene_de(origin, modelo):
+    return isinstance(origin, modelo) or getattr(origin, 'model', None) is modelo
+
+
+def _tiene_eventos_calendario(prospecto_id):
+    return (
+        Recordatorio.objects.filter(prospecto_id=prospecto_id).exists()
+        or Entregable.objects.filter(proyecto__prospecto_id=prospecto_id).exists()
+    )
+
+
+def _incrementar_calendario(*usuarios_ids):
+    for usuario_id in set(usuarios_ids):
+        VersionDatos.incrementar(Ambito.CALENDARIO, usuario_id)
+    # Vista de superusuario (todos los recordatorios).
+    VersionDatos.incrementar(Ambito.CALENDARIO, 0)
+
+
+@receiver(post_save, sender=Recordatorio)
+@receiver(post_delete, sender=Recordatorio)
+def recordatorio_cambiado(sender, instance, origin=None, **kwargs):
+    if _viene_de(origin, Prospecto):
+        return  # Lo cubren las señales del propio prospecto.
+    asignado = Prospecto.objects.filter(pk=instance.prospecto_id).values_list('asignado_a_id', flat=True).first()
+    _incrementar_calendario(asignado)
+
+
+@receiver(post_save, sender=Entregable)
+@receiver(post_delete, sender=Entregable)
+def entregable_cambiado(sender, instance, origin=None, **kwargs):
+    if _viene_de(origin, Prospecto):
+        return
+    asignado = (
+        Proyecto.objects.filter(pk=instance.proyecto_id)
+        .values_list('prospecto__asignado_a_id', flat=True).first()
+    )
+    _incrementar_calendario(asignado)
+
+
+@receiver(post_init, sender=Proyecto)
+def proyecto_post_init(sender, instance, **kwargs):
+    instance._nombre_proyecto_original = instance.__dict__.get('nombre_proyecto')
+
+
+@receiver(post_save, sender=Proyecto)
+def proyecto_post_save(sender, instance, created, **kwargs):
+    # Los entregables del calendario llevan el nombre del proyecto.
+    if (
+        not created and instance._nombre_proyecto_original != instance.nombre_proyecto
+        and Entregable.objects.filter(proyecto=instance).exists()
+    ):
+        asignado = Prospecto.objects.filter(pk=instance.prospecto_id).values_list('asignado_a_id', flat=True).first()
+        _incrementar_calendario(asignado)
+    instance._nombre_proyecto_original = instance.nombre_proyecto
+
+
+@receiver(post_save, sender=KanbanColumna)
+@receiver(post_delete, sender=KanbanColumna)
+def columna_cambiada(sender, instance, **kwargs):
+    VersionDatos.incrementar(Ambito.TABLERO, instance.proyecto_id)
+
+
+@receiver(post_save, sender=KanbanTarea)
+@receiver(post_delete, sender=KanbanTarea)
+def tarea_cambiada(sender, instance, origin=None, **kwargs):
+    if _viene_de(origin, KanbanColumna):
+        return  # Lo cubre columna_cambiada.
+    proyecto_id = KanbanColumna.objects.filter(pk=instance.columna_id).values_list('proyecto_id', flat=True).first()
+    VersionDatos.incrementar(Ambito.TABLERO, proyecto_id)
+
+
+@receiver(post_save, sender=DiagramaProyecto)
+@receiver(post_delete, sender=DiagramaProyecto)
+def diagrama_cambiado(sender, instance, **kwargs):
+    VersionDatos.incrementar(Ambito.DIAGRAMA, instance.pk)
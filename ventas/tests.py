@@ -1,3 +1,1905 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from PIL import Image
+
+from . import almacenamiento, eventos, miniaturas
+from .busqueda import _consulta_prefijos, buscar_prospectos, quitar_acentos, usa_busqueda_postgres
+from .calendario_ics import _escapar, _linea, generar_ics
+from .compresion import comprimir, descomprimir
+from .exportacion import (
+    ENCABEZADOS, escribir_libro_prospectos, limpiar_exportaciones_vencidas, procesar_trabajo_exportacion,
+    prospectos_para_exportar, tomar_siguiente_trabajo,
+)
+from .importacion import ImportadorProspectos
+from .kanban import (
+    ErrorLote, ErrorReordenamiento, LoteTablero, cambios_desde, datos_tablero, registrar_cambio, reordenar_columnas,
+    reordenar_tareas, tablero_serializado,
+)
+from .models import (
+    ArchivoAdjunto, BorradoPendiente, CambioTablero, ContadorEstadoProspecto, ContenidoArchivo, DiagramaProyecto,
+    Entregable, Etiqueta, InstantaneaTablero, Interaccion, KanbanColumna, KanbanTarea, Prospecto, Proyecto,
+    Recordatorio, TokenCalendario, TrabajoExportacion, VersionDatos,
+)
+from .paginacion import CursorPaginator
+from .parche_json import ErrorParche, aplicar_parche
+from .rangos import ErrorRango, rango_entre, rangos_distribuidos
+
+
+def crear_prospectos(cantidad, prefijo='p'):
+    return [
+        Prospecto.objects.create(nombre_completo=f'Prospecto {i}', email=f'{prefijo}{i}@ejemplo.com')
+        for i in range(cantidad)
+    ]
+
+
+class AlmacenamientoTemporal:
+    """
+    Mezcla para pruebas que escriben archivos: MEDIA_ROOT y el sustituto local
+    de S3 apuntan a un directorio temporal y el cliente compartido se recrea.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.raiz = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.raiz, ignore_errors=True)
+        ajustes = override_settings(
+            S3_LOCAL=True, S3_LOCAL_RAIZ=self.raiz, AWS_LOCATION='media', MEDIA_ROOT=os.path.join(self.raiz, 'media')
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        parche = mock.patch.object(almacenamiento, '_cliente', None)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def ruta_objeto(self, clave):
+        return os.path.join(self.raiz, clave)
+
+
+# ==============================================================================
+# CONTADORES DE ESTADO
+# ==============================================================================
+
+class VerificaContadores:
+
+    def assertContadoresCuadran(self):
+        """Los contadores (sin ceros) coinciden con un GROUP BY sobre Prospecto."""
+        esperado = {
+            (fila['asignado_a'], fila['estado']): fila['total']
+            for fila in Prospecto.objects.values('asignado_a', 'estado').annotate(total=Count('id'))
+        }
+        contadores = {
+            (c.asignado_a_id, c.estado): c.total
+            for c in ContadorEstadoProspecto.objects.exclude(total=0)
+        }
+        self.assertEqual(contadores, esperado)
+
+
+class ContadorEstadoTests(VerificaContadores, TestCase):
+
+    def setUp(self):
+        self.ana = User.objects.create_user('ana')
+        self.luis = User.objects.create_user('luis')
+
+    def test_alta_cambio_de_estado_y_de_asignado(self):
+        a = Prospecto.objects.create(nombre_completo='A', email='a@ejemplo.com', asignado_a=self.ana)
+        b = Prospecto.objects.create(nombre_completo='B', email='b@ejemplo.com')
+        self.assertContadoresCuadran()
+
+        a.estado = Prospecto.Estado.CONTACTADO
+        a.save()
+        self.assertContadoresCuadran()
+
+        b.asignado_a = self.luis
+        b.estado = Prospecto.Estado.GANADO
+        b.save()
+        self.assertContadoresCuadran()
+
+        # Con campos diferidos el estado original se consulta antes de guardar.
+        diferido = Prospecto.objects.only('id', 'nombre_completo').get(pk=a.pk)
+        diferido.asignado_a = self.luis
+        diferido.save()
+        self.assertContadoresCuadran()
+
+    def test_borrados(self):
+        a, b = crear_prospectos(2)
+        c = Prospecto.objects.create(nombre_completo='C', email='c@ejemplo.com', asignado_a=self.ana)
+
+        a.delete()
+        self.assertContadoresCuadran()
+        # QuerySet.delete() también pasa por post_delete.
+        Prospecto.objects.filter(pk__in=[b.pk, c.pk]).delete()
+        self.assertContadoresCuadran()
+        self.assertFalse(ContadorEstadoProspecto.objects.exclude(total=0).exists())
+
+    def test_borrar_usuario_pasa_sus_conteos_a_sin_asignar(self):
+        for i, estado in enumerate([Prospecto.Estado.NUEVO, Prospecto.Estado.NUEVO, Prospecto.Estado.PERDIDO]):
+            Prospecto.objects.create(
+                nombre_completo=f'P{i}', email=f'p{i}@ejemplo.com', estado=estado, asignado_a=self.ana
+            )
+        Prospecto.objects.create(nombre_completo='Libre', email='libre@ejemplo.com')
+
+        self.ana.delete()
+        self.assertContadoresCuadran()
+        self.assertEqual(
+            ContadorEstadoProspecto.conteos_por_estado(User(is_superuser=True)),
+            {Prospecto.Estado.NUEVO: 3, Prospecto.Estado.PERDIDO: 1},
+        )
+
+
+# ==============================================================================
+# ÚLTIMA ACTIVIDAD
+# ==============================================================================
+
+class UltimaActividadTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana')
+        self.prospecto = crear_prospectos(1)[0]
+        self.inicio = self.prospecto.fecha_creacion
+
+    def interaccion(self, dias):
+        return Interaccion.objects.create(
+            prospecto=self.prospecto, tipo=Interaccion.Tipo.choices[0][0], notas='-',
+            creado_por=self.usuario, fecha=self.inicio + timedelta(days=dias),
+        )
+
+    def ultima_actividad(self):
+        return Prospecto.objects.values_list('ultima_actividad', flat=True).get(pk=self.prospecto.pk)
+
+    def test_sin_interacciones_es_la_fecha_de_creacion(self):
+        self.assertEqual(self.ultima_actividad(), self.inicio)
+
+    def test_sigue_a_la_interaccion_mas_reciente(self):
+        reciente = self.interaccion(5)
+        self.interaccion(2)
+        self.assertEqual(self.ultima_actividad(), reciente.fecha)
+
+        reciente.fecha = self.inicio + timedelta(days=1)
+        reciente.save()
+        self.assertEqual(self.ultima_actividad(), self.inicio + timedelta(days=2))
+
+    def test_borrar_interacciones_recalcula(self):
+        antigua, reciente = self.interaccion(1), self.interaccion(3)
+        reciente.delete()
+        self.assertEqual(self.ultima_actividad(), antigua.fecha)
+        antigua.delete()
+        self.assertEqual(self.ultima_actividad(), self.inicio)
+
+    def test_recalcular_desde_cero(self):
+        reciente = self.interaccion(4)
+        Prospecto.objects.update(ultima_actividad=self.inicio)
+        self.assertEqual(Prospecto.recalcular_ultima_actividad(), 1)
+        self.assertEqual(self.ultima_actividad(), reciente.fecha)
+
+
+# ==============================================================================
+# PAGINACIÓN POR CURSOR
+# ==============================================================================
+
+class CursorPaginatorTests(TestCase):
+
+    def recorrer(self, paginator):
+        """IDs de todas las páginas hacia adelante y, desde la última, hacia atrás."""
+        adelante, paginas = [], []
+        pagina = paginator.get_page()
+        while True:
+            paginas.append([p.pk for p in pagina])
+            adelante.extend(paginas[-1])
+            if not pagina.has_next():
+                break
+            pagina = paginator.get_page(pagina.next_cursor)
+
+        atras = [[p.pk for p in pagina]]
+        while pagina.has_previous():
+            pagina = paginator.get_page(pagina.previous_cursor)
+            atras.insert(0, [p.pk for p in pagina])
+        self.assertEqual(atras, paginas)
+        return adelante
+
+    def test_empates_en_el_orden_se_desempatan_por_id(self):
+        prospectos = crear_prospectos(7)
+        Prospecto.objects.update(fecha_creacion=timezone.now())
+        paginator = CursorPaginator(Prospecto.objects.all(), ('-fecha_creacion', '-id'), 3)
+        self.assertEqual(self.recorrer(paginator), sorted((p.pk for p in prospectos), reverse=True))
+
+    def test_el_cursor_conserva_los_microsegundos(self):
+        prospectos = crear_prospectos(4)
+        base = timezone.now().replace(microsecond=500)
+        for i, prospecto in enumerate(prospectos):
+            Prospecto.objects.filter(pk=prospecto.pk).update(fecha_creacion=base + timedelta(microseconds=i))
+        paginator = CursorPaginator(Prospecto.objects.all(), ('fecha_creacion', 'id'), 1)
+        self.assertEqual(self.recorrer(paginator), [p.pk for p in prospectos])
+
+    def test_cursor_sobre_el_rango_de_busqueda(self):
+        prospectos = crear_prospectos(5)
+        queryset = buscar_prospectos(Prospecto.objects.all(), 'Prospecto')
+        paginator = CursorPaginator(queryset, ('-rango', '-id'), 2)
+        self.assertEqual(self.recorrer(paginator), sorted((p.pk for p in prospectos), reverse=True))
+
+    def test_cursor_invalido_devuelve_la_primera_pagina(self):
+        crear_prospectos(3)
+        paginator = CursorPaginator(Prospecto.objects.all(), ('-id',), 2)
+        pagina = paginator.get_page('no-es-un-cursor')
+        self.assertEqual([p.pk for p in pagina], [p.pk for p in paginator.get_page()])
+        self.assertFalse(pagina.has_previous())
+
+
+    def test_vista_de_clientes_pagina_por_cursor(self):
+        usuario = User.objects.create_superuser('admin')
+        self.client.force_login(usuario)
+        clientes = crear_prospectos(5)
+        base = timezone.now()
+        for i, cliente in enumerate(clientes):
+            Proyecto.objects.create(prospecto=cliente, nombre_proyecto=f'Proyecto {i}')
+            Prospecto.objects.filter(pk=cliente.pk).update(
+                estado=Prospecto.Estado.GANADO, fecha_actualizacion=base - timedelta(minutes=i % 2)
+            )
+
+        vistos, parametros = [], {'page_size': 2}
+        while True:
+            pagina = self.client.get(reverse('cliente-cerrado-list'), parametros).context['page_obj']
+            vistos.extend(c.pk for c in pagina)
+            if not pagina.has_next():
+                break
+            parametros['cursor'] = pagina.next_cursor
+        # Primero los más recientes (índices pares); los empates, por id descendente.
+        esperado = [c.pk for c in reversed(clientes[::2])] + [c.pk for c in reversed(clientes[1::2])]
+        self.assertEqual(vistos, esperado)
+
+
+# ==============================================================================
+# BÚSQUEDA DE PROSPECTOS
+# ==============================================================================
+
+class ConsultaBusquedaTests(SimpleTestCase):
+
+    def test_quitar_acentos(self):
+        self.assertEqual(quitar_acentos('José Núñez, Ángela Müller'), 'Jose Nunez, Angela Muller')
+
+    def test_consulta_de_prefijos(self):
+        self.assertEqual(_consulta_prefijos('  Núñez  Pé '), 'nunez:* & pe:*')
+        self.assertEqual(_consulta_prefijos('¡!'), '')
+
+
+@skipUnless(usa_busqueda_postgres(), 'La búsqueda por trigramas y texto completo requiere PostgreSQL')
+class BusquedaPostgresTests(TestCase):
+
+    def setUp(self):
+        self.nunez = Prospecto.objects.create(
+            nombre_completo='José Núñez', email='jnunez@ejemplo.com', empresa='Aceros del Norte'
+        )
+        self.empresa = Prospecto.objects.create(
+            nombre_completo='Marta Ruiz', email='marta@ejemplo.com', empresa='Núñez Hermanos'
+        )
+        self.otro = Prospecto.objects.create(
+            nombre_completo='Pedro Gómez', email='pedro@ejemplo.com', empresa='Textiles Sur'
+        )
+
+    def buscar(self, texto):
+        return list(
+            buscar_prospectos(Prospecto.objects.all(), texto).order_by('-rango', '-id').values_list('pk', flat=True)
+        )
+
+    def test_los_acentos_se_ignoran_en_ambos_sentidos(self):
+        self.assertEqual(self.buscar('nunez')[:2], self.buscar('Núñez')[:2])
+        self.assertIn(self.nunez.pk, self.buscar('jose nunez'))
+        self.assertIn(self.otro.pk, self.buscar('gomez'))
+
+    def test_coincidencia_en_el_nombre_pesa_mas_que_en_la_empresa(self):
+        self.assertEqual(self.buscar('Nunez')[:2], [self.nunez.pk, self.empresa.pk])
+
+    def test_errores_de_escritura_por_trigramas(self):
+        self.assertEqual(self.buscar('Textils')[:1], [self.otro.pk])
+
+    def test_sin_coincidencias(self):
+        self.assertEqual(self.buscar('zzzz'), [])
+
+
+# ==============================================================================
+# EXPORTACIÓN A EXCEL
+# ==============================================================================
+
+class ExportacionExcelTests(TestCase):
+
+    def setUp(self):
+        self.ana = User.objects.create_user('ana')
+        self.propios = [
+            Prospecto.objects.create(nombre_completo=f'Propio {i}', email=f'propio{i}@ejemplo.com', asignado_a=self.ana)
+            for i in range(5)
+        ]
+        crear_prospectos(2, prefijo='ajeno')
+
+    def leer(self, contenido):
+        hoja = load_workbook(io.BytesIO(contenido), read_only=True)['Prospectos']
+        return [list(fila) for fila in hoja.iter_rows(values_only=True)]
+
+    def test_libro_completo_con_avance_por_lotes(self):
+        destino, avances = io.BytesIO(), []
+        with mock.patch('ventas.exportacion.FILAS_MUESTRA_ANCHOS', 3):
+            total = escribir_libro_prospectos(
+                prospectos_para_exportar(self.ana), destino, tamano_lote=2, al_avanzar=avances.append
+            )
+        self.assertEqual(total, 5)
+        self.assertEqual(avances, [2, 4])
+        filas = self.leer(destino.getvalue())
+        self.assertEqual(filas[0], ENCABEZADOS)
+        # Las filas de la muestra de anchos no se pierden ni se repiten.
+        self.assertCountEqual([fila[1] for fila in filas[1:]], [p.email for p in self.propios])
+
+    def test_la_vista_envia_el_libro_en_streaming(self):
+        self.client.force_login(self.ana)
+        respuesta = self.client.get(reverse('export-prospectos-excel'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        self.assertIn('attachment;', respuesta['Content-Disposition'])
+        filas = self.leer(b''.join(respuesta.streaming_content))
+        self.assertEqual(len(filas), 1 + len(self.propios))
+        self.assertTrue(all(fila[13] == 'ana' for fila in filas[1:]))
+
+
+# ==============================================================================
+# EXPORTACIÓN EN SEGUNDO PLANO
+# ==============================================================================
+
+@override_settings(EXPORTACION_TIMEOUT_PROCESO=60, EXPORTACION_RETENCION_DIAS=7)
+class TrabajoExportacionTests(AlmacenamientoTemporal, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana = User.objects.create_user('ana')
+        crear_prospectos(3)
+        Prospecto.objects.update(asignado_a=self.ana)
+
+    def trabajo(self, estado=TrabajoExportacion.Estado.PENDIENTE, **campos):
+        return TrabajoExportacion.objects.create(
+            usuario=self.ana, clave=f'c{TrabajoExportacion.objects.count()}', estado=estado, **campos
+        )
+
+    def test_solicitudes_identicas_reutilizan_el_trabajo(self):
+        trabajo, creado = TrabajoExportacion.solicitar(self.ana)
+        self.assertTrue(creado)
+        self.assertEqual(TrabajoExportacion.solicitar(self.ana), (trabajo, False))
+
+        # Un trabajo abandonado no se reutiliza: se encola otro.
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(
+            estado=TrabajoExportacion.Estado.EN_PROCESO, fecha_inicio=timezone.now() - timedelta(minutes=5)
+        )
+        otro, creado = TrabajoExportacion.solicitar(self.ana)
+        self.assertTrue(creado)
+        self.assertNotEqual(otro, trabajo)
+
+    def test_se_toma_el_pendiente_mas_antiguo_y_se_reclaman_los_abandonados(self):
+        ahora = timezone.now()
+        en_curso = self.trabajo(TrabajoExportacion.Estado.EN_PROCESO, fecha_inicio=ahora)
+        abandonado = self.trabajo(
+            TrabajoExportacion.Estado.EN_PROCESO, fecha_inicio=ahora - timedelta(minutes=5), filas_procesadas=40
+        )
+        pendiente = self.trabajo()
+        TrabajoExportacion.objects.filter(pk=abandonado.pk).update(fecha_creacion=ahora - timedelta(hours=1))
+
+        tomado = tomar_siguiente_trabajo()
+        self.assertEqual(tomado, abandonado)
+        self.assertEqual(tomado.filas_procesadas, 0)
+        self.assertGreater(tomado.fecha_inicio, ahora)
+        self.assertEqual(tomar_siguiente_trabajo(), pendiente)
+        self.assertIsNone(tomar_siguiente_trabajo())
+        en_curso.refresh_from_db()
+        self.assertEqual(en_curso.fecha_inicio, ahora)
+
+    def test_procesar_y_descargar(self):
+        self.trabajo()
+        self.client.force_login(self.ana)
+        url = reverse('exportacion-descargar', kwargs={'pk': TrabajoExportacion.objects.get().pk})
+        self.assertEqual(self.client.get(url).status_code, 409)
+
+        trabajo = procesar_trabajo_exportacion(tomar_siguiente_trabajo())
+        self.assertEqual(trabajo.estado, TrabajoExportacion.Estado.COMPLETADO)
+        self.assertEqual((trabajo.total_filas, trabajo.filas_procesadas, trabajo.progreso), (3, 3, 100))
+
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        libro = load_workbook(io.BytesIO(b''.join(respuesta.streaming_content)), read_only=True)
+        self.assertEqual(len(list(libro['Prospectos'].iter_rows())), 4)
+
+    def test_limpieza_de_trabajos_vencidos(self):
+        self.trabajo()
+        viejo = procesar_trabajo_exportacion(tomar_siguiente_trabajo())
+        reciente = self.trabajo(TrabajoExportacion.Estado.COMPLETADO, fecha_fin=timezone.now())
+        en_curso = self.trabajo(TrabajoExportacion.Estado.EN_PROCESO, fecha_inicio=timezone.now())
+        TrabajoExportacion.objects.filter(pk=viejo.pk).update(fecha_fin=timezone.now() - timedelta(days=8))
+
+        self.assertEqual(limpiar_exportaciones_vencidas(), 1)
+        self.assertQuerySetEqual(TrabajoExportacion.objects.order_by('pk'), [reciente, en_curso])
+        # El archivo se borra después, por la cola de borrados.
+        self.assertTrue(BorradoPendiente.objects.filter(clave=almacenamiento.clave_s3(viejo.archivo.name)).exists())
+
+
+# ==============================================================================
+# IMPORTACIÓN MASIVA
+# ==============================================================================
+
+class ImportacionTests(VerificaContadores, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin')
+        self.ana = User.objects.create_user('ana')
+
+    def csv(self, *lineas):
+        return io.BytesIO('\n'.join(lineas).encode('utf-8'))
+
+    def test_csv_por_lotes_con_una_fila_invalida_en_medio(self):
+        archivo = self.csv(
+            'Nombre,Email,Estado,Etiquetas,Asignado a',
+            'Uno,uno@ejemplo.com,NUEVO,feria,ana',
+            'Dos,dos@ejemplo.com,Cliente Cerrado,,',
+            'Tres,no-es-un-email,NUEVO,,',
+            'Cuatro,cuatro@ejemplo.com,Rechazado,"feria, web",ana',
+            'Cinco,cinco@ejemplo.com,,,nadie',
+        )
+        resultado = ImportadorProspectos(self.admin, tamano_lote=2).importar(archivo, 'prospectos.csv')
+
+        self.assertEqual((resultado.filas, resultado.creados, resultado.actualizados), (5, 3, 0))
+        self.assertEqual([numero for numero, _ in resultado.errores], [4, 6])
+        self.assertEqual(
+            dict(Prospecto.objects.values_list('email', 'estado')),
+            {'uno@ejemplo.com': 'NUEVO', 'dos@ejemplo.com': 'GANADO', 'cuatro@ejemplo.com': 'PERDIDO'},
+        )
+        self.assertEqual(Prospecto.objects.get(email='uno@ejemplo.com').asignado_a, self.ana)
+        self.assertEqual(Etiqueta.objects.count(), 2)
+        self.assertCountEqual(
+            Prospecto.objects.filter(etiquetas__nombre='feria').values_list('email', flat=True),
+            ['uno@ejemplo.com', 'cuatro@ejemplo.com'],
+        )
+        self.assertContadoresCuadran()
+
+    def test_reimportar_un_email_existente_lo_actualiza(self):
+        Prospecto.objects.create(nombre_completo='Viejo', email='uno@ejemplo.com', asignado_a=self.ana)
+        archivo = self.csv('Nombre,Email,Estado', 'Nuevo,uno@ejemplo.com,GANADO', 'Otro,otro@ejemplo.com,')
+        resultado = ImportadorProspectos(self.ana).importar(archivo, 'prospectos.csv')
+
+        self.assertEqual((resultado.creados, resultado.actualizados, resultado.errores), (1, 1, []))
+        prospecto = Prospecto.objects.get(email='uno@ejemplo.com')
+        self.assertEqual((prospecto.nombre_completo, prospecto.estado), ('Nuevo', 'GANADO'))
+        self.assertEqual(Prospecto.objects.count(), 2)
+        self.assertContadoresCuadran()
+
+    def test_no_se_sobrescriben_prospectos_de_otro_usuario(self):
+        Prospecto.objects.create(nombre_completo='De admin', email='uno@ejemplo.com', asignado_a=self.admin)
+        resultado = ImportadorProspectos(self.ana).importar(
+            self.csv('Nombre,Email', 'Mío,uno@ejemplo.com'), 'prospectos.csv'
+        )
+        self.assertEqual((resultado.creados, resultado.actualizados, len(resultado.errores)), (0, 0, 1))
+        self.assertEqual(Prospecto.objects.get().nombre_completo, 'De admin')
+        self.assertContadoresCuadran()
+
+    def test_xlsx_con_los_encabezados_de_la_exportacion(self):
+        libro = Workbook()
+        libro.active.append(['Nombre Completo', 'Email', 'Estado', 'Interés'])
+        libro.active.append(['José Núñez', 'jose@ejemplo.com', 'En Negociación', 'Exportación'])
+        libro.active.append([None, None, None, None])
+        libro.active.append(['Marta', 'marta@ejemplo.com', 'CONTACTADO', None])
+        archivo = io.BytesIO()
+        libro.save(archivo)
+        archivo.seek(0)
+
+        resultado = ImportadorProspectos(self.ana).importar(archivo, 'prospectos.XLSX')
+        self.assertEqual((resultado.filas, resultado.creados, resultado.errores), (2, 2, []))
+        jose = Prospecto.objects.get(email='jose@ejemplo.com')
+        self.assertEqual((jose.estado, jose.interes_principal), ('CALIFICANDO', 'EXPORTACION'))
+        self.assertEqual(
+            ContadorEstadoProspecto.conteos_por_estado(self.ana), {'CALIFICANDO': 1, 'CONTACTADO': 1}
+        )
+        self.assertContadoresCuadran()
+
+
+# ==============================================================================
+# CLIENTE S3 COMPARTIDO
+# ==============================================================================
+
+class ClienteS3Tests(AlmacenamientoTemporal, SimpleTestCase):
+
+    def test_un_solo_cliente_por_proceso_aunque_lo_pidan_varios_hilos(self):
+        clientes = []
+        with mock.patch.object(
+            almacenamiento, '_crear_cliente_local', wraps=almacenamiento._crear_cliente_local
+        ) as crear:
+            hilos = [
+                threading.Thread(target=lambda: clientes.append(almacenamiento.obtener_cliente_s3()))
+                for _ in range(8)
+            ]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        self.assertEqual(crear.call_count, 1)
+        self.assertEqual(len({id(cliente) for cliente in clientes}), 1)
+        self.assertIsInstance(clientes[0], almacenamiento.ClienteS3Local)
+
+    @override_settings(
+        S3_LOCAL=False, AWS_S3_REGION_NAME='eu-west-1', AWS_ACCESS_KEY_ID='clave', AWS_SECRET_ACCESS_KEY='secreto',
+        S3_MAX_CONEXIONES=7, S3_REINTENTOS=3, S3_TIMEOUT_CONEXION=2, S3_TIMEOUT_LECTURA=9, S3_MULTIPART_CONCURRENCIA=10,
+    )
+    def test_configuracion_del_cliente_boto3(self):
+        config = almacenamiento.obtener_cliente_s3().meta.config
+        self.assertEqual(config.max_pool_connections, 7)
+        # botocore lo guarda como intentos totales: el primero más los reintentos.
+        self.assertEqual(config.retries, {'total_max_attempts': 4, 'mode': 'standard'})
+        self.assertEqual((config.connect_timeout, config.read_timeout), (2, 9))
+        # Cada hilo de la subida multipart ocupa una conexión del pool.
+        self.assertEqual(almacenamiento.configuracion_transferencia().max_request_concurrency, 7)
+
+
+# ==============================================================================
+# SUBIDA DIRECTA (POST PREFIRMADO)
+# ==============================================================================
+
+@override_settings(SUBIDA_DIRECTA_TAMANO_MAXIMO=1024)
+class SubidaDirectaTests(AlmacenamientoTemporal, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana = User.objects.create_user('ana')
+        self.prospecto = Prospecto.objects.create(nombre_completo='P', email='p@ejemplo.com', asignado_a=self.ana)
+        self.client.force_login(self.ana)
+
+    def iniciar(self, nombre='informe.pdf'):
+        url = reverse('iniciar-subida-archivo', kwargs={'prospecto_pk': self.prospecto.pk})
+        return self.client.post(url, {'nombre': nombre, 'tamano': 10}).json()
+
+    def subir(self, destino, contenido=b'contenido', **campos):
+        datos = {**destino['fields'], **campos, 'file': SimpleUploadedFile('x', contenido)}
+        return self.client.post(destino['url'], datos)
+
+    def confirmar(self, clave):
+        url = reverse('confirmar-subida-archivo', kwargs={'prospecto_pk': self.prospecto.pk})
+        return self.client.post(url, {'clave': clave, 'nombre': 'Informe'})
+
+    def test_subida_y_confirmacion(self):
+        destino = self.iniciar()
+        self.assertRegex(destino['clave'], rf'^prospectos/{self.prospecto.pk}/[0-9a-f]{{12}}/informe\.pdf$')
+        self.assertEqual(self.confirmar(destino['clave']).status_code, 404)
+
+        self.assertEqual(self.subir(destino).status_code, 204)
+        with open(self.ruta_objeto(almacenamiento.clave_s3(destino['clave'])), 'rb') as objeto:
+            self.assertEqual(objeto.read(), b'contenido')
+
+        respuesta = self.confirmar(destino['clave'])
+        self.assertEqual(respuesta.status_code, 201)
+        adjunto = ArchivoAdjunto.objects.get(pk=respuesta.json()['id'])
+        self.assertEqual((adjunto.nombre, adjunto.tamano, adjunto.archivo.name), ('Informe', 9, destino['clave']))
+        # Una confirmación repetida no duplica el adjunto.
+        self.assertEqual(self.confirmar(destino['clave']).status_code, 200)
+        self.assertEqual(ArchivoAdjunto.objects.count(), 1)
+
+    def test_dos_subidas_con_el_mismo_nombre_no_se_pisan(self):
+        self.assertNotEqual(self.iniciar()['clave'], self.iniciar()['clave'])
+
+    def test_la_politica_firmada_protege_la_clave_y_el_tamano(self):
+        destino = self.iniciar()
+        otra_clave = almacenamiento.clave_s3(f'prospectos/{self.prospecto.pk}/000000000000/otro.pdf')
+        self.assertEqual(self.subir(destino, key=otra_clave).status_code, 403)
+        self.assertEqual(self.subir(destino, policy=destino['fields']['policy'] + 'x').status_code, 403)
+        self.assertEqual(self.subir(destino, contenido=b'x' * 1025).status_code, 400)
+        self.assertFalse(os.path.exists(self.ruta_objeto(otra_clave)))
+        self.assertFalse(os.path.exists(self.ruta_objeto(destino['fields']['key'])))
+
+    def test_claves_ajenas_o_mal_formadas(self):
+        otro = Prospecto.objects.create(nombre_completo='Otro', email='otro@ejemplo.com')
+        for clave in [
+            f'prospectos/{otro.pk}/0123456789ab/informe.pdf',
+            f'prospectos/{self.prospecto.pk}/no-es-hex/informe.pdf',
+            f'prospectos/{self.prospecto.pk}/0123456789ab/../informe.pdf',
+            '',
+        ]:
+            self.assertEqual(self.confirmar(clave).status_code, 400, clave)
+
+        ajeno = Prospecto.objects.create(
+            nombre_completo='Ajeno', email='ajeno@ejemplo.com', asignado_a=User.objects.create_user('luis')
+        )
+        url = reverse('iniciar-subida-archivo', kwargs={'prospecto_pk': ajeno.pk})
+        self.assertEqual(self.client.post(url, {'nombre': 'a.pdf'}).status_code, 403)
+
+
+# ==============================================================================
+# SUBIDAS QUE PASAN POR EL SERVIDOR
+# ==============================================================================
+
+class SubidaConHashTests(AlmacenamientoTemporal, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana = User.objects.create_user('ana')
+        self.prospecto = Prospecto.objects.create(nombre_completo='P', email='p@ejemplo.com', asignado_a=self.ana)
+        self.client.force_login(self.ana)
+
+    def adjuntar(self, contenido):
+        with mock.patch.object(almacenamiento, '_volcar_con_hash', wraps=almacenamiento._volcar_con_hash) as volcar:
+            self.client.post(
+                reverse('add-archivo', kwargs={'prospecto_pk': self.prospecto.pk}),
+                {'archivo': SimpleUploadedFile('datos.bin', contenido)},
+            )
+        # El hash se calculó mientras se recibía la petición: no hay otra pasada.
+        volcar.assert_not_called()
+        adjunto = ArchivoAdjunto.objects.latest('pk')
+        self.assertEqual((adjunto.hash_sha256, adjunto.tamano), (hashlib.sha256(contenido).hexdigest(), len(contenido)))
+        with open(self.ruta_objeto(almacenamiento.clave_s3(adjunto.archivo.name)), 'rb') as objeto:
+            self.assertEqual(objeto.read(), contenido)
+
+    def test_archivo_en_memoria(self):
+        self.adjuntar(b'pocos bytes')
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_archivo_volcado_a_disco(self):
+        self.adjuntar(os.urandom(200 * 1024))
+
+    def test_archivo_sin_hash_previo(self):
+        contenido = os.urandom(3000)
+        with override_settings(S3_MULTIPART_UMBRAL=1024):
+            contenido_archivo, transferencia = almacenamiento.almacenar_contenido(io.BytesIO(contenido))
+        self.assertEqual(transferencia.hash_sha256, hashlib.sha256(contenido).hexdigest())
+        self.assertEqual(contenido_archivo.ruta, almacenamiento.ruta_contenido(transferencia.hash_sha256))
+        with open(self.ruta_objeto(almacenamiento.clave_s3(contenido_archivo.ruta)), 'rb') as objeto:
+            self.assertEqual(objeto.read(), contenido)
+
+
+class DeduplicacionTests(AlmacenamientoTemporal, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.prospecto = crear_prospectos(1)[0]
+
+    def almacenar(self, contenido=b'mismo contenido'):
+        return almacenamiento.almacenar_contenido(io.BytesIO(contenido))
+
+    def adjuntar(self, contenido=b'mismo contenido', miniatura=''):
+        registro, transferencia = self.almacenar(contenido)
+        return ArchivoAdjunto.objects.create(
+            prospecto=self.prospecto, nombre='x', archivo=registro.ruta, contenido=registro,
+            hash_sha256=transferencia.hash_sha256, miniatura=miniatura,
+        )
+
+    def test_el_mismo_contenido_se_sube_una_vez(self):
+        with mock.patch.object(almacenamiento, '_subir', wraps=almacenamiento._subir) as subir:
+            primero, transferencia = self.almacenar()
+            segundo, reutilizada = self.almacenar()
+        self.assertEqual(subir.call_count, 1)
+        self.assertEqual(primero.pk, segundo.pk)
+        self.assertFalse(transferencia.reutilizado)
+        self.assertTrue(reutilizada.reutilizado)
+        self.assertIsNone(reutilizada.segundos)
+        contenido = ContenidoArchivo.objects.get()
+        self.assertEqual((contenido.referencias, contenido.estado), (2, ContenidoArchivo.Estado.LISTO))
+
+    def test_un_contenido_pendiente_se_vuelve_a_subir(self):
+        sha256 = hashlib.sha256(b'mismo contenido').hexdigest()
+        ContenidoArchivo.objects.create(
+            hash_sha256=sha256, ruta=almacenamiento.ruta_contenido(sha256), tamano=15, referencias=1,
+        )
+        with mock.patch.object(almacenamiento, '_subir', wraps=almacenamiento._subir) as subir:
+            contenido, transferencia = self.almacenar()
+        subir.assert_called_once()
+        self.assertFalse(transferencia.reutilizado)
+        contenido.refresh_from_db()
+        self.assertEqual((contenido.referencias, contenido.estado), (2, ContenidoArchivo.Estado.LISTO))
+        self.assertTrue(os.path.exists(self.ruta_objeto(almacenamiento.clave_s3(contenido.ruta))))
+
+    def test_una_subida_fallida_suelta_su_referencia(self):
+        with mock.patch.object(almacenamiento, '_subir', side_effect=OSError('sin red')):
+            with self.assertRaises(OSError):
+                self.almacenar()
+        self.assertFalse(ContenidoArchivo.objects.exists())
+        self.assertEqual(BorradoPendiente.objects.count(), 1)
+
+    def test_borrar_adjuntos_suelta_referencias(self):
+        primero = self.adjuntar(miniatura='miniaturas/x.webp')
+        segundo = self.adjuntar(miniatura='miniaturas/x.webp')
+        contenido = ContenidoArchivo.objects.get()
+
+        primero.delete()
+        self.assertEqual(ContenidoArchivo.objects.get().referencias, 1)
+        self.assertFalse(BorradoPendiente.objects.exists())
+
+        segundo.delete()
+        self.assertFalse(ContenidoArchivo.objects.exists())
+        self.assertCountEqual(
+            BorradoPendiente.objects.values_list('clave', flat=True),
+            [almacenamiento.clave_s3(contenido.ruta), almacenamiento.clave_s3('miniaturas/x.webp')],
+        )
+
+    def test_volver_a_subir_un_contenido_encolado_lo_rescata(self):
+        self.adjuntar().delete()
+        self.assertEqual(BorradoPendiente.objects.count(), 1)
+        with mock.patch.object(almacenamiento, '_subir', wraps=almacenamiento._subir) as subir:
+            self.adjuntar()
+        subir.assert_called_once()
+        self.assertFalse(BorradoPendiente.objects.exists())
+        self.assertEqual(ContenidoArchivo.objects.get().referencias, 1)
+
+
+# ==============================================================================
+# BORRADO DIFERIDO
+# ==============================================================================
+
+@override_settings(BORRADO_MAX_INTENTOS=3, BORRADO_ESPERA_BASE=60, BORRADO_ARRENDAMIENTO=300)
+class BorradoDiferidoTests(AlmacenamientoTemporal, TestCase):
+
+    def crear_objeto(self, nombre):
+        ruta = self.ruta_objeto(almacenamiento.clave_s3(nombre))
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as objeto:
+            objeto.write(b'x')
+        return ruta
+
+    def encolar(self, *nombres):
+        for nombre in nombres:
+            almacenamiento.encolar_borrado(nombre)
+        return [BorradoPendiente.objects.get(clave=almacenamiento.clave_s3(n)) for n in nombres]
+
+    def test_borra_por_lotes_sin_transaccion_abierta_durante_la_llamada(self):
+        rutas = [self.crear_objeto(f'a/{i}.txt') for i in range(3)]
+        self.encolar('a/0.txt', 'a/1.txt', 'a/2.txt')
+        cliente = almacenamiento.obtener_cliente_s3()
+        anidamiento = len(connection.savepoint_ids)
+        lotes = []
+
+        def delete_objects(**kwargs):
+            # La llamada a S3 no ocurre dentro de ninguna transacción (ni bloqueo) nuestra.
+            self.assertEqual(len(connection.savepoint_ids), anidamiento)
+            lotes.append(len(kwargs['Delete']['Objects']))
+            return type(cliente).delete_objects(cliente, **kwargs)
+
+        with mock.patch.object(cliente, 'delete_objects', side_effect=delete_objects):
+            self.assertEqual(almacenamiento.procesar_borrados_pendientes(2), (2, 0))
+            self.assertEqual(almacenamiento.procesar_borrados_pendientes(2), (1, 0))
+            self.assertEqual(almacenamiento.procesar_borrados_pendientes(2), (0, 0))
+        self.assertEqual(lotes, [2, 1])
+        self.assertFalse(any(os.path.exists(ruta) for ruta in rutas))
+        self.assertFalse(BorradoPendiente.objects.exists())
+
+    def test_fallo_parcial_y_espera_exponencial(self):
+        ok, mal = self.encolar('ok.txt', 'mal.txt')
+        cliente = almacenamiento.obtener_cliente_s3()
+        errores = {'Errors': [{'Key': mal.clave, 'Code': 'AccessDenied', 'Message': 'Denegado'}]}
+        with mock.patch.object(cliente, 'delete_objects', return_value=errores):
+            antes = timezone.now()
+            self.assertEqual(almacenamiento.procesar_borrados_pendientes(), (1, 1))
+        self.assertFalse(BorradoPendiente.objects.filter(pk=ok.pk).exists())
+        mal.refresh_from_db()
+        self.assertEqual((mal.intentos, mal.ultimo_error, mal.reclamado_hasta), (1, 'AccessDenied: Denegado', None))
+        self.assertGreaterEqual(mal.proximo_intento, antes + timedelta(seconds=60))
+        # Hasta que pase la espera no se reintenta.
+        self.assertEqual(almacenamiento.procesar_borrados_pendientes(), (0, 0))
+
+        esperas = []
+        with mock.patch.object(cliente, 'delete_objects', side_effect=OSError('sin red')):
+            for _ in range(3):
+                BorradoPendiente.objects.update(proximo_intento=timezone.now())
+                inicio = timezone.now()
+                almacenamiento.procesar_borrados_pendientes()
+                mal.refresh_from_db()
+                esperas.append(round((mal.proximo_intento - inicio).total_seconds() / 60))
+        # El tercer intento agota BORRADO_MAX_INTENTOS: la clave queda de lado.
+        self.assertEqual(esperas, [2, 4, 0])
+        self.assertEqual(mal.intentos, 3)
+        self.assertEqual(mal.ultimo_error, 'sin red')
+
+    def test_un_lote_reclamado_no_lo_toma_otro_worker_hasta_que_vence(self):
+        pendiente, = self.encolar('a.txt')
+        self.assertEqual(almacenamiento._reclamar_borrados(10), [pendiente])
+        self.assertEqual(almacenamiento._reclamar_borrados(10), [])
+        BorradoPendiente.objects.update(reclamado_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(almacenamiento._reclamar_borrados(10), [pendiente])
+
+    def test_rescatar_usa_claves_exactas(self):
+        self.encolar('a.pdf', almacenamiento.nombre_miniatura('a.pdf'), 'a.pdf.bak', 'b/a.pdf')
+        self.assertEqual(almacenamiento.rescatar_borrados('a.pdf'), [])
+        self.assertCountEqual(
+            BorradoPendiente.objects.values_list('clave', flat=True),
+            [almacenamiento.clave_s3('a.pdf.bak'), almacenamiento.clave_s3('b/a.pdf')],
+        )
+
+    def test_rescatar_una_clave_que_se_esta_borrando(self):
+        pendiente, = self.encolar('a.pdf')
+        almacenamiento._reclamar_borrados(10)
+        self.assertEqual(almacenamiento.rescatar_borrados('a.pdf'), [pendiente.pk])
+        pendiente.refresh_from_db()
+        self.assertTrue(pendiente.rescatado)
+
+        # Aunque el borrado falle, una clave rescatada no se reintenta.
+        cliente = almacenamiento.obtener_cliente_s3()
+        with mock.patch.object(cliente, 'delete_objects', side_effect=OSError('sin red')):
+            self.assertEqual(almacenamiento.procesar_borrados_pendientes(), (0, 0))
+        BorradoPendiente.objects.filter(pk=pendiente.pk).update(reclamado_hasta=None, proximo_intento=timezone.now())
+        self.assertEqual(almacenamiento._reclamar_borrados(10), [])
+
+    def test_esperar_un_borrado_en_curso(self):
+        pendiente, = self.encolar('a.pdf')
+        almacenamiento._reclamar_borrados(10)
+        en_curso = almacenamiento.rescatar_borrados('a.pdf')
+
+        # El worker termina mientras se espera.
+        def dormir(segundos):
+            BorradoPendiente.objects.filter(pk=pendiente.pk).delete()
+
+        with mock.patch.object(almacenamiento.time, 'sleep', side_effect=dormir) as sleep:
+            almacenamiento.esperar_borrados_en_curso(en_curso)
+        sleep.assert_called_once()
+
+        # Si el arrendamiento vence (el worker murió), se deja de esperar y se quita de la cola.
+        pendiente, = self.encolar('b.pdf')
+        almacenamiento._reclamar_borrados(10)
+        en_curso = almacenamiento.rescatar_borrados('b.pdf')
+        BorradoPendiente.objects.update(reclamado_hasta=timezone.now())
+        with mock.patch.object(almacenamiento.time, 'sleep') as sleep:
+            almacenamiento.esperar_borrados_en_curso(en_curso)
+        sleep.assert_not_called()
+        self.assertFalse(BorradoPendiente.objects.exists())
+
+    def test_contenido_liberado_se_borra_y_se_puede_volver_a_subir(self):
+        contenido, _ = almacenamiento.almacenar_contenido(io.BytesIO(b'datos'))
+        ruta = self.ruta_objeto(almacenamiento.clave_s3(contenido.ruta))
+        self.assertTrue(almacenamiento.liberar_contenido(contenido.pk))
+        self.assertEqual(almacenamiento.procesar_borrados_pendientes(), (1, 0))
+        self.assertFalse(os.path.exists(ruta))
+
+        # Liberado otra vez y subido de nuevo mientras el worker lo borra: la
+        # subida espera a que el borrado termine para no perder el objeto.
+        contenido, _ = almacenamiento.almacenar_contenido(io.BytesIO(b'datos'))
+        almacenamiento.liberar_contenido(contenido.pk)
+        almacenamiento._reclamar_borrados(10)
+
+        def dormir(segundos):
+            os.remove(ruta)
+            BorradoPendiente.objects.all().delete()
+
+        with mock.patch.object(almacenamiento.time, 'sleep', side_effect=dormir) as sleep:
+            contenido, transferencia = almacenamiento.almacenar_contenido(io.BytesIO(b'datos'))
+        sleep.assert_called_once()
+        self.assertFalse(transferencia.reutilizado)
+        self.assertTrue(os.path.exists(ruta))
+        self.assertEqual(ContenidoArchivo.objects.get().referencias, 1)
+
+
+# ==============================================================================
+# URLs DE DESCARGA PREFIRMADAS
+# ==============================================================================
+
+@override_settings(
+    S3_LOCAL=False, AWS_STORAGE_BUCKET_NAME='bucket', AWS_S3_REGION_NAME='eu-west-1',
+    AWS_ACCESS_KEY_ID='clave', AWS_SECRET_ACCESS_KEY='secreto',
+    DESCARGA_URL_EXPIRACION=300, DESCARGA_URL_MARGEN=30,
+)
+class UrlDescargaTests(TestCase):
+
+    def setUp(self):
+        parche = mock.patch.object(almacenamiento, '_cliente', None)
+        parche.start()
+        self.addCleanup(parche.stop)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        cliente = almacenamiento.obtener_cliente_s3()
+        parche = mock.patch.object(cliente, 'generate_presigned_url', wraps=cliente.generate_presigned_url)
+        self.firmar = parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_la_url_firmada_se_cachea_por_clave_y_nombre(self):
+        url = almacenamiento.url_descarga('contenido/ab/abcd', 'Informe "final".pdf')
+        self.assertEqual(almacenamiento.url_descarga('contenido/ab/abcd', 'Informe "final".pdf'), url)
+        self.assertEqual(self.firmar.call_count, 1)
+        parametros = self.firmar.call_args.kwargs['Params']
+        self.assertEqual(parametros['Key'], 'media/contenido/ab/abcd')
+        self.assertEqual(parametros['ResponseContentDisposition'], 'inline; filename="Informe final.pdf"')
+        self.assertEqual(parametros['ResponseContentType'], 'application/pdf')
+        self.assertEqual(self.firmar.call_args.kwargs['ExpiresIn'], 300)
+
+        # Otro nombre de descarga para el mismo contenido es otra URL.
+        self.assertNotEqual(almacenamiento.url_descarga('contenido/ab/abcd', 'otro.pdf'), url)
+        self.assertEqual(self.firmar.call_count, 2)
+
+    def test_la_cache_vence_antes_que_la_url(self):
+        with mock.patch.object(almacenamiento.cache, 'set', wraps=almacenamiento.cache.set) as guardar:
+            almacenamiento.url_descarga('a.pdf')
+        self.assertEqual(guardar.call_args.args[2], 270)
+
+    def test_la_vista_redirige_a_la_url_firmada(self):
+        prospecto = crear_prospectos(1)[0]
+        adjunto = ArchivoAdjunto.objects.create(prospecto=prospecto, nombre='a.pdf', archivo='prospectos/a.pdf')
+        self.client.force_login(User.objects.create_user('ana'))
+        respuesta = self.client.get(reverse('descargar-archivo', kwargs={'pk': adjunto.pk}))
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(respuesta['Location'], almacenamiento.url_descarga('prospectos/a.pdf', 'a.pdf'))
+        self.assertEqual(self.firmar.call_count, 1)
+
+
+# ==============================================================================
+# RESPUESTAS VERSIONADAS (ETag)
+# ==============================================================================
+
+class RespuestaVersionadaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        prospecto = crear_prospectos(1)[0]
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Diagramas')
+        self.diagrama = DiagramaProyecto.objects.create(
+            proyecto=self.proyecto, titulo='Flujo', codigo='{"cells": []}', revision=1
+        )
+        self.url = reverse('api-get-diagrama', kwargs={'diagrama_pk': self.diagrama.pk})
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+    def test_version_datos_incrementar(self):
+        self.assertEqual(VersionDatos.obtener(VersionDatos.Ambito.CALENDARIO, 7), (0, None))
+        VersionDatos.incrementar(VersionDatos.Ambito.CALENDARIO, 7)
+        VersionDatos.incrementar(VersionDatos.Ambito.CALENDARIO, 7)
+        VersionDatos.incrementar(VersionDatos.Ambito.CALENDARIO, None)
+        self.assertEqual(VersionDatos.obtener(VersionDatos.Ambito.CALENDARIO, 7)[0], 2)
+
+    def test_if_none_match_responde_304(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        self.assertEqual(respuesta.json()['titulo'], 'Flujo')
+
+        condicional = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(condicional.status_code, 304)
+        self.assertEqual(condicional.content, b'')
+        self.assertEqual(condicional['ETag'], respuesta['ETag'])
+
+    def test_el_json_se_sirve_desde_la_cache_mientras_no_cambie_la_version(self):
+        self.client.get(self.url)
+        # Un cambio que no sube la versión no se ve: prueba de que no se regenera.
+        DiagramaProyecto.objects.filter(pk=self.diagrama.pk).update(titulo='Oculto')
+        self.assertEqual(self.client.get(self.url).json()['titulo'], 'Flujo')
+
+    def test_guardar_el_modelo_cambia_el_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.diagrama.titulo = 'Flujo 2'
+        self.diagrama.save()
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.json()['titulo'], 'Flujo 2')
+
+    def test_el_parche_sube_la_version_a_mano(self):
+        etag = self.client.get(self.url)['ETag']
+        respuesta = self.client.post(
+            reverse('api-parche-diagrama', kwargs={'diagrama_pk': self.diagrama.pk}),
+            json.dumps({'base_revision': 1, 'parche': [{'op': 'add', 'path': '/cells/-', 'value': {'id': 'a'}}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(respuesta.json()['revision'], 2)
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['codigo'], {'cells': [{'id': 'a'}]})
+        self.assertEqual(respuesta.json()['revision'], 2)
+
+
+# ==============================================================================
+# MINIATURAS
+# ==============================================================================
+
+@override_settings(MINIATURAS_TIMEOUT_PROCESO=600, MINIATURAS_ANCHO=32, MINIATURAS_ALTO=32)
+class MiniaturasTests(AlmacenamientoTemporal, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.prospecto = crear_prospectos(1)[0]
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def png(self):
+        salida = io.BytesIO()
+        Image.new('RGB', (200, 100), 'red').save(salida, 'PNG')
+        return salida.getvalue()
+
+    def adjuntar(self, nombre, datos):
+        contenido, transferencia = almacenamiento.almacenar_contenido(io.BytesIO(datos))
+        return ArchivoAdjunto.objects.create(
+            prospecto=self.prospecto, nombre=nombre, archivo=contenido.ruta, contenido=contenido,
+            tamano=transferencia.tamano,
+        )
+
+    def test_se_reclaman_los_pendientes_y_los_abandonados(self):
+        Estado = ArchivoAdjunto.EstadoMiniatura
+        ahora = timezone.now()
+        pendiente = self.adjuntar('a.png', b'a')
+        abandonado = self.adjuntar('b.png', b'b')
+        sin_inicio = self.adjuntar('c.png', b'c')
+        en_curso = self.adjuntar('d.png', b'd')
+        ArchivoAdjunto.objects.filter(pk=abandonado.pk).update(
+            estado_miniatura=Estado.EN_PROCESO, inicio_miniatura=ahora - timedelta(minutes=11)
+        )
+        ArchivoAdjunto.objects.filter(pk=sin_inicio.pk).update(estado_miniatura=Estado.EN_PROCESO)
+        ArchivoAdjunto.objects.filter(pk=en_curso.pk).update(estado_miniatura=Estado.EN_PROCESO, inicio_miniatura=ahora)
+
+        self.assertEqual(miniaturas.tomar_pendientes(10), [pendiente, abandonado, sin_inicio])
+        self.assertEqual(miniaturas.tomar_pendientes(10), [])
+        self.assertFalse(ArchivoAdjunto.objects.exclude(estado_miniatura=Estado.EN_PROCESO).exists())
+
+    def test_genera_la_miniatura_y_la_reutiliza_para_el_mismo_contenido(self):
+        Estado = ArchivoAdjunto.EstadoMiniatura
+        original = self.adjuntar('foto.png', self.png())
+        texto = self.adjuntar('notas.txt', b'texto')
+        self.assertEqual(
+            miniaturas.procesar_lote(self.pool, miniaturas.tomar_pendientes()), {Estado.LISTA: 1, Estado.NO_APLICA: 1}
+        )
+        original.refresh_from_db()
+        self.assertEqual(original.miniatura, almacenamiento.nombre_miniatura(original.archivo.name))
+        with Image.open(self.ruta_objeto(almacenamiento.clave_s3(original.miniatura))) as imagen:
+            self.assertEqual((imagen.format, imagen.size), ('WEBP', (32, 16)))
+        texto.refresh_from_db()
+        self.assertEqual((texto.estado_miniatura, texto.miniatura), (Estado.NO_APLICA, ''))
+
+        # Otro adjunto con el mismo contenido no vuelve a descargar ni generar nada.
+        copia = self.adjuntar('copia.png', self.png())
+        with mock.patch.object(miniaturas, '_descargar') as descargar:
+            self.assertEqual(miniaturas.procesar_lote(self.pool, miniaturas.tomar_pendientes()), {Estado.LISTA: 1})
+        descargar.assert_not_called()
+        copia.refresh_from_db()
+        self.assertEqual((copia.estado_miniatura, copia.miniatura), (Estado.LISTA, original.miniatura))
+
+    def test_original_inexistente_queda_con_error(self):
+        adjunto = ArchivoAdjunto.objects.create(prospecto=self.prospecto, nombre='x.png', archivo='no/existe.png')
+        self.assertEqual(
+            miniaturas.procesar_lote(self.pool, miniaturas.tomar_pendientes()),
+            {ArchivoAdjunto.EstadoMiniatura.ERROR: 1},
+        )
+        adjunto.refresh_from_db()
+        self.assertEqual(adjunto.estado_miniatura, ArchivoAdjunto.EstadoMiniatura.ERROR)
+
+
+# ==============================================================================
+# CALENDARIO
+# ==============================================================================
+
+@override_settings(CALENDARIO_RANGO_MAXIMO_DIAS=60, TIME_ZONE='UTC')
+class CalendarioEventosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.ana = User.objects.create_user('ana')
+        self.luis = User.objects.create_user('luis')
+        self.propio = Prospecto.objects.create(
+            nombre_completo='Propio', email='propio@ejemplo.com', asignado_a=self.ana
+        )
+        self.ajeno = Prospecto.objects.create(nombre_completo='Ajeno', email='ajeno@ejemplo.com', asignado_a=self.luis)
+        self.url = reverse('calendario-eventos')
+
+    def recordatorio(self, prospecto, fecha, titulo='Llamar'):
+        return Recordatorio.objects.create(
+            prospecto=prospecto, creado_por=self.ana, titulo=titulo,
+            fecha_recordatorio=datetime.fromisoformat(fecha).replace(tzinfo=dt_timezone.utc),
+        )
+
+    def eventos(self, usuario, **parametros):
+        self.client.force_login(usuario)
+        return [evento['title'] for evento in self.client.get(self.url, parametros).json()]
+
+    def test_solo_el_rango_visible_y_los_propios(self):
+        self.recordatorio(self.propio, '2026-02-28T23:59:59', 'Antes')
+        self.recordatorio(self.propio, '2026-03-01T00:00:00', 'Inicio')
+        self.recordatorio(self.propio, '2026-03-31T23:00:00', 'Final')
+        self.recordatorio(self.propio, '2026-04-01T00:00:00', 'Fin excluido')
+        self.recordatorio(self.ajeno, '2026-03-10T10:00:00', 'De Luis')
+
+        rango = {'start': '2026-03-01T00:00:00+00:00', 'end': '2026-04-01'}
+        self.assertCountEqual(self.eventos(self.ana, **rango), ['Inicio (Propio)', 'Final (Propio)'])
+        self.assertCountEqual(
+            self.eventos(User.objects.create_superuser('admin'), **rango),
+            ['Inicio (Propio)', 'Final (Propio)', 'De Luis (Ajeno)'],
+        )
+
+    def test_el_mas_de_la_url_se_respeta_y_el_rango_se_acota(self):
+        self.recordatorio(self.propio, '2026-03-01T10:00:00', 'Marzo')
+        self.recordatorio(self.propio, '2026-06-01T10:00:00', 'Junio')
+        # En la query string sin codificar, '+01:00' llega como ' 01:00'.
+        self.assertEqual(
+            self.eventos(self.ana, start='2026-03-01T11:00:00 01:00', end='2026-03-02'), ['Marzo (Propio)']
+        )
+        # Un rango de un año se acota a CALENDARIO_RANGO_MAXIMO_DIAS.
+        self.assertEqual(self.eventos(self.ana, start='2026-02-15', end='2027-02-15'), ['Marzo (Propio)'])
+
+    def test_cada_rango_tiene_su_etag_y_un_cambio_lo_invalida(self):
+        self.client.force_login(self.ana)
+        marzo = self.client.get(self.url, {'start': '2026-03-01', 'end': '2026-04-01'})
+        abril = self.client.get(self.url, {'start': '2026-04-01', 'end': '2026-05-01'})
+        self.assertNotEqual(marzo['ETag'], abril['ETag'])
+
+        self.recordatorio(self.propio, '2026-03-05T09:00:00', 'Nuevo')
+        respuesta = self.client.get(
+            self.url, {'start': '2026-03-01', 'end': '2026-04-01'}, HTTP_IF_NONE_MATCH=marzo['ETag']
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([e['title'] for e in respuesta.json()], ['Nuevo (Propio)'])
+
+
+# ==============================================================================
+# FEED iCALENDAR
+# ==============================================================================
+
+class FeedIcsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.ana = User.objects.create_user('ana')
+        self.prospecto = Prospecto.objects.create(
+            nombre_completo='Núñez, Hnos; S.A.', email='nunez@ejemplo.com', asignado_a=self.ana
+        )
+        self.token = TokenCalendario.regenerar(self.ana).token
+
+    def feed(self, inicio, fin):
+        with mock.patch(
+            'ventas.calendario_ics.timezone.now', return_value=datetime(2026, 3, 1, 12, tzinfo=dt_timezone.utc)
+        ):
+            return b''.join(generar_ics(
+                self.ana, inicio, fin, lambda pk: f'https://crm/p/{pk}/', lambda pk: f'https://crm/y/{pk}/'
+            ))
+
+    def test_token_invalido_revocado_o_de_usuario_inactivo_da_404(self):
+        url = reverse('calendario-ics', kwargs={'token': self.token})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(reverse('calendario-ics', kwargs={'token': 'no-existe'})).status_code, 404)
+
+        TokenCalendario.regenerar(self.ana)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        nuevo = TokenCalendario.objects.get(usuario=self.ana).token
+        User.objects.filter(pk=self.ana.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse('calendario-ics', kwargs={'token': nuevo})).status_code, 404)
+
+    def test_responde_304_si_el_calendario_no_cambio(self):
+        url = reverse('calendario-ics', kwargs={'token': self.token})
+        primera = self.client.get(url)
+        self.assertEqual(primera['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 304)
+
+    def test_escapa_caracteres_especiales(self):
+        self.assertEqual(_escapar('a\\b;c,d\r\ne\nf\rg'), 'a\\\\b\\;c\\,d\\ne\\nf\\ng')
+        self.assertEqual(_escapar(None), '')
+
+    def test_pliega_a_75_octetos_sin_cortar_caracteres(self):
+        self.assertEqual(_linea('X' * 75), b'X' * 75 + b'\r\n')
+        self.assertEqual(_linea('X' * 76), b'X' * 75 + b'\r\n X\r\n')
+
+        # 'ñ' ocupa dos octetos: el que cruzaría el límite pasa entero a la siguiente línea.
+        plegada = _linea('X' * 74 + 'ñ' * 40)
+        lineas = plegada[:-2].split(b'\r\n')
+        self.assertEqual(lineas[0], b'X' * 74)
+        self.assertTrue(all(linea.startswith(b' ') for linea in lineas[1:]))
+        for linea in lineas:
+            self.assertLessEqual(len(linea), 75)
+            linea.decode('utf-8')
+        self.assertEqual(b''.join(linea[1:] for linea in lineas[1:]).decode('utf-8'), 'ñ' * 40)
+
+    def test_salida_completa(self):
+        recordatorio = Recordatorio.objects.create(
+            prospecto=self.prospecto, creado_por=self.ana, completado=True,
+            titulo='Llamar para confirmar la cotización del envío a Monterrey',
+            fecha_recordatorio=datetime(2026, 3, 2, 15, 30, tzinfo=dt_timezone.utc),
+        )
+        proyecto = Proyecto.objects.create(prospecto=self.prospecto, nombre_proyecto='Ruta\\Norte')
+        entregable = Entregable.objects.create(
+            proyecto=proyecto, nombre='Plan', descripcion='Línea 1\nLínea 2, con coma',
+            fecha_entrega=date(2026, 3, 10),
+        )
+
+        esperado = '\r\n'.join([
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//3R Transporte//CRM//ES',
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            'X-WR-CALNAME:CRM 3R - ana',
+            'BEGIN:VEVENT',
+            f'UID:recordatorio-{recordatorio.pk}@3r-transporte',
+            'DTSTAMP:20260301T120000Z',
+            'DTSTART:20260302T153000Z',
+            'DURATION:PT30M',
+            'SUMMARY:✔ Llamar para confirmar la cotización del envío a Monterrey (N',
+            ' úñez\\, Hnos\\; S.A.)',
+            'DESCRIPTION:Prospecto: Núñez\\, Hnos\\; S.A.',
+            f'URL:https://crm/p/{self.prospecto.pk}/',
+            'END:VEVENT',
+            'BEGIN:VEVENT',
+            f'UID:entregable-{entregable.pk}@3r-transporte',
+            'DTSTAMP:20260301T120000Z',
+            'DTSTART;VALUE=DATE:20260310',
+            'DTEND;VALUE=DATE:20260311',
+            'SUMMARY:Entrega: Plan (Ruta\\\\Norte)',
+            'DESCRIPTION:Línea 1\\nLínea 2\\, con coma',
+            f'URL:https://crm/y/{proyecto.pk}/',
+            'END:VEVENT',
+            'END:VCALENDAR',
+            '',
+        ]).encode('utf-8')
+        self.assertEqual(self.feed(date(2026, 3, 1), date(2026, 4, 1)), esperado)
+
+    @override_settings(TIME_ZONE='America/Mexico_City')
+    def test_la_ventana_va_de_la_medianoche_local_de_inicio_a_la_de_fin(self):
+        def recordatorio(fecha_utc):
+            return Recordatorio.objects.create(
+                prospecto=self.prospecto, creado_por=self.ana, titulo='Llamar',
+                fecha_recordatorio=datetime.fromisoformat(fecha_utc).replace(tzinfo=dt_timezone.utc),
+            ).pk
+
+        # En Ciudad de México (UTC-6) la medianoche local es a las 06:00 UTC.
+        recordatorio('2026-03-01T05:59:59')
+        en_inicio = recordatorio('2026-03-01T06:00:00')
+        antes_de_fin = recordatorio('2026-04-01T05:59:59')
+        recordatorio('2026-04-01T06:00:00')
+        proyecto = Proyecto.objects.create(prospecto=self.prospecto, nombre_proyecto='Ruta')
+        del_inicio = Entregable.objects.create(proyecto=proyecto, nombre='Inicio', fecha_entrega=date(2026, 3, 1)).pk
+        Entregable.objects.create(proyecto=proyecto, nombre='Fin', fecha_entrega=date(2026, 4, 1))
+
+        uids = [
+            linea for linea in self.feed(date(2026, 3, 1), date(2026, 4, 1)).decode('utf-8').split('\r\n')
+            if linea.startswith('UID:')
+        ]
+        self.assertCountEqual(uids, [
+            f'UID:recordatorio-{en_inicio}@3r-transporte',
+            f'UID:recordatorio-{antes_de_fin}@3r-transporte',
+            f'UID:entregable-{del_inicio}@3r-transporte',
+        ])
+
+
+# ==============================================================================
+# COMPRESIÓN DE DIAGRAMAS
+# ==============================================================================
+
+class CompresionTests(SimpleTestCase):
+
+    TEXTO = json.dumps({
+        'cells': [{'type': 'standard.Rectangle', 'id': n, 'attrs': {'label': 'Añadir'}} for n in range(30)]
+    })
+
+    def test_ida_y_vuelta(self):
+        comprimido = comprimir(self.TEXTO, 'zlib')
+        self.assertTrue(comprimido.startswith('~zlib:'))
+        self.assertLess(len(comprimido), len(self.TEXTO))
+        self.assertEqual(descomprimir(comprimido), self.TEXTO)
+
+    def test_texto_corto_se_guarda_tal_cual(self):
+        self.assertEqual(comprimir('{"cells": []}', 'zlib'), '{"cells": []}')
+        self.assertEqual(descomprimir('{"cells": []}'), '{"cells": []}')
+
+    def test_texto_corto_que_parece_comprimido(self):
+        # Guardado tal cual, al leerlo se tomaría por comprimido: se comprime aunque sea corto.
+        for texto in ('~zlib:no es base64', '~zstd:', '~zlib:' + base64.b64encode(zlib.compress(b'otro')).decode()):
+            with self.subTest(texto=texto):
+                comprimido = comprimir(texto, 'zlib')
+                self.assertNotEqual(comprimido, texto)
+                self.assertEqual(descomprimir(comprimido), texto)
+
+    @skipUnless(importlib.util.find_spec('zstandard'), 'Requiere el paquete zstandard.')
+    def test_ida_y_vuelta_zstd(self):
+        comprimido = comprimir(self.TEXTO, 'zstd')
+        self.assertTrue(comprimido.startswith('~zstd:'))
+        self.assertEqual(descomprimir(comprimido), self.TEXTO)
+
+    def test_algoritmo_desconocido(self):
+        with self.assertRaises(ValueError):
+            comprimir(self.TEXTO, 'lzma')
+
+
+class DiagramaComprimidoTests(TestCase):
+
+    LARGO = CompresionTests.TEXTO
+
+    def setUp(self):
+        prospecto = crear_prospectos(1, prefijo='diagrama')[0]
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Diagramas')
+
+    def columnas(self, diagrama):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT codigo, svg_representation FROM ventas_diagramaproyecto WHERE id = %s', [diagrama.pk]
+            )
+            return cursor.fetchone()
+
+    def guardar_sin_comprimir(self, codigo, svg=''):
+        """Fila como las guardadas antes de TextoComprimidoField."""
+        diagrama = DiagramaProyecto.objects.create(proyecto=self.proyecto, titulo='Antiguo', codigo='{}')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE ventas_diagramaproyecto SET codigo = %s, svg_representation = %s WHERE id = %s',
+                [codigo, svg, diagrama.pk],
+            )
+        return diagrama
+
+    def test_se_comprime_al_guardar_y_se_lee_descomprimido(self):
+        corto = '~zlib:corto'
+        diagrama = DiagramaProyecto.objects.create(
+            proyecto=self.proyecto, titulo='Nuevo', codigo=self.LARGO, svg_representation=corto
+        )
+        codigo, svg = self.columnas(diagrama)
+        self.assertTrue(codigo.startswith('~zlib:'))
+        self.assertNotEqual(svg, corto)
+
+        leido = DiagramaProyecto.objects.get(pk=diagrama.pk)
+        self.assertEqual((leido.codigo, leido.svg_representation), (self.LARGO, corto))
+        self.assertEqual(
+            DiagramaProyecto.objects.filter(pk=diagrama.pk).values_list('codigo', flat=True).get(), self.LARGO
+        )
+
+    def test_filas_antiguas_sin_comprimir(self):
+        diagrama = self.guardar_sin_comprimir(self.LARGO, '<svg/>')
+        leido = DiagramaProyecto.objects.get(pk=diagrama.pk)
+        self.assertEqual((leido.codigo, leido.svg_representation), (self.LARGO, '<svg/>'))
+
+    def test_recomprimir_diagramas(self):
+        antiguos = [self.guardar_sin_comprimir(self.LARGO, '<svg/>') for _ in range(3)]
+        corto = self.guardar_sin_comprimir('{"cells": []}')
+        comprimido = DiagramaProyecto.objects.create(proyecto=self.proyecto, titulo='Nuevo', codigo=self.LARGO)
+        antes = {
+            d.pk: (d.fecha_actualizacion, d.revision)
+            for d in DiagramaProyecto.objects.filter(pk__in=[a.pk for a in antiguos])
+        }
+
+        salida = io.StringIO()
+        with mock.patch.object(
+            DiagramaProyecto.objects, 'bulk_update', wraps=DiagramaProyecto.objects.bulk_update
+        ) as bulk_update:
+            call_command('recomprimir_diagramas', lote=2, stdout=salida)
+        self.assertIn('3 diagramas recomprimidos con zlib', salida.getvalue())
+        self.assertEqual([len(c.args[0]) for c in bulk_update.call_args_list], [2, 1])
+
+        for diagrama in antiguos:
+            codigo, svg = self.columnas(diagrama)
+            self.assertTrue(codigo.startswith('~zlib:'))
+            self.assertEqual(svg, '<svg/>')
+        self.assertEqual(self.columnas(corto)[0], '{"cells": []}')
+        self.assertEqual(
+            {d.pk: (d.fecha_actualizacion, d.revision) for d in DiagramaProyecto.objects.filter(pk__in=antes)}, antes
+        )
+        self.assertEqual(DiagramaProyecto.objects.get(pk=comprimido.pk).codigo, self.LARGO)
+
+        salida = io.StringIO()
+        call_command('recomprimir_diagramas', stdout=salida)
+        self.assertIn('0 diagramas recomprimidos', salida.getvalue())
+
+
+# ==============================================================================
+# GUARDADO DE DIAGRAMAS
+# ==============================================================================
+
+class GuardarDiagramaTests(TestCase):
+
+    def setUp(self):
+        prospecto = crear_prospectos(1, prefijo='guardar')[0]
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Diagramas')
+        self.diagrama = DiagramaProyecto.objects.create(
+            proyecto=self.proyecto, titulo='Flujo', codigo='{"cells": []}', revision=3
+        )
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+    def guardar(self, base_revision):
+        return self.client.post(
+            reverse('api-guardar-diagrama', kwargs={'proyecto_pk': self.proyecto.pk}),
+            json.dumps({'id': self.diagrama.pk, 'titulo': 'Flujo', 'codigo': '{"cells": [1]}',
+                        'base_revision': base_revision}),
+            content_type='application/json',
+        )
+
+    def test_base_revision_en_texto_se_convierte(self):
+        respuesta = self.guardar('3')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['revision'], 4)
+
+    def test_base_revision_atrasada_es_conflicto(self):
+        respuesta = self.guardar(2)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json(), {'status': 'conflicto', 'revision': 3})
+
+    def test_base_revision_invalida(self):
+        for base_revision in ('tres', [3], {}):
+            with self.subTest(base_revision=base_revision):
+                self.assertEqual(self.guardar(base_revision).status_code, 400)
+        self.diagrama.refresh_from_db()
+        self.assertEqual((self.diagrama.revision, self.diagrama.codigo), (3, '{"cells": []}'))
+
+
+# ==============================================================================
+# RANGOS FRACCIONARIOS
+# ==============================================================================
+
+class RangosTests(SimpleTestCase):
+
+    def comprobar(self, anterior, siguiente):
+        rango = rango_entre(anterior, siguiente)
+        self.assertTrue(rango, 'El rango no puede ser vacío.')
+        self.assertFalse(rango.endswith('0'), f'{rango!r} termina en 0.')
+        if anterior is not None:
+            self.assertLess(anterior, rango)
+        if siguiente is not None:
+            self.assertLess(rango, siguiente)
+        return rango
+
+    def test_inserciones_repetidas_en_el_mismo_hueco(self):
+        for anterior, siguiente in [(None, None), ('a', 'b'), ('a', 'a1'), ('az', 'b'), ('zz', None), (None, '01')]:
+            a, b = anterior, siguiente
+            for _ in range(200):
+                # Alternando lados el hueco se estrecha por ambos extremos.
+                izquierda = self.comprobar(a, b)
+                derecha = self.comprobar(izquierda, b)
+                a, b = izquierda, derecha
+
+    def test_inserciones_al_principio_y_al_final(self):
+        primero = ultimo = self.comprobar(None, None)
+        for _ in range(300):
+            primero = self.comprobar(None, primero)
+            ultimo = self.comprobar(ultimo, None)
+
+    def test_lista_aleatoria_se_mantiene_ordenada(self):
+        aleatorio = random.Random(18)
+        rangos = []
+        for _ in range(2000):
+            i = aleatorio.randint(0, len(rangos))
+            anterior = rangos[i - 1] if i else None
+            siguiente = rangos[i] if i < len(rangos) else None
+            rangos.insert(i, self.comprobar(anterior, siguiente))
+        self.assertEqual(rangos, sorted(rangos))
+        self.assertEqual(len(set(rangos)), len(rangos))
+
+    def test_rangos_distribuidos(self):
+        for cantidad in (1, 2, 35, 36, 100, 5000):
+            rangos = rangos_distribuidos(cantidad)
+            self.assertEqual(len(rangos), cantidad)
+            self.assertEqual(rangos, sorted(set(rangos)))
+            self.assertFalse(any(r.endswith('0') or not r for r in rangos))
+            # Siempre queda sitio entre vecinos y en los extremos.
+            for anterior, siguiente in zip([None] + rangos, rangos + [None]):
+                self.comprobar(anterior, siguiente)
+
+    def test_rangos_fuera_de_orden(self):
+        with self.assertRaises(ErrorRango):
+            rango_entre('b', 'a')
+        with self.assertRaises(ErrorRango):
+            rango_entre('a', 'a')
+
+
+# ==============================================================================
+# REORDENAMIENTO DEL TABLERO KANBAN
+# ==============================================================================
+
+class ReordenamientoTests(TestCase):
+
+    def setUp(self):
+        prospecto = crear_prospectos(1, prefijo='orden')[0]
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Tablero')
+        self.pendiente = KanbanColumna.objects.create(proyecto=self.proyecto, titulo='Pendiente', rango='a')
+        self.en_curso = KanbanColumna.objects.create(proyecto=self.proyecto, titulo='En curso', rango='b')
+        self.hecho = KanbanColumna.objects.create(proyecto=self.proyecto, titulo='Hecho', rango='c')
+        self.t1 = KanbanTarea.objects.create(columna=self.pendiente, titulo='Uno', rango='a')
+        self.t2 = KanbanTarea.objects.create(columna=self.pendiente, titulo='Dos', rango='b')
+        self.t3 = KanbanTarea.objects.create(columna=self.en_curso, titulo='Tres', rango='a')
+
+    def estado(self):
+        return (
+            list(KanbanColumna.objects.order_by('pk').values_list('pk', 'rango')),
+            list(KanbanTarea.objects.order_by('pk').values_list('pk', 'columna_id', 'rango')),
+            VersionDatos.obtener(VersionDatos.Ambito.TABLERO, self.proyecto.pk)[0],
+        )
+
+    def test_reordenar_columnas(self):
+        reordenar_columnas(self.proyecto.pk, [self.hecho.pk, self.pendiente.pk, self.en_curso.pk])
+        self.assertEqual(
+            list(KanbanColumna.objects.filter(proyecto=self.proyecto).values_list('pk', flat=True)),
+            [self.hecho.pk, self.pendiente.pk, self.en_curso.pk],
+        )
+
+    def test_columnas_incompletas_repetidas_o_ajenas_se_rechazan(self):
+        otro = Proyecto.objects.create(prospecto=crear_prospectos(1, prefijo='otro')[0], nombre_proyecto='Otro')
+        ajena = KanbanColumna.objects.create(proyecto=otro, titulo='Ajena', rango='a')
+        antes = self.estado()
+        for ids in (
+            [self.hecho.pk, self.pendiente.pk],
+            [self.hecho.pk, self.pendiente.pk, self.pendiente.pk],
+            [self.hecho.pk, self.pendiente.pk, self.en_curso.pk, ajena.pk],
+            [self.hecho.pk, self.pendiente.pk, 'x'],
+        ):
+            with self.subTest(ids=ids), self.assertRaises(ErrorReordenamiento):
+                reordenar_columnas(self.proyecto.pk, ids)
+        self.assertEqual(self.estado(), antes)
+
+    def test_reordenar_y_mover_tareas(self):
+        reordenar_tareas(self.proyecto.pk, {
+            self.pendiente.pk: [self.t2.pk],
+            self.en_curso.pk: [self.t1.pk, self.t3.pk],
+        })
+        self.assertEqual(list(self.pendiente.tareas.values_list('pk', flat=True)), [self.t2.pk])
+        self.assertEqual(list(self.en_curso.tareas.values_list('pk', flat=True)), [self.t1.pk, self.t3.pk])
+
+    def test_tareas_incompletas_se_rechazan(self):
+        antes = self.estado()
+        for tareas_por_columna in (
+            # Falta una tarea de la columna indicada.
+            {self.pendiente.pk: [self.t2.pk]},
+            # Se mueve una tarea sin listar la columna de origen: esa columna no se bloqueó ni se revisó.
+            {self.hecho.pk: [self.t1.pk]},
+            # Una tarea en dos columnas.
+            {self.pendiente.pk: [self.t1.pk, self.t2.pk], self.en_curso.pk: [self.t3.pk, self.t1.pk]},
+            # Lista vacía de una columna que sí tiene tareas.
+            {self.en_curso.pk: []},
+            {},
+        ):
+            with self.subTest(tareas_por_columna=tareas_por_columna), self.assertRaises(ErrorReordenamiento):
+                reordenar_tareas(self.proyecto.pk, tareas_por_columna)
+        self.assertEqual(self.estado(), antes)
+
+
+# ==============================================================================
+# LOTES DEL TABLERO KANBAN
+# ==============================================================================
+
+class LoteTableroTests(TestCase):
+
+    def setUp(self):
+        prospecto = crear_prospectos(1, prefijo='kanban')[0]
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Tablero')
+        self.columna = KanbanColumna.objects.create(proyecto=self.proyecto, titulo='Pendiente', rango='i')
+        self.tarea = KanbanTarea.objects.create(columna=self.columna, titulo='Tarea', rango='i')
+
+    def estado_tablero(self):
+        return (
+            list(KanbanColumna.objects.filter(proyecto=self.proyecto).order_by('pk').values_list(
+                'pk', 'titulo', 'rango'
+            )),
+            list(KanbanTarea.objects.filter(columna__proyecto=self.proyecto).order_by('pk').values_list(
+                'pk', 'columna_id', 'titulo', 'rango'
+            )),
+            VersionDatos.obtener(VersionDatos.Ambito.TABLERO, self.proyecto.pk)[0],
+        )
+
+    def operaciones_validas(self):
+        return [
+            {'op': 'crear_columna', 'ref': 'nueva', 'titulo': 'En curso', 'anterior_id': self.columna.pk},
+            {'op': 'crear_tarea', 'columna_id': 'nueva', 'titulo': 'Otra tarea'},
+            {'op': 'actualizar_columna', 'id': self.columna.pk, 'titulo': 'Por hacer'},
+            {'op': 'mover_tarea', 'id': self.tarea.pk, 'columna_id': 'nueva'},
+        ]
+
+    def test_lote_valido(self):
+        deltas = LoteTablero(self.proyecto.pk).aplicar(self.operaciones_validas())
+        self.assertEqual([d['accion'] for d in deltas], [
+            'columna_creada', 'tarea_creada', 'columna_actualizada', 'tarea_movida',
+        ])
+        nueva = KanbanColumna.objects.get(proyecto=self.proyecto, titulo='En curso')
+        self.assertEqual(deltas[0]['columna']['id'], str(nueva.pk))
+        self.assertGreater(nueva.rango, 'i')
+        self.assertEqual(KanbanTarea.objects.get(pk=self.tarea.pk).columna_id, nueva.pk)
+        self.assertEqual(KanbanColumna.objects.get(pk=self.columna.pk).titulo, 'Por hacer')
+
+    def test_operacion_invalida_no_guarda_nada_e_indica_su_indice(self):
+        antes = self.estado_tablero()
+        operaciones = self.operaciones_validas()
+        operaciones.insert(3, {'op': 'eliminar_tarea', 'id': 999999})
+        with self.assertRaises(ErrorLote) as contexto:
+            LoteTablero(self.proyecto.pk).aplicar(operaciones)
+        self.assertEqual(contexto.exception.indice, 3)
+        self.assertEqual(self.estado_tablero(), antes)
+
+    def test_operacion_desconocida(self):
+        with self.assertRaises(ErrorLote) as contexto:
+            LoteTablero(self.proyecto.pk).aplicar([{'op': 'crear_columna', 'titulo': 'A'}, {'op': 'renombrar'}])
+        self.assertEqual(contexto.exception.indice, 1)
+
+    def test_fallo_al_guardar_revierte_el_lote_completo(self):
+        antes = self.estado_tablero()
+        with mock.patch('ventas.kanban.VersionDatos.incrementar', side_effect=RuntimeError('fallo')):
+            with self.assertRaises(RuntimeError):
+                LoteTablero(self.proyecto.pk).aplicar(self.operaciones_validas())
+        self.assertEqual(self.estado_tablero(), antes)
+
+
+# ==============================================================================
+# REGISTRO DE CAMBIOS DEL TABLERO
+# ==============================================================================
+
+@override_settings(KANBAN_CAMBIOS_COMPACTAR_CADA=5, KANBAN_CAMBIOS_CONSERVAR=3)
+class CambiosTableroTests(TestCase):
+    """
+    Doce cambios, cada uno crea una tarea. Se compacta en las versiones 5 y
+    10; tras la segunda el registro conserva de la 8 a la 12 y la
+    instantánea queda en la 10.
+    """
+
+    def setUp(self):
+        prospecto = crear_prospectos(1, prefijo='cambios')[0]
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Registro')
+        self.columna = KanbanColumna.objects.create(proyecto=self.proyecto, titulo='Pendiente', rango='i')
+        self.tareas_por_version = {}
+        for version in range(1, 13):
+            tarea = KanbanTarea.objects.create(columna=self.columna, titulo=f'Tarea {version}', rango=f'i{version:x}')
+            self.tareas_por_version[version] = str(tarea.pk)
+            registrada = registrar_cambio(self.proyecto.pk, [{
+                'accion': 'tarea_creada',
+                'tarea': {'id': str(tarea.pk), 'columna_id': str(self.columna.pk), 'titulo': tarea.titulo},
+            }])
+            self.assertEqual(registrada, version)
+
+    def ponerse_al_dia(self, desde):
+        """Tareas que vería un cliente en la versión `desde` tras aplicar la respuesta."""
+        respuesta = cambios_desde(self.proyecto.pk, desde)
+        if 'instantanea' in respuesta:
+            tareas = {item['id'] for board in respuesta['instantanea'] for item in board['item']}
+        else:
+            tareas = {self.tareas_por_version[v] for v in range(1, desde + 1)}
+        for cambio in respuesta['cambios']:
+            tareas.update(delta['tarea']['id'] for delta in cambio['deltas'])
+        return respuesta, tareas
+
+    def tareas_actuales(self):
+        return {item['id'] for board in datos_tablero(self.proyecto.pk) for item in board['item']}
+
+    def test_compactacion(self):
+        self.assertEqual(InstantaneaTablero.objects.get(proyecto=self.proyecto).version, 10)
+        self.assertEqual(
+            list(CambioTablero.objects.filter(proyecto=self.proyecto).values_list('version', flat=True)),
+            [8, 9, 10, 11, 12],
+        )
+
+    def test_cliente_dentro_del_registro(self):
+        for desde in (7, 9, 11):
+            respuesta, tareas = self.ponerse_al_dia(desde)
+            self.assertNotIn('instantanea', respuesta)
+            self.assertEqual([c['version'] for c in respuesta['cambios']], list(range(desde + 1, 13)))
+            self.assertEqual(respuesta['version'], 12)
+            self.assertEqual(tareas, self.tareas_actuales())
+
+    def test_cliente_al_dia(self):
+        respuesta = cambios_desde(self.proyecto.pk, 12)
+        self.assertEqual(respuesta, {'version': 12, 'cambios': []})
+
+    def test_cliente_anterior_a_la_compactacion(self):
+        for desde in (0, 3, 6):
+            respuesta, tareas = self.ponerse_al_dia(desde)
+            self.assertIn('instantanea', respuesta)
+            self.assertEqual([c['version'] for c in respuesta['cambios']], [11, 12])
+            self.assertEqual(respuesta['version'], 12)
+            self.assertEqual(tareas, self.tareas_actuales())
+
+    def test_version_desconocida(self):
+        respuesta, tareas = self.ponerse_al_dia(99)
+        self.assertIn('instantanea', respuesta)
+        self.assertEqual(respuesta['version'], 12)
+        self.assertEqual(tareas, self.tareas_actuales())
+
+
+class TableroSerializadoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        prospecto = crear_prospectos(1, prefijo='serializado')[0]
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Tablero')
+        self.columna = KanbanColumna.objects.create(proyecto=self.proyecto, titulo='Pendiente', rango='i')
+        self.tarea = KanbanTarea.objects.create(columna=self.columna, titulo='Original', rango='i')
+
+    def titulos(self):
+        version, datos = tablero_serializado(self.proyecto.pk)
+        return version, [item['title'] for board in json.loads(datos) for item in board['item']]
+
+    def test_se_sirve_de_cache_hasta_que_cambia_la_version(self):
+        self.assertEqual(self.titulos(), (0, ['Original']))
+        # Sin cambios solo se lee la versión.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.titulos(), (0, ['Original']))
+
+        # Una escritura que no pasa por registrar_cambio también sube la versión TABLERO.
+        KanbanTarea.objects.filter(pk=self.tarea.pk).update(titulo='Sin señal')
+        self.assertEqual(self.titulos(), (0, ['Original']))
+        self.tarea.titulo = 'Renombrada'
+        self.tarea.save()
+        self.assertEqual(self.titulos(), (0, ['Renombrada']))
+
+        otra = KanbanTarea.objects.create(columna=self.columna, titulo='Nueva', rango='j')
+        registrar_cambio(self.proyecto.pk, [{'accion': 'tarea_creada', 'tarea': {'id': str(otra.pk)}}])
+        self.assertEqual(self.titulos(), (1, ['Renombrada', 'Nueva']))
+
+        reordenar_tareas(self.proyecto.pk, {self.columna.pk: [otra.pk, self.tarea.pk]})
+        self.assertEqual(self.titulos(), (1, ['Nueva', 'Renombrada']))
+
+
+# ==============================================================================
+# EVENTOS DEL TABLERO
+# ==============================================================================
+
+class EventosTableroTests(TestCase):
+
+    def setUp(self):
+        self.ana = User.objects.create_user('ana')
+        self.luis = User.objects.create_user('luis')
+        prospecto = Prospecto.objects.create(nombre_completo='Propio', email='propio@ejemplo.com', asignado_a=self.ana)
+        self.proyecto = Proyecto.objects.create(prospecto=prospecto, nombre_proyecto='Tablero')
+        self.backend = mock.Mock()
+        patcher = mock.patch.object(eventos, '_backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def publicados(self):
+        return [json.loads(c.args[1]) for c in self.backend.publicar.call_args_list]
+
+    def test_registrar_cambio_numera_en_orden_y_publica_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            versiones = [
+                registrar_cambio(self.proyecto.pk, [{'accion': 'columna_actualizada', 'n': n}], 'pestana')
+                for n in range(3)
+            ]
+            self.backend.publicar.assert_not_called()
+        self.assertEqual(versiones, [1, 2, 3])
+        self.assertEqual(len(callbacks), 3)
+        self.assertEqual(
+            list(CambioTablero.objects.filter(proyecto=self.proyecto).values_list('version', 'deltas')),
+            [(v, [{'accion': 'columna_actualizada', 'n': v - 1}]) for v in versiones],
+        )
+        self.assertEqual(
+            [(m['version'], m['origen'], m['deltas'][0]['n']) for m in self.publicados()],
+            [(1, 'pestana', 0), (2, 'pestana', 1), (3, 'pestana', 2)],
+        )
+        self.assertEqual(
+            {c.args[0] for c in self.backend.publicar.call_args_list}, {f'tablero:{self.proyecto.pk}'}
+        )
+
+    def test_un_cambio_deshecho_no_se_publica_ni_se_registra(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    registrar_cambio(self.proyecto.pk, [{'accion': 'columna_actualizada'}])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.assertEqual(registrar_cambio(self.proyecto.pk, []), 0)
+        self.assertEqual(callbacks, [])
+        self.backend.publicar.assert_not_called()
+        self.assertFalse(CambioTablero.objects.exists())
+
+    def test_cambios_tablero_api_permisos(self):
+        url = reverse('api-cambios-tablero', kwargs={'proyecto_pk': self.proyecto.pk})
+        self.client.force_login(self.luis)
+        self.assertEqual(self.client.get(url, {'desde': 0}).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('api-cambios-tablero', kwargs={'proyecto_pk': 999999}), {'desde': 0}).status_code,
+            404,
+        )
+        self.client.force_login(self.ana)
+        self.assertEqual(self.client.get(url, {'desde': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'desde': 0}).json(), {'version': 0, 'cambios': []})
+
+    def test_sse_deshabilitado_o_fuera_de_asgi_responde_503(self):
+        url = reverse('api-eventos-tablero', kwargs={'proyecto_pk': self.proyecto.pk})
+        self.client.force_login(self.ana)
+        for habilitado in (False, True):
+            with self.subTest(habilitado=habilitado), override_settings(EVENTOS_SSE_HABILITADO=habilitado):
+                # El cliente de pruebas síncrono construye una petición WSGI.
+                self.assertEqual(self.client.get(url).status_code, 503)
+
+    @override_settings(EVENTOS_SSE_HABILITADO=False)
+    async def test_sse_deshabilitado_bajo_asgi_responde_503(self):
+        await self.async_client.aforce_login(self.ana)
+        respuesta = await self.async_client.get(
+            reverse('api-eventos-tablero', kwargs={'proyecto_pk': self.proyecto.pk})
+        )
+        self.assertEqual(respuesta.status_code, 503)
+
+    @override_settings(EVENTOS_SSE_HABILITADO=True)
+    async def test_sse_permisos(self):
+        await self.async_client.aforce_login(self.luis)
+        url = reverse('api-eventos-tablero', kwargs={'proyecto_pk': self.proyecto.pk})
+        self.assertEqual((await self.async_client.get(url)).status_code, 403)
+        inexistente = reverse('api-eventos-tablero', kwargs={'proyecto_pk': 999999})
+        self.assertEqual((await self.async_client.get(inexistente)).status_code, 404)
+
+        await self.async_client.aforce_login(self.ana)
+        respuesta = await self.async_client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        flujo = aiter(respuesta.streaming_content)
+        self.assertEqual(await anext(flujo), b'retry: 3000\n\n')
+        self.backend.suscribir.assert_called_once_with(f'tablero:{self.proyecto.pk}')
+
+
+# ==============================================================================
+# JSON PATCH (RFC 6902, APÉNDICE A)
+# ==============================================================================
+
+class ParcheJsonTests(SimpleTestCase):
+    # (sección, documento, parche, resultado). A.13 (claves "op" duplicadas)
+    # no aplica: el parche llega ya decodificado.
+    EJEMPLOS = [
+        ('A.1', {'foo': 'bar'},
+         [{'op': 'add', 'path': '/baz', 'value': 'qux'}],
+         {'baz': 'qux', 'foo': 'bar'}),
+        ('A.2', {'foo': ['bar', 'baz']},
+         [{'op': 'add', 'path': '/foo/1', 'value': 'qux'}],
+         {'foo': ['bar', 'qux', 'baz']}),
+        ('A.3', {'baz': 'qux', 'foo': 'bar'},
+         [{'op': 'remove', 'path': '/baz'}],
+         {'foo': 'bar'}),
+        ('A.4', {'foo': ['bar', 'qux', 'baz']},
+         [{'op': 'remove', 'path': '/foo/1'}],
+         {'foo': ['bar', 'baz']}),
+        ('A.5', {'baz': 'qux', 'foo': 'bar'},
+         [{'op': 'replace', 'path': '/baz', 'value': 'boo'}],
+         {'baz': 'boo', 'foo': 'bar'}),
+        ('A.6', {'foo': {'bar': 'baz', 'waldo': 'fred'}, 'qux': {'corge': 'grault'}},
+         [{'op': 'move', 'from': '/foo/waldo', 'path': '/qux/thud'}],
+         {'foo': {'bar': 'baz'}, 'qux': {'corge': 'grault', 'thud': 'fred'}}),
+        ('A.7', {'foo': ['all', 'grass', 'cows', 'eat']},
+         [{'op': 'move', 'from': '/foo/1', 'path': '/foo/3'}],
+         {'foo': ['all', 'cows', 'eat', 'grass']}),
+        ('A.8', {'baz': 'qux', 'foo': ['a', 2, 'c']},
+         [{'op': 'test', 'path': '/baz', 'value': 'qux'}, {'op': 'test', 'path': '/foo/1', 'value': 2}],
+         {'baz': 'qux', 'foo': ['a', 2, 'c']}),
+        ('A.10', {'foo': 'bar'},
+         [{'op': 'add', 'path': '/child', 'value': {'grandchild': {}}}],
+         {'foo': 'bar', 'child': {'grandchild': {}}}),
+        ('A.11', {'foo': 'bar'},
+         [{'op': 'add', 'path': '/baz', 'value': 'qux', 'xyz': 123}],
+         {'foo': 'bar', 'baz': 'qux'}),
+        ('A.14', {'/': 9, '~1': 10},
+         [{'op': 'test', 'path': '/~01', 'value': 10}],
+         {'/': 9, '~1': 10}),
+        ('A.16', {'foo': ['bar']},
+         [{'op': 'add', 'path': '/foo/-', 'value': ['abc', 'def']}],
+         {'foo': ['bar', ['abc', 'def']]}),
+    ]
+
+    ERRORES = [
+        ('A.9', {'baz': 'qux'}, [{'op': 'test', 'path': '/baz', 'value': 'bar'}]),
+        ('A.12', {'foo': 'bar'}, [{'op': 'add', 'path': '/baz/bat', 'value': 'qux'}]),
+        ('A.15', {'/': 9, '~1': 10}, [{'op': 'test', 'path': '/~01', 'value': '10'}]),
+    ]
+
+    def test_ejemplos_del_apendice_a(self):
+        for seccion, documento, parche, esperado in self.EJEMPLOS:
+            with self.subTest(seccion):
+                self.assertEqual(aplicar_parche(documento, parche), esperado)
+
+    def test_errores_del_apendice_a(self):
+        for seccion, documento, parche in self.ERRORES:
+            with self.subTest(seccion), self.assertRaises(ErrorParche) as contexto:
+                aplicar_parche(documento, parche)
+            self.assertEqual(contexto.exception.indice, 0)
+
+    def test_indice_de_la_operacion_que_falla(self):
+        parche = [
+            {'op': 'add', 'path': '/a', 'value': 1},
+            {'op': 'replace', 'path': '/a', 'value': 2},
+            {'op': 'remove', 'path': '/b'},
+        ]
+        with self.assertRaises(ErrorParche) as contexto:
+            aplicar_parche({}, parche)
+        self.assertEqual(contexto.exception.indice, 2)
+
+    def test_los_valores_se_copian(self):
+        valor = {'x': [1]}
+        documento = aplicar_parche({}, [{'op': 'add', 'path': '/v', 'value': valor}])
+        documento['v']['x'].append(2)
+        self.assertEqual(valor, {'x': [1]})
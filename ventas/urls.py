@@ -12,6 +12,10 @@ from .views import (
     add_recordatorio,
     toggle_recordatorio,
     export_prospectos_excel,
+    importar_prospectos,
+    solicitar_exportacion_prospectos,
+    estado_exportacion,
+    descargar_exportacion,
     TrabajadorListView,
     TrabajadorCreateView,
     TrabajadorUpdateView,
@@ -25,8 +29,15 @@ from .views import (
     ProspectoTrabajadorDeleteView,
     add_archivo,
     delete_archivo,
+    descargar_archivo,
+    miniatura_archivo,
+    iniciar_subida_archivo,
+    confirmar_subida_archivo,
+    subida_local,
     CalendarioView,
     calendario_eventos,
+    calendario_ics,
+    regenerar_token_calendario,
     ClienteCerradoListView,
     update_proyecto,
     add_entregable,
@@ -34,6 +45,7 @@ from .views import (
     asignar_miembro_equipo,
     ProyectoDetailView,
     ProyectoFlujoTrabajoView,
+    tablero_datos_api,
     crear_columna_api,
     crear_tarea_api,
     mover_tarea_api,
@@ -44,8 +56,8 @@ from .views import (
     EntregableUpdateView, EntregableDeleteView,
     DesasignarMiembroEquipoView,
     SeguimientoProyectoUpdateView, SeguimientoProyectoDeleteView,guardar_diagrama_api,
-    descargar_diagrama_pdf,DiagramaEditorView,reordenar_columnas_api,
-    get_diagrama_api,
+    descargar_diagrama_pdf,DiagramaEditorView,reordenar_columnas_api,reordenar_tareas_api,lote_tablero_api,eventos_tablero,cambios_tablero_api,
+    get_diagrama_api,parche_diagrama_api,
     guardar_diagrama_api,
     descargar_diagrama_pdf,
 )
@@ -57,6 +69,10 @@ urlpatterns = [
     # --- Prospectos ---
     path('prospectos/', ProspectoListView.as_view(), name='prospecto-list'),
     path('prospectos/export/', export_prospectos_excel, name='export-prospectos-excel'),
+    path('prospectos/export/solicitar/', solicitar_exportacion_prospectos, name='solicitar-exportacion-prospectos'),
+    path('exportacion/<int:pk>/estado/', estado_exportacion, name='exportacion-estado'),
+    path('exportacion/<int:pk>/descargar/', descargar_exportacion, name='exportacion-descargar'),
+    path('prospectos/importar/', importar_prospectos, name='importar-prospectos'),
     path('prospecto/nuevo/', ProspectoCreateView.as_view(), name='prospecto-create'),
     path('prospecto/<int:pk>/', ProspectoDetailView.as_view(), name='prospecto-detail'),
     path('prospecto/<int:pk>/editar/', ProspectoUpdateView.as_view(), name='prospecto-update'),
@@ -67,6 +83,9 @@ urlpatterns = [
     path('prospecto/<int:prospecto_pk>/add-interaccion/', add_interaccion, name='add-interaccion'),
     path('prospecto/<int:prospecto_pk>/add-recordatorio/', add_recordatorio, name='add-recordatorio'),
     path('prospecto/<int:prospecto_pk>/add-archivo/', add_archivo, name='add-archivo'),
+    path('prospecto/<int:prospecto_pk>/subida/iniciar/', iniciar_subida_archivo, name='iniciar-subida-archivo'),
+    path('prospecto/<int:prospecto_pk>/subida/confirmar/', confirmar_subida_archivo, name='confirmar-subida-archivo'),
+    path('subida-local/', subida_local, name='subida-local'),
 
     # --- Clientes y Proyectos ---
     path('clientes/', ClienteCerradoListView.as_view(), name='cliente-cerrado-list'),
@@ -94,8 +113,12 @@ urlpatterns = [
 
     # --- Archivos ---
     path('archivo/<int:pk>/eliminar/', delete_archivo, name='delete-archivo'),
+    path('archivo/<int:pk>/descargar/', descargar_archivo, name='descargar-archivo'),
+    path('archivo/<int:pk>/miniatura/', miniatura_archivo, name='miniatura-archivo'),
     path('calendario/', CalendarioView.as_view(), name='calendario'),
     path('api/calendario-eventos/', calendario_eventos, name='calendario-eventos'),
+    path('calendario/token/', regenerar_token_calendario, name='regenerar-token-calendario'),
+    path('calendario/ics/<str:token>/', calendario_ics, name='calendario-ics'),
 
     # --- URLs PARA GESTIÓN DE PROYECTOS ---
     path('proyecto/<int:pk>/update/', update_proyecto, name='update-proyecto'),
@@ -105,6 +128,7 @@ urlpatterns = [
     
     # --- ✅ NUEVAS RUTAS PARA EL FLUJO DE TRABAJO (KANBAN) ---
     path('proyecto/<int:pk>/flujo-trabajo/', ProyectoFlujoTrabajoView.as_view(), name='proyecto-flujo-trabajo'),
+    path('api/proyecto/<int:proyecto_pk>/tablero/', tablero_datos_api, name='api-tablero-datos'),
     path('api/proyecto/<int:proyecto_pk>/columna/crear/', crear_columna_api, name='api-crear-columna'),
     path('api/columna/<int:columna_pk>/tarea/crear/', crear_tarea_api, name='api-crear-tarea'),
     path('api/tarea/mover/', mover_tarea_api, name='api-mover-tarea'),
@@ -134,9 +158,14 @@ urlpatterns = [
     
     # ✅ NUEVA RUTA API: Para obtener los datos JSON de un diagrama
     path('api/diagrama/<int:diagrama_pk>/', get_diagrama_api, name='api-get-diagrama'),
+    path('api/diagrama/<int:diagrama_pk>/parche/', parche_diagrama_api, name='api-parche-diagrama'),
 
     # Se mantiene la misma URL para guardar, pero su lógica cambiará
     path('api/proyecto/<int:proyecto_pk>/guardar-diagrama/', guardar_diagrama_api, name='api-guardar-diagrama'),
     path('diagrama/<int:diagrama_pk>/descargar-pdf/', descargar_diagrama_pdf, name='descargar-diagrama-pdf'),
      path('api/proyecto/<int:proyecto_pk>/reordenar-columnas/', reordenar_columnas_api, name='api-reordenar-columnas'),
+     path('api/proyecto/<int:proyecto_pk>/reordenar-tareas/', reordenar_tareas_api, name='api-reordenar-tareas'),
+     path('api/proyecto/<int:proyecto_pk>/tablero/lote/', lote_tablero_api, name='api-lote-tablero'),
+     path('api/proyecto/<int:proyecto_pk>/tablero/eventos/', eventos_tablero, name='api-eventos-tablero'),
+     path('api/proyecto/<int:proyecto_pk>/tablero/cambios/', cambios_tablero_api, name='api-cambios-tablero'),
 ]
\ No newline at end of file
@@ -0,0 +1,74 @@
+# ventas/versiones.py
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import VersionDatos
+
+
+# ==============================================================================
+# RESPUESTAS VERSIONADAS
+# ==============================================================================
+# Cada feed JSON depende de un contador de VersionDatos. Con él se arma el
+# ETag (y Last-Modified), se responde 304 si el cliente ya tiene esa versión y,
+# si no, se sirve el JSON serializado desde la caché mientras la versión no
+# cambie. La versión se lee antes que los datos, así que una escritura
+# concurrente nunca deja en caché datos más viejos que su versión.
+
+def _huella(variante):
+    return hashlib.sha1(str(variante).encode()).hexdigest()[:12] if variante else '0'
+
+
+def payload_versionado(ambito, clave, generar, variante='', version=None):
+    """
+    Devuelve el JSON (str) de `generar()` para la versión actual del ámbito,
+    usando la caché. `variante` distingue parámetros (p. ej. rangos de fechas).
+    """
+    if version is None:
+        version, _ = VersionDatos.obtener(ambito, clave)
+    clave_cache = f"ventas:payload:{ambito}:{clave}:{version}:{_huella(variante)}"
+    contenido = cache.get(clave_cache)
+    if contenido is None:
+        contenido = json.dumps(generar(), cls=DjangoJSONEncoder)
+        cache.set(clave_cache, contenido, settings.CACHE_PAYLOAD_TTL)
+    return contenido
+
+
+def respuesta_versionada(request, ambito, clave, construir, variante=''):
+    """
+    Responde 304 si el cliente ya tiene la versión actual; si no, devuelve
+    `construir(version)`. En ambos casos añade ETag, Last-Modified y
+    Cache-Control.
+    """
+    version, fecha = VersionDatos.obtener(ambito, clave)
+    etag = quote_etag(f"{ambito.lower()}-{clave}-{version}-{_huella(variante)}")
+    ultima_modificacion = int(fecha.timestamp()) if fecha else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        response = construir(version)
+    response['ETag'] = etag
+    if ultima_modificacion:
+        response['Last-Modified'] = http_date(ultima_modificacion)
+    # Privada (depende del usuario) y siempre revalidada: el sondeo cuesta un 304.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def respuesta_json_versionada(request, ambito, clave, generar, variante=''):
+    """JSON de `generar()` servido desde la caché, con ETag y 304 si no hubo cambios."""
+    return respuesta_versionada(
+        request, ambito, clave,
+        lambda version: HttpResponse(
+            payload_versionado(ambito, clave, generar, variante, version=version),
+            content_type='application/json',
+        ),
+        variante,
+    )
@@ -1,9 +1,14 @@
 # ventas/views.py
 
-import boto3
 import os
+import re
+import tempfile
+import uuid
+from itertools import islice
+from asgiref.sync import sync_to_async
 from botocore.exceptions import BotoCoreError, NoCredentialsError
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import (
     ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
@@ -14,25 +19,42 @@ from django.urls import reverse_lazy, reverse
 from .models import (
     Prospecto, Interaccion, Recordatorio, Etiqueta, Trabajador, 
     ProspectoTrabajador, ArchivoAdjunto, Proyecto, Entregable, 
-    EquipoProyecto, SeguimientoProyecto,KanbanColumna, KanbanTarea,DiagramaProyecto 
+    EquipoProyecto, SeguimientoProyecto,KanbanColumna, KanbanTarea,DiagramaProyecto,
+    ContadorEstadoProspecto, TrabajoExportacion, VersionDatos, TokenCalendario
 )
 from .forms import (
     ProspectoForm, InteraccionForm, RecordatorioForm, TrabajadorForm, 
     ProspectoTrabajadorForm, ProspectoTrabajadorUpdateForm, ArchivoAdjuntoForm,
-    ProyectoUpdateForm, AsignarMiembroEquipoForm, EntregableForm, SeguimientoProyectoForm, KanbanTareaForm # <-- Nuevos
+    ProyectoUpdateForm, AsignarMiembroEquipoForm, EntregableForm, SeguimientoProyectoForm, KanbanTareaForm, # <-- Nuevos
+    ImportarProspectosForm
 )
-from django.db.models import Count, Q, Avg
-from django.http import HttpResponseForbidden, HttpResponse
-from openpyxl import Workbook
+from django.db import transaction
+from django.db.models import Count, F, Q, Avg
+from django.http import HttpResponseForbidden, HttpResponse, FileResponse, Http404, StreamingHttpResponse
 from django.contrib import messages
-from django.db.models.functions import ExtractDay, Now
-from openpyxl.styles import Font
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 import json
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 import pytz 
-from django.core.paginator import Paginator
-from django.db.models import Subquery, OuterRef, Case, When, F, IntegerField
+from .paginacion import CursorPaginationMixin, CursorPaginator, tamano_pagina
+from .busqueda import buscar_prospectos
+from .exportacion import escribir_libro_prospectos, prospectos_para_exportar
+from .importacion import ImportadorProspectos, ErrorImportacion
+from .versiones import respuesta_json_versionada, respuesta_versionada
+from .calendario_ics import generar_ics
+from .parche_json import ErrorParche, aplicar_parche
+from .eventos import canal_tablero, obtener_backend
+from .kanban import (
+    ErrorLote, LoteTablero, cambios_desde, rango_columna, rango_tarea, registrar_cambio, reordenar_columnas,
+    reordenar_tareas, tablero_serializado,
+)
+from .almacenamiento import (
+    obtener_cliente_s3, clave_s3, post_prefirmado, existe_objeto, usa_s3_local,
+    url_descarga, almacenar_contenido, liberar_contenido, rescatar_borrados, esperar_borrados_en_curso
+)
+from django.core import signing
+from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.views.generic import TemplateView #
 
@@ -81,7 +103,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         if not user.is_superuser:
             prospectos_qs = prospectos_qs.filter(asignado_a=user)
 
-        context['total_prospectos'] = prospectos_qs.count()
+        # Los totales por estado salen de la tabla de contadores (O(número de estados)).
+        conteos_estado = ContadorEstadoProspecto.conteos_por_estado(user)
+        context['total_prospectos'] = sum(conteos_estado.values())
         
         quince_dias_atras = hoy - timedelta(days=15)
         context['prospectos_nuevos'] = prospectos_qs.filter(
@@ -89,13 +113,12 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             fecha_creacion__gte=quince_dias_atras
         ).count()
         
-        context['clientes_ganados'] = prospectos_qs.filter(estado=Prospecto.Estado.GANADO).count()
+        context['clientes_ganados'] = conteos_estado.get(Prospecto.Estado.GANADO, 0)
         
-        reporte_data = prospectos_qs.values('estado').annotate(total=Count('estado')).order_by('estado')
         estado_display_map = dict(Prospecto.Estado.choices) 
         chart_data = {
-            "labels": [estado_display_map.get(item['estado'], item['estado']) for item in reporte_data],
-            "data": [item['total'] for item in reporte_data],
+            "labels": [estado_display_map.get(estado, estado) for estado in conteos_estado],
+            "data": list(conteos_estado.values()),
         }
         context['chart_data_json'] = json.dumps(chart_data)
         
@@ -104,36 +127,17 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         ).values('trabajador__nombre').annotate(promedio=Avg('calificacion')).order_by('-promedio')
         context['promedio_calificaciones_trabajador'] = promedio_calificaciones
 
-        ultima_interaccion_subquery = Interaccion.objects.filter(
-            prospecto=OuterRef('pk')
-        ).order_by('-fecha').values('fecha')[:1]
-        
+        # Rango sobre el índice parcial de 'ultima_actividad' (solo prospectos abiertos).
         prospectos_inactivos = prospectos_qs.exclude(
             estado__in=[Prospecto.Estado.GANADO, Prospecto.Estado.PERDIDO]
-        ).annotate(
-            ultima_interaccion=Subquery(ultima_interaccion_subquery)
-        ).annotate(
-            dias_inactivo=Case(
-                When(
-                    ultima_interaccion__isnull=True, 
-                    then=ExtractDay(Now() - F('fecha_creacion'))
-                ),
-                When(
-                    ultima_interaccion__isnull=False,
-                    then=ExtractDay(Now() - F('ultima_interaccion'))
-                ),
-                output_field=IntegerField()
-            )
         ).filter(
-            dias_inactivo__gte=1
-        ).order_by('-dias_inactivo')
+            ultima_actividad__lte=timezone.now() - timedelta(days=1)
+        ).order_by('ultima_actividad', 'id')
         
-        page_size = int(self.request.GET.get('page_size', 10))
-        paginator = Paginator(prospectos_inactivos, page_size)
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        
-        context['prospectos_inactivos'] = page_obj
+        paginator = CursorPaginator(
+            prospectos_inactivos, ('ultima_actividad', 'id'), tamano_pagina(self.request), contar=False
+        )
+        context['prospectos_inactivos'] = paginator.get_page(self.request.GET.get('cursor'))
         context['seguimiento_requerido_count'] = prospectos_inactivos.count()
 
         quince_dias_despues = hoy + timedelta(days=15)
@@ -153,11 +157,12 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         return context
 
 
-class ProspectoListView(LoginRequiredMixin, ListView):
+class ProspectoListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Prospecto
     template_name = 'ventas/prospecto_list.html'
     context_object_name = 'prospectos'
     paginate_by = 10
+    cursor_ordering = ('-fecha_creacion', '-id')
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -170,23 +175,18 @@ class ProspectoListView(LoginRequiredMixin, ListView):
         
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(nombre_completo__icontains=query) |
-                Q(email__icontains=query) |
-                Q(empresa__icontains=query)
-            )
+            queryset = buscar_prospectos(queryset, query)
         return queryset
 
+    def get_cursor_ordering(self):
+        # Con búsqueda, los resultados van por relevancia.
+        if self.request.GET.get('q'):
+            return ('-rango', '-id')
+        return self.cursor_ordering
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        base_qs = self.model.objects.all()
-        if not self.request.user.is_superuser:
-            base_qs = base_qs.filter(asignado_a=self.request.user)
-
-        status_counts_dict = {
-            item['estado']: item['total'] 
-            for item in base_qs.values('estado').annotate(total=Count('id'))
-        }
+        status_counts_dict = ContadorEstadoProspecto.conteos_por_estado(self.request.user)
 
         status_cards_data = []
         for value, name in Prospecto.Estado.choices:
@@ -197,7 +197,7 @@ class ProspectoListView(LoginRequiredMixin, ListView):
             })
 
         context['status_cards'] = status_cards_data
-        context['total_prospectos_global'] = base_qs.count()
+        context['total_prospectos_global'] = sum(status_counts_dict.values())
         return context
 
 class ProspectoDetailView(LoginRequiredMixin, OwnerRequiredMixin, DetailView):
@@ -274,6 +274,32 @@ class ProspectoDeleteView(LoginRequiredMixin, OwnerRequiredMixin, DeleteView):
         messages.success(self.request, f"Prospecto '{self.object.nombre_completo}' ha sido eliminado.")
         return super().form_valid(form)
 
+@login_required
+def importar_prospectos(request):
+    """
+    Importación masiva desde CSV o XLSX. Las filas se validan con las reglas de
+    ProspectoForm y se insertan/actualizan por lotes usando el email como clave.
+    """
+    resultado = None
+    if request.method == 'POST':
+        form = ImportarProspectosForm(request.POST, request.FILES)
+        if form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            try:
+                resultado = ImportadorProspectos(request.user).importar(archivo.file, archivo.name)
+            except ErrorImportacion as e:
+                messages.error(request, str(e))
+                resultado = e.resultado
+            else:
+                messages.success(
+                    request,
+                    f"Importación terminada: {resultado.creados} creados, {resultado.actualizados} actualizados, "
+                    f"{len(resultado.errores)} con errores."
+                )
+    else:
+        form = ImportarProspectosForm()
+    return render(request, 'ventas/prospecto_import.html', {'form': form, 'resultado': resultado})
+
 class TrabajadorListView(LoginRequiredMixin, ListView):
     model = Trabajador
     template_name = 'ventas/trabajador_list.html'
@@ -402,68 +428,105 @@ def toggle_recordatorio(request, pk):
     messages.info(request, f"Recordatorio '{recordatorio.titulo}' {status}.")
     return redirect('prospecto-detail', pk=recordatorio.prospecto.pk)
 
+# Bloques que se leen del iterador síncrono en cada salto al hilo de la base de datos.
+BLOQUES_POR_LECTURA = 16
+
+def _adaptar_streaming(request, response):
+    """
+    Bajo ASGI, Django lee entero en memoria el contenido síncrono de una
+    respuesta en streaming antes de enviarlo. Se sustituye por un iterador
+    asíncrono que lee por bloques en el hilo síncrono de Django (el mismo de
+    la vista, así que los cursores de servidor siguen en su conexión) y los
+    envía a medida que llegan. Bajo WSGI la respuesta queda igual.
+    """
+    if not isinstance(request, ASGIRequest) or response.is_async:
+        return response
+    sincrono = iter(response.streaming_content)
+    leer = sync_to_async(lambda: list(islice(sincrono, BLOQUES_POR_LECTURA)), thread_sensitive=True)
+
+    async def asincrono():
+        while bloques := await leer():
+            for bloque in bloques:
+                yield bloque
+
+    # FileResponse conserva el cierre del archivo en sus _resource_closers.
+    response.streaming_content = asincrono()
+    return response
+
 @login_required
 def export_prospectos_excel(request):
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    """
+    Exporta los prospectos visibles a Excel. El libro se genera en modo
+    write-only sobre un archivo temporal (en memoria hasta cierto tamaño y
+    luego en disco) y se envía en bloques con una respuesta en streaming.
+    """
     timestamp = timezone.now().strftime('%Y-%m-%d_%H-%M')
-    response['Content-Disposition'] = f'attachment; filename="prospectos_{timestamp}.xlsx"'
-    
-    workbook = Workbook()
-    worksheet = workbook.active
-    worksheet.title = 'Prospectos'
-    
-    headers = [
-        'Nombre Completo', 'Email', 'Teléfono', 'Empresa', 'Puesto', 'Estado', 
-        'Interés', 'Calificación Prom.', 'Referido Por', 'Contacto Ref.',
-        'Detalle Interés', 'Trabajadores', 'Etiquetas', 'Asignado a', 'Fecha Creación'
-    ]
-    for col_num, header_title in enumerate(headers, 1):
-        cell = worksheet.cell(row=1, column=col_num, value=header_title)
-        cell.font = Font(bold=True)
-
-    prospectos_qs = Prospecto.objects.annotate(
-        promedio_calificacion=Avg('prospectotrabajador__calificacion')
-    )
+    archivo = tempfile.SpooledTemporaryFile(max_size=settings.EXPORTACION_MAX_MEMORIA)
+    escribir_libro_prospectos(prospectos_para_exportar(request.user), archivo)
+    archivo.seek(0)
+    return _adaptar_streaming(request, FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=f"prospectos_{timestamp}.xlsx",
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    ))
+
+def _trabajo_exportacion_json(trabajo):
+    data = {
+        'id': trabajo.pk,
+        'estado': trabajo.estado,
+        'estado_display': trabajo.get_estado_display(),
+        'progreso': trabajo.progreso,
+        'filas_procesadas': trabajo.filas_procesadas,
+        'total_filas': trabajo.total_filas,
+        'url_estado': reverse('exportacion-estado', kwargs={'pk': trabajo.pk}),
+    }
+    if trabajo.estado == TrabajoExportacion.Estado.COMPLETADO:
+        data['url_descarga'] = reverse('exportacion-descargar', kwargs={'pk': trabajo.pk})
+    elif trabajo.estado == TrabajoExportacion.Estado.ERROR:
+        data['mensaje_error'] = trabajo.mensaje_error
+    return data
+
+def _obtener_trabajo_exportacion(request, pk):
+    trabajos = TrabajoExportacion.objects.all()
     if not request.user.is_superuser:
-        prospectos_qs = prospectos_qs.filter(asignado_a=request.user)
-    
-    prospectos = prospectos_qs.select_related('asignado_a').prefetch_related('etiquetas', 'trabajadores')
-
-    for row_num, prospecto in enumerate(prospectos, 2):
-        calificacion_str = f"{prospecto.promedio_calificacion:.2f}" if prospecto.promedio_calificacion else "N/A"
-        row_data = [
-            prospecto.nombre_completo, prospecto.email, prospecto.telefono, prospecto.empresa, prospecto.puesto,
-            prospecto.get_estado_display(), prospecto.get_interes_principal_display(), calificacion_str,
-            prospecto.referencio, prospecto.contacto_referencio, prospecto.interes_cliente,
-            ", ".join([t.nombre for t in prospecto.trabajadores.all()]),
-            ", ".join([e.nombre for e in prospecto.etiquetas.all()]),
-            prospecto.asignado_a.username if prospecto.asignado_a else '',
-            # Se cambió 'fecha_creation' por 'fecha_creacion'
-            prospecto.fecha_creacion.strftime('%Y-%m-%d %H:%M') if prospecto.fecha_creacion else ''
-        ]
-        for col_num, cell_value in enumerate(row_data, 1):
-            worksheet.cell(row=row_num, column=col_num, value=cell_value)
-    
-    for i, column_cells in enumerate(worksheet.columns):
-        try:
-            max_length = 0
-            column = chr(65 + i)
-            for cell in column_cells:
-                if cell.value:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-            adjusted_width = (max_length + 2)
-            worksheet.column_dimensions[column].width = adjusted_width
-        except:
-            pass
-            
-    workbook.save(response)
-    return response
+        trabajos = trabajos.filter(usuario=request.user)
+    return get_object_or_404(trabajos, pk=pk)
+
+@login_required
+def solicitar_exportacion_prospectos(request):
+    """
+    Encola la exportación a Excel para el worker `procesar_exportaciones`.
+    Solicitudes idénticas dentro del TTL devuelven el mismo trabajo.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido.'}, status=405)
+    trabajo, creado = TrabajoExportacion.solicitar(
+        request.user, ttl=timedelta(seconds=settings.EXPORTACION_TTL_DEDUPLICACION)
+    )
+    return JsonResponse(_trabajo_exportacion_json(trabajo), status=202 if creado else 200)
+
+@login_required
+def estado_exportacion(request, pk):
+    trabajo = _obtener_trabajo_exportacion(request, pk)
+    return JsonResponse(_trabajo_exportacion_json(trabajo))
+
+@login_required
+def descargar_exportacion(request, pk):
+    trabajo = _obtener_trabajo_exportacion(request, pk)
+    if trabajo.estado != TrabajoExportacion.Estado.COMPLETADO or not trabajo.archivo:
+        return JsonResponse({'status': 'error', 'message': 'La exportación aún no está lista.'}, status=409)
+    return _adaptar_streaming(request, FileResponse(
+        trabajo.archivo.open('rb'),
+        as_attachment=True,
+        filename=os.path.basename(trabajo.archivo.name),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    ))
 
 @login_required
 def add_archivo(request, prospecto_pk):
     """
-    Gestiona la subida de un archivo a S3 usando Boto3 directamente y lo asocia
+    Gestiona la subida de un archivo a S3 (deduplicado por contenido) y lo asocia
     con un prospecto específico. El nombre del archivo se toma automáticamente.
     """
     prospecto = get_object_or_404(Prospecto, pk=prospecto_pk)
@@ -475,38 +538,29 @@ def add_archivo(request, prospecto_pk):
         uploaded_file = form.cleaned_data['archivo']
         titulo_archivo = uploaded_file.name
 
-        # --- CORRECCIÓN IMPORTANTE ---
-        # Construimos la ruta RELATIVA, SIN el prefijo 'media/'.
-        # Django-storages lo añadirá automáticamente al generar la URL.
-        # ej: prospectos/7/documento_propuesta.pdf
-        s3_key = f"prospectos/{prospecto.pk}/{titulo_archivo}"
-
         try:
-            s3_client = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME
-            )
-
-            # La ruta de subida necesita el prefijo 'media/' porque Boto3 no lo conoce.
-            full_s3_path = f"{settings.AWS_LOCATION}/{s3_key}"
-
-            s3_client.upload_fileobj(
-                uploaded_file,
-                settings.AWS_STORAGE_BUCKET_NAME,
-                full_s3_path
-            )
-            
-            # Guardamos en la base de datos la ruta SIN el prefijo 'media/'.
-            archivo_adjunto = ArchivoAdjunto(
-                prospecto=prospecto,
-                nombre=titulo_archivo,
-                archivo=s3_key # <-- Se guarda la ruta relativa
-            )
-            archivo_adjunto.save()
-
-            messages.success(request, f"Archivo '{titulo_archivo}' subido exitosamente.")
+            # El contenido se guarda una sola vez por SHA-256 (contenido/<aa>/<hash>);
+            # si ya existía no se vuelve a subir, solo se suma una referencia.
+            contenido, transferencia = almacenar_contenido(uploaded_file, uploaded_file.content_type)
+            try:
+                # Guardamos en la base de datos la ruta SIN el prefijo 'media/'.
+                ArchivoAdjunto.objects.create(
+                    prospecto=prospecto,
+                    nombre=titulo_archivo,
+                    archivo=contenido.ruta, # <-- Se guarda la ruta relativa
+                    contenido=contenido,
+                    tamano=transferencia.tamano,
+                    hash_sha256=transferencia.hash_sha256,
+                    duracion_transferencia=transferencia.segundos,
+                )
+            except Exception:
+                liberar_contenido(contenido.pk)
+                raise
+
+            if transferencia.reutilizado:
+                messages.success(request, f"Archivo '{titulo_archivo}' adjuntado (el contenido ya estaba almacenado).")
+            else:
+                messages.success(request, f"Archivo '{titulo_archivo}' subido exitosamente.")
 
         except (BotoCoreError, NoCredentialsError) as e:
             messages.error(request, f"Error de configuración o conexión con S3: {e}")
@@ -522,7 +576,8 @@ def add_archivo(request, prospecto_pk):
 @login_required
 def delete_archivo(request, pk):
     """
-    Elimina un archivo adjunto tanto de S3 (usando Boto3) como de la base de datos.
+    Elimina un archivo adjunto de la base de datos. El objeto en S3 se encola
+    y lo borra el worker `procesar_borrados`, así la petición no espera a S3.
     """
     archivo = get_object_or_404(ArchivoAdjunto, pk=pk)
     
@@ -532,34 +587,182 @@ def delete_archivo(request, pk):
     
     prospecto_pk = archivo.prospecto.pk
     file_name = archivo.nombre
-    
-    # --- CORRECCIÓN IMPORTANTE ---
-    # La ruta completa en S3 incluye el prefijo 'media/'
-    full_s3_path = archivo.archivo.name
 
+    archivo.delete()
+    messages.success(request, f"El archivo '{file_name}' ha sido eliminado exitosamente.")
+
+    return redirect('prospecto-detail', pk=prospecto_pk)
+
+@login_required
+def descargar_archivo(request, pk):
+    """
+    Redirige (302) a una URL prefirmada de corta duración: los bytes nunca
+    pasan por Django y el bucket no necesita lectura pública.
+    """
+    archivo = get_object_or_404(ArchivoAdjunto.objects.select_related('prospecto'), pk=pk)
+    if not _puede_editar_prospecto(request.user, archivo.prospecto):
+        return HttpResponseForbidden("No tienes permiso para ver este archivo.")
     try:
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME
-        )
-        
-        s3_client.delete_object(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-            Key=full_s3_path
-        )
+        url = url_descarga(archivo.archivo.name, archivo.nombre)
+    except (BotoCoreError, NoCredentialsError) as e:
+        return HttpResponse(f"Error de configuración o conexión con S3: {e}", status=502)
+    return redirect(url)
 
-        archivo.delete()
-        
-        messages.success(request, f"El archivo '{file_name}' ha sido eliminado exitosamente.")
+@login_required
+def miniatura_archivo(request, pk):
+    """Redirige a la miniatura WebP del adjunto (URL prefirmada y cacheada)."""
+    archivo = get_object_or_404(
+        ArchivoAdjunto.objects.select_related('prospecto'),
+        pk=pk,
+        estado_miniatura=ArchivoAdjunto.EstadoMiniatura.LISTA,
+    )
+    if not _puede_editar_prospecto(request.user, archivo.prospecto):
+        return HttpResponseForbidden("No tienes permiso para ver este archivo.")
+    try:
+        url = url_descarga(archivo.miniatura)
+    except (BotoCoreError, NoCredentialsError) as e:
+        return HttpResponse(f"Error de configuración o conexión con S3: {e}", status=502)
+    return redirect(url)
 
+def _puede_editar_prospecto(user, prospecto):
+    # Mismo criterio que OwnerRequiredMixin: los prospectos sin asignar son de todos.
+    return prospecto.asignado_a_id in (None, user.pk) or user.is_superuser
+
+def _datos_peticion(request):
+    """Acepta tanto JSON como datos de formulario."""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return {}
+    return request.POST
+
+# Identificador de subida que genera _clave_archivo_prospecto. Es corto para
+# dejar sitio al nombre dentro de los 100 caracteres del FileField.
+SUBIDA_ID_RE = re.compile(r'[0-9a-f]{12}')
+
+def _clave_archivo_prospecto(prospecto, nombre, subida=None):
+    """
+    'prospectos/<pk>/<subida>/<nombre>' o None si el nombre no es válido o no
+    cabe en el FileField. `subida` (12 dígitos hexadecimales aleatorios, nuevo
+    si no se indica) separa las subidas de archivos con el mismo nombre.
+    """
+    nombre = os.path.basename(str(nombre or '').replace('\\', '/')).strip()
+    if not nombre or nombre in ('.', '..'):
+        return None
+    subida = subida or uuid.uuid4().hex[:12]
+    s3_key = f"prospectos/{prospecto.pk}/{subida}/{nombre}"
+    if len(s3_key) > ArchivoAdjunto._meta.get_field('archivo').max_length:
+        return None
+    return s3_key
+
+@login_required
+def iniciar_subida_archivo(request, prospecto_pk):
+    """
+    Primer paso de la subida directa: devuelve un POST prefirmado para que el
+    navegador envíe el archivo al almacenamiento sin pasar por Django.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido.'}, status=405)
+    prospecto = get_object_or_404(Prospecto, pk=prospecto_pk)
+    if not _puede_editar_prospecto(request.user, prospecto):
+        return JsonResponse({'status': 'error', 'message': 'No tienes permiso sobre este prospecto.'}, status=403)
+
+    data = _datos_peticion(request)
+    s3_key = _clave_archivo_prospecto(prospecto, data.get('nombre'))
+    if s3_key is None:
+        return JsonResponse({'status': 'error', 'message': 'Nombre de archivo no válido o demasiado largo.'}, status=400)
+    try:
+        tamano = int(data.get('tamano') or 0)
+    except (TypeError, ValueError):
+        tamano = 0
+    if tamano > settings.SUBIDA_DIRECTA_TAMANO_MAXIMO:
+        return JsonResponse({'status': 'error', 'message': 'El archivo excede el tamaño máximo permitido.'}, status=400)
+
+    try:
+        destino = post_prefirmado(
+            clave_s3(s3_key), settings.SUBIDA_DIRECTA_TAMANO_MAXIMO, settings.SUBIDA_DIRECTA_EXPIRACION
+        )
     except (BotoCoreError, NoCredentialsError) as e:
-        messages.error(request, f"Error de conexión con S3 al intentar borrar: {e}")
-    except Exception as e:
-        messages.error(request, f"No se pudo eliminar el archivo del servidor: {e}")
+        return JsonResponse({'status': 'error', 'message': f"Error de configuración o conexión con S3: {e}"}, status=502)
 
-    return redirect('prospecto-detail', pk=prospecto_pk)
+    return JsonResponse({
+        'status': 'success',
+        'url': destino['url'],
+        'fields': destino['fields'],
+        'clave': s3_key,
+        'url_confirmar': reverse('confirmar-subida-archivo', kwargs={'prospecto_pk': prospecto.pk}),
+    })
+
+@login_required
+def confirmar_subida_archivo(request, prospecto_pk):
+    """
+    Segundo paso: comprueba que el objeto existe en el almacenamiento y crea
+    el ArchivoAdjunto con la ruta relativa (sin el prefijo 'media/').
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido.'}, status=405)
+    prospecto = get_object_or_404(Prospecto, pk=prospecto_pk)
+    if not _puede_editar_prospecto(request.user, prospecto):
+        return JsonResponse({'status': 'error', 'message': 'No tienes permiso sobre este prospecto.'}, status=403)
+
+    data = _datos_peticion(request)
+    s3_key = data.get('clave') or ''
+    partes = s3_key.split('/')
+    if (
+        len(partes) != 4 or not SUBIDA_ID_RE.fullmatch(partes[2])
+        or s3_key != _clave_archivo_prospecto(prospecto, partes[3], partes[2])
+    ):
+        return JsonResponse({'status': 'error', 'message': 'Clave de archivo no válida.'}, status=400)
+
+    # Si la clave quedó encolada para borrarse (el adjunto se eliminó entre dos
+    # confirmaciones), se rescata antes de comprobar que el objeto sigue ahí;
+    # si ya se estaba borrando, se espera a ver si sobrevivió.
+    # Cada subida tiene su propia clave: get_or_create solo absorbe una
+    # confirmación repetida de la misma subida.
+    with transaction.atomic():
+        en_curso = rescatar_borrados(s3_key)
+    esperar_borrados_en_curso(en_curso)
+    with transaction.atomic():
+        try:
+            tamano = existe_objeto(clave_s3(s3_key))
+            if tamano is None:
+                return JsonResponse({'status': 'error', 'message': 'El archivo no se encuentra en el almacenamiento.'}, status=404)
+        except (BotoCoreError, NoCredentialsError) as e:
+            return JsonResponse({'status': 'error', 'message': f"Error de configuración o conexión con S3: {e}"}, status=502)
+        archivo_adjunto, creado = ArchivoAdjunto.objects.get_or_create(
+            prospecto=prospecto,
+            archivo=s3_key,
+            defaults={'nombre': (data.get('nombre') or os.path.basename(s3_key))[:255], 'tamano': tamano},
+        )
+    return JsonResponse({
+        'status': 'success',
+        'id': archivo_adjunto.pk,
+        'nombre': archivo_adjunto.nombre,
+        'url': reverse('descargar-archivo', kwargs={'pk': archivo_adjunto.pk}),
+    }, status=201 if creado else 200)
+
+@csrf_exempt
+def subida_local(request):
+    """
+    Destino del POST "prefirmado" cuando se usa el almacenamiento local. Como
+    en S3, la autorización la da la política firmada, no la sesión.
+    """
+    if not usa_s3_local():
+        return HttpResponse(status=404)
+    if request.method != 'POST':
+        return HttpResponse(status=405)
+    clave = request.POST.get('key', '')
+    archivo = request.FILES.get('file')
+    cliente = obtener_cliente_s3()
+    try:
+        tamano_maximo = cliente.verificar_politica(request.POST.get('policy', ''), clave)
+    except (signing.BadSignature, KeyError, TypeError):
+        return HttpResponse("Política no válida o expirada.", status=403)
+    if archivo is None or not archivo.size or (tamano_maximo and archivo.size > tamano_maximo):
+        return HttpResponse("Tamaño de archivo no permitido.", status=400)
+    cliente.upload_fileobj(archivo, settings.AWS_STORAGE_BUCKET_NAME, clave)
+    return HttpResponse(status=204)
 
 class CalendarioView(LoginRequiredMixin, TemplateView):
     """
@@ -570,42 +773,135 @@ class CalendarioView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['page_title'] = "Calendario de Actividades"
+        token = TokenCalendario.objects.filter(usuario=self.request.user).values_list('token', flat=True).first()
+        if token:
+            context['url_ics'] = self.request.build_absolute_uri(reverse('calendario-ics', kwargs={'token': token}))
         return context
 
+def _rango_calendario(request):
+    """
+    Lee los parámetros `start`/`end` que envía FullCalendar (ISO 8601, con o sin
+    hora). Sin ellos se usa la vista de un mes; el rango se acota a
+    CALENDARIO_RANGO_MAXIMO_DIAS para no devolver años de recordatorios.
+    """
+    def leer(parametro):
+        valor = (request.GET.get(parametro) or '').strip().replace(' ', '+')
+        fecha = parse_datetime(valor)
+        if fecha is None:
+            dia = parse_date(valor[:10]) if valor else None
+            fecha = datetime.combine(dia, time.min) if dia else None
+        if fecha is not None and timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        return fecha
+
+    inicio, fin = leer('start'), leer('end')
+    if inicio is None:
+        inicio = (fin or timezone.now()) - timedelta(days=42)
+    if fin is None or fin <= inicio:
+        fin = inicio + timedelta(days=42)
+    return inicio, min(fin, inicio + timedelta(days=settings.CALENDARIO_RANGO_MAXIMO_DIAS))
+
 @login_required
 def calendario_eventos(request):
     """
-    Proporciona los eventos (recordatorios) en formato JSON para FullCalendar.
+    Proporciona los eventos (recordatorios) en formato JSON para FullCalendar,
+    solo los del rango visible y en una sola consulta. Responde 304 si el
+    calendario del usuario no cambió desde la versión que tiene el cliente.
     """
     user = request.user
-    
-    # Filtrar recordatorios basados en el usuario (superuser ve todo)
-    if user.is_superuser:
-        recordatorios = Recordatorio.objects.all()
-    else:
-        recordatorios = Recordatorio.objects.filter(prospecto__asignado_a=user)
-        
-    eventos = []
-    for recordatorio in recordatorios:
-        # Asignar un color basado en el estado del recordatorio
-        color = '#2ecc71' if recordatorio.completado else '#e74c3c' # Verde si está completado, rojo si no
-
-        eventos.append({
-            'title': f"{recordatorio.titulo} ({recordatorio.prospecto.nombre_completo})",
-            'start': recordatorio.fecha_recordatorio.isoformat(),
-            'end': recordatorio.fecha_recordatorio.isoformat(),
-            'url': reverse('prospecto-detail', kwargs={'pk': recordatorio.prospecto.pk}),
-            'backgroundColor': color,
-            'borderColor': color,
-            'extendedProps': {
-                'description': f"Prospecto: {recordatorio.prospecto.nombre_completo}",
-                'status': 'Completado' if recordatorio.completado else 'Pendiente'
-            }
-        })
-        
-    return JsonResponse(eventos, safe=False)
+    inicio, fin = _rango_calendario(request)
 
-class ClienteCerradoListView(LoginRequiredMixin, ListView):
+    def generar():
+        # Filtrar recordatorios basados en el usuario (superuser ve todo)
+        recordatorios = Recordatorio.objects.filter(fecha_recordatorio__gte=inicio, fecha_recordatorio__lt=fin)
+        if not user.is_superuser:
+            recordatorios = recordatorios.filter(prospecto__asignado_a=user)
+        filas = recordatorios.order_by().values_list(
+            'titulo', 'fecha_recordatorio', 'completado', 'prospecto_id', 'prospecto__nombre_completo'
+        )
+
+        # reverse() se resuelve una sola vez; cada URL se arma con el prefijo.
+        prefijo_url, sufijo_url = reverse('prospecto-detail', kwargs={'pk': 999999999}).split('999999999')
+
+        eventos = []
+        for titulo, fecha, completado, prospecto_id, nombre_prospecto in filas:
+            # Asignar un color basado en el estado del recordatorio
+            color = '#2ecc71' if completado else '#e74c3c' # Verde si está completado, rojo si no
+            fecha_iso = fecha.isoformat()
+
+            eventos.append({
+                'title': f"{titulo} ({nombre_prospecto})",
+                'start': fecha_iso,
+                'end': fecha_iso,
+                'url': f"{prefijo_url}{prospecto_id}{sufijo_url}",
+                'backgroundColor': color,
+                'borderColor': color,
+                'extendedProps': {
+                    'description': f"Prospecto: {nombre_prospecto}",
+                    'status': 'Completado' if completado else 'Pendiente'
+                }
+            })
+        return eventos
+
+    return respuesta_json_versionada(
+        request,
+        VersionDatos.Ambito.CALENDARIO,
+        0 if user.is_superuser else user.pk,
+        generar,
+        variante=f"{inicio.isoformat()}|{fin.isoformat()}",
+    )
+
+@login_required
+def regenerar_token_calendario(request):
+    """
+    Crea (o reemplaza) el token de suscripción al calendario del usuario. La
+    URL anterior deja de funcionar.
+    """
+    if request.method == 'POST':
+        TokenCalendario.regenerar(request.user)
+        messages.success(request, "Se generó un nuevo enlace de suscripción al calendario.")
+    return redirect('calendario')
+
+def calendario_ics(request, token):
+    """
+    Feed iCalendar para suscribirse desde Google Calendar, Outlook, etc. Se
+    autentica con el token de la URL (los clientes de calendario no envían la
+    sesión). Solo cubre una ventana acotada alrededor de hoy y se envía en
+    streaming; responde 304 si el calendario no cambió.
+    """
+    token_calendario = (
+        TokenCalendario.objects.select_related('usuario')
+        .filter(token=token, usuario__is_active=True).first()
+    )
+    if token_calendario is None:
+        raise Http404
+    usuario = token_calendario.usuario
+
+    hoy = timezone.localdate()
+    inicio = hoy - timedelta(days=settings.ICS_DIAS_ATRAS)
+    fin = hoy + timedelta(days=settings.ICS_DIAS_ADELANTE)
+    prefijo_prospecto = request.build_absolute_uri(reverse('prospecto-detail', kwargs={'pk': 999999999}))
+    prefijo_proyecto = request.build_absolute_uri(reverse('proyecto-detail', kwargs={'pk': 999999999}))
+
+    def construir(version):
+        contenido = generar_ics(
+            usuario, inicio, fin,
+            lambda pk: prefijo_prospecto.replace('999999999', str(pk)),
+            lambda pk: prefijo_proyecto.replace('999999999', str(pk)),
+        )
+        response = StreamingHttpResponse(contenido, content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="calendario.ics"'
+        return _adaptar_streaming(request, response)
+
+    return respuesta_versionada(
+        request,
+        VersionDatos.Ambito.CALENDARIO,
+        0 if usuario.is_superuser else usuario.pk,
+        construir,
+        variante=f"ics|{inicio.isoformat()}",
+    )
+
+class ClienteCerradoListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     """
     Vista para listar únicamente los prospectos que han sido marcados como 'GANADO'.
     """
@@ -613,6 +909,7 @@ class ClienteCerradoListView(LoginRequiredMixin, ListView):
     template_name = 'ventas/cliente_cerrado_list.html' # Usamos una nueva plantilla
     context_object_name = 'clientes'
     paginate_by = 10
+    cursor_ordering = ('-fecha_actualizacion', '-id')
 
     def get_queryset(self):
         # Filtramos para obtener solo prospectos con estado 'GANADO'
@@ -625,13 +922,14 @@ class ClienteCerradoListView(LoginRequiredMixin, ListView):
         # Mantenemos la funcionalidad de búsqueda
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(nombre_completo__icontains=query) |
-                Q(email__icontains=query) |
-                Q(empresa__icontains=query)
-            )
+            queryset = buscar_prospectos(queryset, query)
         
-        return queryset.order_by('-fecha_actualizacion')
+        return queryset
+
+    def get_cursor_ordering(self):
+        if self.request.GET.get('q'):
+            return ('-rango', '-id')
+        return self.cursor_ordering
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -779,30 +1077,82 @@ class ProyectoFlujoTrabajoView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        proyecto = self.get_object()
-        boards = []
-        columnas = proyecto.kanban_columnas.prefetch_related('tareas').all()
-        
-        for columna in columnas:
-            items = []
-            for tarea in columna.tareas.all():
-                items.append({
-                    'id': str(tarea.id),
-                    'title': tarea.titulo,
-                    'description': tarea.descripcion,
-                })
-            
-            boards.append({
-                'id': str(columna.id),
-                'title': columna.titulo,
-                'icon': columna.icono,  # <-- ✅ Pasamos el ícono al frontend
-                'item': items
-            })
-        
-        context['kanban_data_json'] = json.dumps(boards)
+        # El tablero serializado se cachea por versión; solo se regenera tras
+        # un cambio. La versión del registro acompaña al tablero para que el
+        # cliente pida luego solo los cambios posteriores (cambios_tablero_api).
+        context['version_tablero'], context['kanban_data_json'] = tablero_serializado(self.object.pk)
+        context['eventos_sse'] = settings.EVENTOS_SSE_HABILITADO
+        context['sondeo_tablero_ms'] = settings.EVENTOS_SONDEO_MS
         return context
 
 
+@login_required
+def tablero_datos_api(request, proyecto_pk):
+    """Datos del tablero Kanban en JSON, con ETag para los clientes que sondean."""
+    proyecto = get_object_or_404(Proyecto, pk=proyecto_pk)
+    return respuesta_versionada(
+        request, VersionDatos.Ambito.TABLERO, proyecto.pk,
+        lambda version: HttpResponse(tablero_serializado(proyecto.pk)[1], content_type='application/json'),
+    )
+
+
+@login_required
+def cambios_tablero_api(request, proyecto_pk):
+    """
+    Cambios del tablero posteriores a la versión `?desde=N` (ver
+    cambios_desde en ventas/kanban.py). Si el registro ya se compactó por
+    debajo de N, la respuesta incluye además la instantánea completa.
+    """
+    if _proyecto_editable(request, proyecto_pk) is None:
+        return JsonResponse({'status': 'error', 'message': 'No tienes permiso para ver este tablero.'}, status=403)
+    try:
+        desde = int(request.GET.get('desde', ''))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': "Parámetro 'desde' inválido."}, status=400)
+    return JsonResponse(cambios_desde(int(proyecto_pk), desde))
+
+
+def _origen_tablero(request):
+    """Identificador de la pestaña que hace el cambio (ver registrar_cambio)."""
+    return request.headers.get('X-Cliente-Tablero', '')[:64]
+
+
+@login_required
+async def eventos_tablero(request, proyecto_pk):
+    """
+    Server-Sent Events con los deltas del tablero de un proyecto. Requiere
+    servir la aplicación por ASGI (mi_crm/asgi.py): cada conexión abierta es
+    solo una cola en el event loop, no un hilo ni un worker ocupado. Bajo WSGI
+    Django consumiría el flujo infinito ocupando un worker por pestaña, así
+    que sin EVENTOS_SSE_HABILITADO o fuera de ASGI se responde 503 (el
+    EventSource no reintenta) y el tablero consulta los cambios periódicamente.
+    """
+    if not settings.EVENTOS_SSE_HABILITADO or not isinstance(request, ASGIRequest):
+        return HttpResponse('Eventos en tiempo real no disponibles.', status=503, content_type='text/plain')
+    proyecto = await Proyecto.objects.select_related('prospecto').filter(pk=proyecto_pk).afirst()
+    if proyecto is None:
+        raise Http404
+    if not _puede_editar_prospecto(await request.auser(), proyecto.prospecto):
+        return HttpResponseForbidden("No tienes permiso para ver este tablero.")
+
+    async def flujo():
+        suscripcion = obtener_backend().suscribir(canal_tablero(proyecto_pk))
+        try:
+            yield f"retry: {settings.EVENTOS_REINTENTO_MS}\n\n"
+            while True:
+                mensaje = await suscripcion.siguiente(settings.EVENTOS_KEEPALIVE)
+                # Sin eventos se envía un comentario para que proxies y
+                # balanceadores no cierren la conexión por inactividad.
+                yield f"data: {mensaje}\n\n" if mensaje is not None else ": ping\n\n"
+        finally:
+            suscripcion.cerrar()
+
+    response = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evita que nginx acumule el flujo.
+    return response
+
+
 @login_required
 def mover_tarea_api(request):
     if request.method == 'POST':
@@ -814,11 +1164,23 @@ def mover_tarea_api(request):
             tarea = KanbanTarea.objects.get(pk=tarea_id)
             nueva_columna = KanbanColumna.objects.get(pk=nueva_columna_id)
             
-            tarea.columna = nueva_columna
-            # Aquí podrías añadir lógica para reordenar las tareas
-            tarea.save()
+            # La posición se indica con las tareas vecinas en la columna de
+            # destino; sin ellas la tarea va al final. Solo se escribe esta fila.
+            with transaction.atomic():
+                tarea.columna = nueva_columna
+                tarea.rango = rango_tarea(
+                    nueva_columna.pk,
+                    anterior_id=data.get('anterior_id'),
+                    siguiente_id=data.get('siguiente_id'),
+                    excluir_id=tarea.pk,
+                )
+                tarea.save(update_fields=['columna', 'rango'])
+                registrar_cambio(nueva_columna.proyecto_id, [{
+                    'accion': 'tarea_movida',
+                    'tarea': {'id': str(tarea.pk), 'columna_id': str(nueva_columna.pk), 'rango': tarea.rango},
+                }], _origen_tablero(request))
             
-            return JsonResponse({'status': 'success'})
+            return JsonResponse({'status': 'success', 'rango': tarea.rango})
         except (KanbanTarea.DoesNotExist, KanbanColumna.DoesNotExist):
             return JsonResponse({'status': 'error', 'message': 'Tarea o columna no encontrada'}, status=404)
             
@@ -833,16 +1195,18 @@ def crear_columna_api(request, proyecto_pk):
         proyecto = get_object_or_404(Proyecto, pk=proyecto_pk)
         
         if titulo:
-            ultima_columna = proyecto.kanban_columnas.order_by('-orden').first()
-            nuevo_orden = (ultima_columna.orden + 1) if ultima_columna else 0
-            
-            columna = KanbanColumna.objects.create(
-                proyecto=proyecto, 
-                titulo=titulo, 
-                icono=icono,  # <-- ✅ Guardamos el ícono
-                orden=nuevo_orden
-            )
-            return JsonResponse({'status': 'success', 'id': str(columna.id), 'titulo': columna.titulo, 'icono': columna.icono})
+            with transaction.atomic():
+                columna = KanbanColumna.objects.create(
+                    proyecto=proyecto, 
+                    titulo=titulo, 
+                    icono=icono,  # <-- ✅ Guardamos el ícono
+                    rango=rango_columna(proyecto.pk)
+                )
+                registrar_cambio(proyecto.pk, [{
+                    'accion': 'columna_creada',
+                    'columna': {'id': str(columna.pk), 'titulo': columna.titulo, 'icono': columna.icono, 'rango': columna.rango},
+                }], _origen_tablero(request))
+            return JsonResponse({'status': 'success', 'id': str(columna.id), 'titulo': columna.titulo, 'icono': columna.icono, 'rango': columna.rango})
     return JsonResponse({'status': 'error'}, status=400)
 
 
@@ -861,7 +1225,12 @@ def actualizar_columna_api(request, columna_pk):
         if nuevo_icono is not None: # Si se envió el campo 'icono' (incluso si está vacío)
             columna.icono = nuevo_icono
 
-        columna.save()
+        with transaction.atomic():
+            columna.save()
+            registrar_cambio(columna.proyecto_id, [{
+                'accion': 'columna_actualizada',
+                'columna': {'id': str(columna.pk), 'titulo': columna.titulo, 'icono': columna.icono},
+            }], _origen_tablero(request))
         return JsonResponse({'status': 'success', 'nuevo_titulo': columna.titulo, 'nuevo_icono': columna.icono})
     return JsonResponse({'status': 'error', 'message': 'Petición inválida'}, status=400)
 # --- NUEVA VISTA API ---
@@ -870,7 +1239,10 @@ def eliminar_columna_api(request, columna_pk):
     """API para eliminar una columna y todas sus tareas."""
     columna = get_object_or_404(KanbanColumna, pk=columna_pk)
     if request.method == 'POST':
-        columna.delete() # Gracias a on_delete=CASCADE, las tareas se borrarán también
+        proyecto_id, columna_id = columna.proyecto_id, columna.pk
+        with transaction.atomic():
+            columna.delete() # Gracias a on_delete=CASCADE, las tareas se borrarán también
+            registrar_cambio(proyecto_id, [{'accion': 'columna_eliminada', 'id': str(columna_id)}], _origen_tablero(request))
         return JsonResponse({'status': 'success'})
     return JsonResponse({'status': 'error', 'message': 'Petición inválida'}, status=400)
 
@@ -883,24 +1255,34 @@ def crear_tarea_api(request, columna_pk):
         columna = get_object_or_404(KanbanColumna, pk=columna_pk)
         
         if titulo:
-            ultima_tarea = columna.tareas.order_by('-orden').first()
-            nuevo_orden = (ultima_tarea.orden + 1) if ultima_tarea else 0
-
-            tarea = KanbanTarea.objects.create(columna=columna, titulo=titulo, orden=nuevo_orden)
-            return JsonResponse({'status': 'success', 'id': str(tarea.id), 'titulo': tarea.titulo})
+            with transaction.atomic():
+                tarea = KanbanTarea.objects.create(columna=columna, titulo=titulo, rango=rango_tarea(columna.pk))
+                registrar_cambio(columna.proyecto_id, [{
+                    'accion': 'tarea_creada',
+                    'tarea': {
+                        'id': str(tarea.pk), 'columna_id': str(columna.pk), 'titulo': tarea.titulo,
+                        'descripcion': tarea.descripcion, 'rango': tarea.rango,
+                    },
+                }], _origen_tablero(request))
+            return JsonResponse({'status': 'success', 'id': str(tarea.id), 'titulo': tarea.titulo, 'rango': tarea.rango})
     return JsonResponse({'status': 'error', 'message': 'Título no proporcionado'}, status=400)
 
 # --- NUEVA VISTA API ---
 @login_required
 def actualizar_tarea_api(request, tarea_pk):
     """API para actualizar los detalles de una tarea."""
-    tarea = get_object_or_404(KanbanTarea, pk=tarea_pk)
+    tarea = get_object_or_404(KanbanTarea.objects.select_related('columna'), pk=tarea_pk)
     if request.method == 'POST':
         data = json.loads(request.body)
         # Usamos el form para validar y limpiar los datos
         form = KanbanTareaForm(data, instance=tarea)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+                registrar_cambio(tarea.columna.proyecto_id, [{
+                    'accion': 'tarea_actualizada',
+                    'tarea': {'id': str(tarea.pk), 'titulo': tarea.titulo, 'descripcion': tarea.descripcion},
+                }], _origen_tablero(request))
             # Devolvemos los datos actualizados para reflejarlos en el frontend
             return JsonResponse({
                 'status': 'success',
@@ -915,9 +1297,12 @@ def actualizar_tarea_api(request, tarea_pk):
 @login_required
 def eliminar_tarea_api(request, tarea_pk):
     """API para eliminar una tarea."""
-    tarea = get_object_or_404(KanbanTarea, pk=tarea_pk)
+    tarea = get_object_or_404(KanbanTarea.objects.select_related('columna'), pk=tarea_pk)
     if request.method == 'POST':
-        tarea.delete()
+        tarea_id = tarea.pk
+        with transaction.atomic():
+            tarea.delete()
+            registrar_cambio(tarea.columna.proyecto_id, [{'accion': 'tarea_eliminada', 'id': str(tarea_id)}], _origen_tablero(request))
         return JsonResponse({'status': 'success'})
     return JsonResponse({'status': 'error', 'message': 'Petición inválida'}, status=400)
 
@@ -1101,13 +1486,18 @@ class DiagramaEditorView(LoginRequiredMixin, TemplateView):
 # ✅ NUEVA VISTA API: Para devolver los datos JSON de un diagrama
 @login_required
 def get_diagrama_api(request, diagrama_pk):
-    diagrama = get_object_or_404(DiagramaProyecto, pk=diagrama_pk)
-    return JsonResponse({
-        'id': diagrama.id,
-        'titulo': diagrama.titulo,
-        # Aquí se decodifica el string de la BD a un objeto JSON para el cliente
-        'codigo': json.loads(diagrama.codigo) 
-    })
+    def generar():
+        diagrama = get_object_or_404(DiagramaProyecto.objects.defer('svg_representation'), pk=diagrama_pk)
+        return {
+            'id': diagrama.id,
+            'titulo': diagrama.titulo,
+            # Aquí se decodifica el string de la BD a un objeto JSON para el cliente
+            'codigo': json.loads(diagrama.codigo),
+            # Base para los guardados por parche (parche_diagrama_api).
+            'revision': diagrama.revision,
+            'svg_desactualizado': diagrama.svg_desactualizado,
+        }
+    return respuesta_json_versionada(request, VersionDatos.Ambito.DIAGRAMA, diagrama_pk, generar)
 
 # ✏️ VISTA MODIFICADA: Para guardar el JSON y el SVG del diagrama
 @login_required
@@ -1135,18 +1525,41 @@ def guardar_diagrama_api(request, proyecto_pk):
 
             # 4. Usamos update_or_create para manejar creación y actualización.
             #    Guardamos 'codigo_json_string' directamente en el TextField del modelo.
-            diagrama, created = DiagramaProyecto.objects.update_or_create(
-                id=diagrama_id,
-                defaults={
-                    'proyecto': proyecto, 
-                    'titulo': titulo, 
-                    'codigo': codigo_json_string,
-                    'svg_representation': svg_code
-                }
-            )
+            #    Si el cliente indica su revisión base, no se pisa un guardado más nuevo.
+            base_revision = data.get('base_revision')
+            if base_revision is not None:
+                try:
+                    base_revision = int(base_revision)
+                except (TypeError, ValueError):
+                    return JsonResponse({'status': 'error', 'message': "'base_revision' inválida."}, status=400)
+            with transaction.atomic():
+                if diagrama_id and base_revision is not None:
+                    actual = DiagramaProyecto.objects.select_for_update().filter(pk=diagrama_id).values_list('revision', flat=True).first()
+                    if actual is not None and actual != base_revision:
+                        return JsonResponse({'status': 'conflicto', 'revision': actual}, status=409)
+                diagrama, created = DiagramaProyecto.objects.update_or_create(
+                    id=diagrama_id,
+                    defaults={
+                        'proyecto': proyecto, 
+                        'titulo': titulo, 
+                        'codigo': codigo_json_string,
+                        'svg_representation': svg_code,
+                        'revision': F('revision') + 1,
+                        'svg_revision': F('revision') + 1,
+                    },
+                    create_defaults={
+                        'proyecto': proyecto,
+                        'titulo': titulo,
+                        'codigo': codigo_json_string,
+                        'svg_representation': svg_code,
+                        'revision': 1,
+                        'svg_revision': 1,
+                    },
+                )
+                diagrama.refresh_from_db(fields=['revision'])
             
             # 5. Devolvemos una respuesta exitosa con el ID del diagrama.
-            return JsonResponse({'status': 'success', 'diagrama_id': diagrama.id})
+            return JsonResponse({'status': 'success', 'diagrama_id': diagrama.id, 'revision': diagrama.revision})
 
         except json.JSONDecodeError:
             return JsonResponse({'status': 'error', 'message': 'JSON inválido en el request.'}, status=400)
@@ -1155,6 +1568,60 @@ def guardar_diagrama_api(request, proyecto_pk):
 
     return JsonResponse({'status': 'error', 'message': 'Método no permitido.'}, status=405)
 
+@login_required
+def parche_diagrama_api(request, diagrama_pk):
+    """
+    Guardado incremental del editor. Recibe
+    {"base_revision": N, "parche": [operaciones JSON Patch], "titulo": ..., "svg": ...}
+    y aplica el parche (RFC 6902, ver ventas/parche_json.py) al código guardado.
+    Si el diagrama ya no está en la revisión N responde 409 con la actual, y el
+    cliente debe recargarlo. "titulo" y "svg" son opcionales: el SVG se puede
+    subir más tarde con un parche vacío y así no viaja en cada autoguardado.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido.'}, status=405)
+    try:
+        data = json.loads(request.body)
+        base_revision = int(data['base_revision'])
+        parche = data.get('parche', [])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': "Se esperaba JSON con 'base_revision' y 'parche'."}, status=400)
+
+    diagrama = get_object_or_404(DiagramaProyecto.objects.only('codigo', 'revision', 'svg_revision'), pk=diagrama_pk)
+    if diagrama.revision != base_revision:
+        return JsonResponse({'status': 'conflicto', 'revision': diagrama.revision}, status=409)
+
+    cambios = {}
+    revision = base_revision
+    if parche:
+        try:
+            codigo = aplicar_parche(json.loads(diagrama.codigo or '{}'), parche)
+        except ErrorParche as e:
+            return JsonResponse({'status': 'error', 'indice': e.indice, 'message': str(e)}, status=400)
+        revision = base_revision + 1
+        cambios.update(codigo=json.dumps(codigo, ensure_ascii=False, separators=(',', ':')), revision=revision)
+    if data.get('titulo'):
+        cambios['titulo'] = data['titulo']
+    if 'svg' in data:
+        # El SVG que llega corresponde al diagrama ya con el parche aplicado.
+        cambios.update(svg_representation=data['svg'] or '', svg_revision=revision)
+    if not cambios:
+        return JsonResponse({'status': 'success', 'revision': revision, 'svg_desactualizado': diagrama.svg_desactualizado})
+
+    # Bloqueo optimista: el UPDATE solo se aplica si nadie guardó desde que se
+    # leyó el diagrama; .update() no dispara señales, por eso se sube a mano
+    # la versión que usan la caché y el ETag de get_diagrama_api.
+    with transaction.atomic():
+        actualizados = DiagramaProyecto.objects.filter(pk=diagrama_pk, revision=base_revision).update(
+            fecha_actualizacion=timezone.now(), **cambios
+        )
+        if not actualizados:
+            actual = DiagramaProyecto.objects.filter(pk=diagrama_pk).values_list('revision', flat=True).first()
+            return JsonResponse({'status': 'conflicto', 'revision': actual}, status=409)
+        VersionDatos.incrementar(VersionDatos.Ambito.DIAGRAMA, diagrama_pk)
+    svg_revision = cambios.get('svg_revision', diagrama.svg_revision)
+    return JsonResponse({'status': 'success', 'revision': revision, 'svg_desactualizado': svg_revision < revision})
+
 @login_required
 def descargar_diagrama_pdf(request, diagrama_pk):
     """Genera un PDF a partir del SVG guardado de un diagrama."""
@@ -1176,20 +1643,83 @@ def descargar_diagrama_pdf(request, diagrama_pk):
     
     return response
 
-from django.db import transaction
+def _proyecto_editable(request, proyecto_pk):
+    """Devuelve el proyecto si el usuario puede editarlo, o None."""
+    proyecto = get_object_or_404(Proyecto.objects.select_related('prospecto'), pk=proyecto_pk)
+    return proyecto if _puede_editar_prospecto(request.user, proyecto.prospecto) else None
 
+@login_required
 def reordenar_columnas_api(request, proyecto_pk):
+    """
+    Guarda el orden de las columnas. Recibe {"orden_columnas": [ids]} con
+    todas las columnas del proyecto; se escribe en una sola sentencia.
+    """
     if request.method == 'POST':
+        if _proyecto_editable(request, proyecto_pk) is None:
+            return JsonResponse({'status': 'error', 'message': 'No tienes permiso para editar este tablero.'}, status=403)
         try:
             # Obtenemos la lista de IDs de las columnas en el nuevo orden
             ordered_ids = json.loads(request.body).get('orden_columnas', [])
-            
             with transaction.atomic():
-                for index, columna_id in enumerate(ordered_ids):
-                    KanbanColumna.objects.filter(id=columna_id, proyecto_id=proyecto_pk).update(orden=index)
-            
-            return JsonResponse({'status': 'success', 'message': 'Orden de columnas actualizado.'})
-        except Exception as e:
+                columnas = reordenar_columnas(proyecto_pk, ordered_ids)
+                registrar_cambio(proyecto_pk, [{
+                    'accion': 'columnas_reordenadas',
+                    'columnas': [{'id': str(c.pk), 'rango': c.rango} for c in columnas],
+                }], _origen_tablero(request))
+            return JsonResponse({
+                'status': 'success', 'message': 'Orden de columnas actualizado.',
+                'rangos': {str(c.pk): c.rango for c in columnas},
+            })
+        except (ValueError, AttributeError) as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
             
-    return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
\ No newline at end of file
+    return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+@login_required
+def reordenar_tareas_api(request, proyecto_pk):
+    """
+    Reordena tareas dentro de columnas y entre ellas en una sola petición.
+    Recibe {"columnas": {"<columna_id>": [tarea_ids en orden], ...}} con el
+    contenido completo de cada columna afectada (origen y destino).
+    """
+    if request.method == 'POST':
+        if _proyecto_editable(request, proyecto_pk) is None:
+            return JsonResponse({'status': 'error', 'message': 'No tienes permiso para editar este tablero.'}, status=403)
+        try:
+            columnas = json.loads(request.body).get('columnas')
+            with transaction.atomic():
+                tareas = reordenar_tareas(proyecto_pk, columnas)
+                registrar_cambio(proyecto_pk, [{
+                    'accion': 'tareas_reordenadas',
+                    'tareas': [{'id': str(t.pk), 'columna_id': str(t.columna_id), 'rango': t.rango} for t in tareas],
+                }], _origen_tablero(request))
+            return JsonResponse({'status': 'success', 'tareas': len(tareas)})
+        except (ValueError, AttributeError) as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+@login_required
+def lote_tablero_api(request, proyecto_pk):
+    """
+    Aplica una lista ordenada de operaciones del tablero en una sola
+    transacción (ver LoteTablero en ventas/kanban.py). Recibe
+    {"operaciones": [{"op": "mover_tarea", "id": ..., "columna_id": ...}, ...]}
+    y devuelve la versión resultante del tablero y un delta por operación.
+    Si una operación falla no se aplica ninguna y se indica su índice.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    if _proyecto_editable(request, proyecto_pk) is None:
+        return JsonResponse({'status': 'error', 'message': 'No tienes permiso para editar este tablero.'}, status=403)
+    try:
+        operaciones = json.loads(request.body).get('operaciones')
+    except (ValueError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'JSON inválido.'}, status=400)
+    try:
+        with transaction.atomic():
+            deltas = LoteTablero(proyecto_pk).aplicar(operaciones)
+            version = registrar_cambio(proyecto_pk, deltas, _origen_tablero(request))
+    except ErrorLote as e:
+        return JsonResponse({'status': 'error', 'indice': e.indice, 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'version': version, 'deltas': deltas})
\ No newline at end of file